@@ -0,0 +1,235 @@
+"""
+A module that manages the connection to the AI service for the whole process.
+
+Configuring google.generativeai and building a GenerativeModel for every
+query repeats the same setup each time and throws away the client, and with
+it the open connection, that the previous query used.  AI_CLIENT, the shared
+AIClientManager, hands every query to a backend that does this setup once:
+
+    - GeminiBackend: Configures google.generativeai once per api key and
+      keeps one GenerativeModel per model name and generation parameters,
+      so every query reuses the same client and its connections
+    - StubBackend: Answers every query locally, after an optional delay,
+      without an api key or network access.  Used by tests and benchmarks
+
+Each backend can answer a query all at once, with generate(), or stream it
+in chunks as it is generated, with stream().
+
+The backend is chosen with the AI_BACKEND environment variable ("gemini",
+the default, or "stub"), or replaced with AI_CLIENT.set_backend().  Both
+backends can be used by several threads at the same time.
+"""
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import google.generativeai as genai
+
+AI_MODEL_NAME = "gemini-1.5-flash"
+STUB_RESPONSE = "# Stub Response\n\nThis document was generated by the stub AI backend."
+STUB_CHUNK_SIZE = 40  # Characters in each chunk streamed by the stub backend
+
+
+class GeminiBackend:
+    """
+    Sends queries to Google Gemini AI, configuring the client once and
+    reusing its models.
+
+    Key Methods:
+        - get_model(api_key, model_name, generation_parameters): The cached model
+        - generate(api_key, prompt, ...): Sends a query, returns the response
+        - stream(api_key, prompt, ...): Sends a query, yields the response text
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.api_key = None
+        self.models = {}
+
+    def get_model(self, api_key: str, model_name: str, generation_parameters: dict = None):
+        """
+        Returns the model for a model name and generation parameters, building
+        it the first time.  The client is configured again, and the cached
+        models dropped, only if the api key changes.
+
+        :param api_key:
+        :param model_name: i.e. "gemini-1.5-flash"
+        :param generation_parameters: i.e. {"temperature": 0.7}
+        :return: A GenerativeModel
+        """
+        model_key = (model_name, json.dumps(generation_parameters or {}, sort_keys=True))
+        with self.lock:
+            if api_key != self.api_key:
+                genai.configure(api_key=api_key)
+                self.api_key = api_key
+                self.models = {}
+            if model_key not in self.models:
+                self.models[model_key] = genai.GenerativeModel(
+                    model_name, generation_config=generation_parameters or {})
+            return self.models[model_key]
+
+    def generate(self, api_key: str, prompt: str, model_name: str = AI_MODEL_NAME,
+                 generation_parameters: dict = None, timeout: float = None):
+        """
+        Sends a query to Google Gemini AI
+
+        :param api_key:
+        :param prompt: The query
+        :param model_name:
+        :param generation_parameters:
+        :param timeout: Seconds to wait for the response, None for the default
+        :return: The response, its text attribute holds the generated content
+        """
+        model = self.get_model(api_key, model_name, generation_parameters)
+        request_options = {} if timeout is None else {"timeout": timeout}
+        return model.generate_content(prompt, request_options=request_options)
+
+    def stream(self, api_key: str, prompt: str, model_name: str = AI_MODEL_NAME,
+               generation_parameters: dict = None, timeout: float = None):
+        """
+        Sends a query to Google Gemini AI and yields the response as it is
+        generated
+
+        :param api_key:
+        :param prompt: The query
+        :param model_name:
+        :param generation_parameters:
+        :param timeout: Seconds to wait for the response, None for the default
+        :return: A generator of the response text, one chunk at a time
+        """
+        model = self.get_model(api_key, model_name, generation_parameters)
+        request_options = {} if timeout is None else {"timeout": timeout}
+        for chunk in model.generate_content(prompt, stream=True, request_options=request_options):
+            yield chunk.text
+
+
+# A response of the stub backend, holding its text like a real response
+StubResponse = namedtuple("StubResponse", ["text"])
+
+
+class StubBackend:
+    """
+    Answers queries locally with a fixed response.
+
+    Key Attributes:
+        - response_text: The text of every response, or a function that
+            returns the text for a prompt
+        - delay: Seconds each query takes, to simulate the AI service
+        - chunk_size / chunk_delay: The characters in each streamed chunk, and
+            the seconds between two chunks
+        - prompts: Every prompt received, in order
+    """
+
+    def __init__(self, response_text=STUB_RESPONSE, delay: float = 0.0,
+                 chunk_size: int = STUB_CHUNK_SIZE, chunk_delay: float = 0.0):
+        self.response_text = response_text
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def generate(self, _api_key: str, prompt: str, _model_name: str = AI_MODEL_NAME,
+                 _generation_parameters: dict = None, _timeout: float = None):
+        """
+        Answers a query with the stub response.  The arguments other than
+        the prompt are ignored, they only match GeminiBackend.generate()
+
+        :param prompt: The query
+        :return: A StubResponse
+        """
+        with self.lock:
+            self.prompts.append(prompt)
+        if self.delay:
+            time.sleep(self.delay)
+        return StubResponse(self.get_text(prompt))
+
+    def stream(self, _api_key: str, prompt: str, _model_name: str = AI_MODEL_NAME,
+               _generation_parameters: dict = None, _timeout: float = None):
+        """
+        Answers a query with the stub response, chunk_size characters at a
+        time.  The arguments other than the prompt are ignored, they only
+        match GeminiBackend.stream()
+
+        :param prompt: The query
+        :return: A generator of the response text, one chunk at a time
+        """
+        with self.lock:
+            self.prompts.append(prompt)
+        if self.delay:
+            time.sleep(self.delay)
+        text = self.get_text(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            if start and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield text[start:start + self.chunk_size]
+
+    def get_text(self, prompt: str):
+        """
+        :param prompt: The query
+        :return: The text of the response to the query
+        """
+        if callable(self.response_text):
+            return self.response_text(prompt)
+        return self.response_text
+
+
+BACKENDS = {"gemini": GeminiBackend, "stub": StubBackend}
+
+
+class AIClientManager:
+    """
+    The process wide entry point for AI queries, forwarding them to a backend.
+
+    Key Methods:
+        - generate(api_key, prompt, ...): Sends a query to the backend
+        - stream(api_key, prompt, ...): Streams a query from the backend
+        - set_backend(backend): Replaces the backend, i.e. with a StubBackend
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or BACKENDS[os.environ.get("AI_BACKEND", "gemini")]()
+
+    def set_backend(self, backend):
+        """
+        Replaces the backend every query is sent to
+
+        :param backend: A GeminiBackend, StubBackend, or any object with the
+            same generate() method
+        :return: The backend that was replaced
+        """
+        previous_backend, self.backend = self.backend, backend
+        return previous_backend
+
+    def generate(self, api_key: str, prompt: str, model_name: str = AI_MODEL_NAME,
+                 generation_parameters: dict = None, timeout: float = None):
+        """
+        Sends a query to the backend
+
+        :param api_key:
+        :param prompt: The query
+        :param model_name:
+        :param generation_parameters:
+        :param timeout: Seconds to wait for the response, None for the default
+        :return: The response, its text attribute holds the generated content
+        """
+        return self.backend.generate(api_key, prompt, model_name, generation_parameters, timeout)
+
+    def stream(self, api_key: str, prompt: str, model_name: str = AI_MODEL_NAME,
+               generation_parameters: dict = None, timeout: float = None):
+        """
+        Sends a query to the backend and streams the response
+
+        :param api_key:
+        :param prompt: The query
+        :param model_name:
+        :param generation_parameters:
+        :param timeout: Seconds to wait for the response, None for the default
+        :return: A generator of the response text, one chunk at a time
+        """
+        return self.backend.stream(api_key, prompt, model_name, generation_parameters, timeout)
+
+
+AI_CLIENT = AIClientManager()
@@ -0,0 +1,176 @@
+"""
+A module for caching AI responses on disk, so a prompt that has already been
+answered is answered again instantly and without a second request.
+
+ResponseCache stores each response in an SQLite database, ai_response_cache.db,
+next to job_listings.db in the project root.  Responses are keyed by a
+sha256 hash of the model name, the prompt text and the generation parameters,
+so a response is only reused for exactly the same request.  Entries expire
+AI_CACHE_TTL seconds after they were stored, and once the cache holds more
+than AI_CACHE_MAX_ENTRIES responses the least recently used ones are evicted.
+
+Every call opens its own short lived connection to the cache database, so a
+single ResponseCache can be shared by every thread that queries the AI.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# ...\AJanedy_Comp490_002_Sprints\src\ai_resume_builder
+script_directory = os.path.dirname(os.path.abspath(__file__))
+# ...\AJanedy_Comp490_002_Sprints\ai_response_cache.db, next to job_listings.db
+AI_CACHE_PATH = os.path.abspath(os.path.join(script_directory, "../../ai_response_cache.db"))
+
+AI_CACHE_TTL = 7 * 24 * 60 * 60  # Seconds a response is reused for, one week
+AI_CACHE_MAX_ENTRIES = 1000  # Responses kept before the least recently used are evicted
+AI_CACHE_BUSY_TIMEOUT = 10  # Seconds to wait for another thread's write to finish
+
+
+# A response read from the cache.  Like the responses of the AI client it
+# holds the generated text in its text attribute.
+CachedResponse = namedtuple("CachedResponse", ["text"])
+
+
+class ResponseCache:
+    """
+    A persistent, size capped cache of AI responses with an expiry time.
+
+    Key Attributes:
+        - path: Path of the SQLite cache database
+        - ttl: Seconds a response is reused for
+        - max_entries: The number of responses kept
+        - hits / misses: Counters of lookups served and not served
+
+    Key Methods:
+        - make_key(model_name, prompt, parameters): Hashes a request
+        - get(key): Returns the cached response text, or None
+        - put(key, model_name, text): Stores a response, evicting old ones
+    """
+
+    def __init__(self, path: str = AI_CACHE_PATH, ttl: float = AI_CACHE_TTL,
+                 max_entries: int = AI_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.table_created = False
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, parameters: dict = None):
+        """
+        :param model_name: i.e. "gemini-1.5-flash"
+        :param prompt: The full prompt text
+        :param parameters: The generation parameters, i.e. {"temperature": 0.7}
+        :return: A hex sha256 digest identifying the request
+        """
+        request = json.dumps([model_name, prompt, parameters or {}], sort_keys=True)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def connect(self):
+        """
+        Opens a connection to the cache database, creating its table the
+        first time
+
+        :return connection:
+        """
+        connection = sqlite3.connect(self.path, timeout=AI_CACHE_BUSY_TIMEOUT)
+        if not self.table_created:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS ai_responses (
+                    cache_key TEXT PRIMARY KEY,
+                    model_name TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    last_used_at REAL
+                )
+            """)
+            connection.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ai_responses_last_used_at
+                ON ai_responses(last_used_at)
+            """)
+            connection.commit()
+            self.table_created = True
+        return connection
+
+    def get(self, key: str):
+        """
+        Looks up a response and marks it as recently used.  Expired responses
+        are deleted instead.
+
+        :param key: A key returned by make_key()
+        :return: The response text, or None if it is not cached
+        """
+        now = time.time()
+        try:
+            connection = self.connect()
+            try:
+                row = connection.execute(
+                    "SELECT response, created_at FROM ai_responses WHERE cache_key = ?",
+                    (key,)).fetchone()
+                if row is not None and row[1] + self.ttl < now:
+                    connection.execute("DELETE FROM ai_responses WHERE cache_key = ?", (key,))
+                    row = None
+                elif row is not None:
+                    connection.execute(
+                        "UPDATE ai_responses SET last_used_at = ? WHERE cache_key = ?",
+                        (now, key))
+                connection.commit()
+            finally:
+                connection.close()
+        except sqlite3.Error as error:
+            print(f"AI response cache error: {error}")
+            row = None
+
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model_name: str, text: str):
+        """
+        Stores a response, then evicts the least recently used responses
+        beyond max_entries
+
+        :param key: A key returned by make_key()
+        :param model_name:
+        :param text: The response text
+        """
+        now = time.time()
+        try:
+            connection = self.connect()
+            try:
+                connection.execute("""
+                    INSERT OR REPLACE INTO ai_responses (
+                        cache_key, model_name, response, created_at, last_used_at
+                    )
+                    VALUES (?, ?, ?, ?, ?)
+                """, (key, model_name, text, now, now))
+                connection.execute("""
+                    DELETE FROM ai_responses WHERE cache_key IN (
+                        SELECT cache_key FROM ai_responses
+                        ORDER BY last_used_at DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                """, (max(self.max_entries, 0),))
+                connection.commit()
+            finally:
+                connection.close()
+        except sqlite3.Error as error:
+            print(f"AI response cache error: {error}")
+
+    def stats(self):
+        """
+        :return: A one line summary of the cache counters
+        """
+        return f"AI response cache: {self.hits} hits, {self.misses} misses"
+
+
+AI_RESPONSE_CACHE = ResponseCache()
@@ -10,7 +10,7 @@ build a customized resume.
 This program requires an API key which is not included.
 """
 import os
-import google.generativeai as genai
+from src.ai_resume_builder.ai_client import AI_CLIENT
 
 files = {
     "API_KEY": "api_key.txt",
@@ -135,9 +135,8 @@ def generate_resume():
     # slightly to meet project requirements.  Original code can be found at
     # https://ai.google.dev/gemini-api/docs?_gl=1*nqyqa0*_ga*NzExNDg0MDc0LjE3Mzg0Mjg3Njk.*_ga_P1DBVKWT6V
     # *MTczODQyODc2OS4xLjEuMTczODQyOTAwNy42MC4wLjc3ODAwMjE5Mg..#python
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(query)  # Execute query, store response
+    # The client is configured once and its model reused, see ai_client.py
+    response = AI_CLIENT.generate(api_key, query)  # Execute query, store response
 
     new_resume_filename = get_next_resume_filename()  # Get next filename for new resume
     write_to_file(new_resume_filename, response.text)  # Store response to new file
@@ -4,6 +4,8 @@ A method for normalizing data in json files presented in different formats.
 process_json_object() will extract the dictionary from the object and pass it
 to the normalization process.  process_json_array will extract multiple json
 objects and pass them to the normalization process one by one.
+process_json_stream() does the same for an entire file, reading it incrementally
+so that arbitrarily large arrays never need to be held in memory at once.
 
 normalize_json_object will then send each object to different functions to
 normalize various aspects of the data.  At this time only the attribute
@@ -15,7 +17,8 @@ type of data, as well as the best effort normalization of location data.
 from pathlib import Path
 from typing import TextIO
 import json
-import re
+from src.job_search_database.json_stream import iter_json_objects
+from src.job_search_database.location_normalization import LOCATION_NORMALIZER
 
 
 def process_json_array(source_file: Path, line: str, output_file: TextIO):
@@ -74,6 +77,33 @@ def process_json_object(source_file: Path, line: str, output_file: TextIO):
         print(f"Error parsing line in {source_file}: {e}")
 
 
+def process_json_stream(source_file: Path, read_file: TextIO, output_file: TextIO):
+    """
+    A method for extracting individual json objects from an entire source file
+    without loading the file, or any single line of it, into memory.
+
+    process_json_stream() leverages iter_json_objects() to parse the open source
+    file incrementally, one json object at a time, whether the file holds one
+    object per line, one array per line, or a single (possibly pretty-printed)
+    array.  Each object is passed into the normalize_json_object() method and
+    written to the new, normalized file exactly as process_json_array() and
+    process_json_object() would write it.
+
+    :param source_file: A Path object that represents a source json file
+    :param read_file: A TextIO wrapper representing the open source json file
+    :param output_file: A TextIO wrapper representing the output file for the
+        normalized json data
+    :return:
+    """
+    try:
+        for json_object in iter_json_objects(read_file):
+            json_object = normalize_json_object(json_object)
+            output_file.write(json.dumps(json_object) + "\n")
+
+    except json.JSONDecodeError as e:
+        print(f"Error parsing {source_file}: {e}")
+
+
 def normalize_json_object(json_obj: dict):
     """
     A method for normalizing json objects with similar attributes
@@ -126,172 +156,12 @@ def normalize_location_data(json_obj: dict):
         A method for normalizing the location data for each
         job posting
 
+        The work is done by the shared LocationNormalizer, which looks states,
+        abbreviations and city fallbacks up in tables compiled once at import.
+
         :param json_obj: Dictionary/json object
         :return json_obj: Dictionary/json object
         """
-    state_abbreviations = {
-        "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR", "California": "CA",
-        "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE", "Florida": "FL", "Georgia": "GA",
-        "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL", "Indiana": "IN", "Iowa": "IA",
-        "Kansas": "KS", "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD",
-        "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS",
-        "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV", "New Hampshire": "NH",
-        "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY", "North Carolina": "NC",
-        "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK", "Oregon": "OR", "Pennsylvania": "PA",
-        "Rhode Island": "RI", "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN",
-        "Texas": "TX", "Utah": "UT", "Vermont": "VT", "Virginia": "VA", "Washington": "WA",
-        "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY"
-    }
-
-    # Remove numbers and dashes from the end of locations (zip codes)
-    json_obj["location"] = re.sub(r'[\s\d,.-]+$', '', json_obj["location"]).strip()
-
-    remove_usa(json_obj)
-
-    normalize_state_abbreviations(json_obj, state_abbreviations)
-    location = append_united_states(json_obj, state_abbreviations)
-    change_language_and_formatting_usa(json_obj, location)
-    json_obj["location"] = extract_city_state_country(json_obj["location"])
-    normalize_city_state_country(json_obj)
+    json_obj["location"] = LOCATION_NORMALIZER.normalize(json_obj["location"])
 
     return json_obj
-
-
-def normalize_city_state_country(json_obj):
-    """
-    A method to clean remaining location attributes that contained only
-    a city name and a few other outliers.
-
-    This methodology does not guarantee accurate locations.  Full location
-    information is given on "best guess" assumptions, meaning that a job
-    posted in "Boston" is assumed to be located in "Boston, MA, United
-    States", or that a job posted in WA DC is assumed to be located in
-    "Washington, DC, United States".
-
-    :param json_obj:
-    :return:
-    """
-    location = json_obj["location"]
-    if location.strip() in ["Boston", "Cambridge", "Somerville"]:
-        json_obj["location"] = f"{json_obj['location']}, MA, United States"
-    if location.strip() in ["San Francisco", "San Jose", "Sacramento"]:
-        json_obj["location"] = f"{json_obj['location']}, CA, United States"
-    if location.strip() in ["Pittsburgh"]:
-        json_obj["location"] = f"{json_obj['location']}, PA, United States"
-    if location.strip() in ["Atlanta"]:
-        json_obj["location"] = f"{json_obj['location']}, GA, United States"
-    if location.strip() in ["Chicago"]:
-        json_obj["location"] = f"{json_obj['location']}, IL, United States"
-    if location.strip() in ["Austin"]:
-        json_obj["location"] = f"{json_obj['location']}, TX, United States"
-    if location.strip() in ["New Orleans"]:
-        json_obj["location"] = f"{json_obj['location']}, LA, United States"
-    if location.strip() in ["Las Vegas"]:
-        json_obj["location"] = f"{json_obj['location']}, NV, United States"
-    if location.strip() == "WA DC":
-        json_obj["location"] = "Washington, DC, United States"
-    if location.strip() == "Dublin, Dublin":
-        json_obj["location"] = "Dublin, Ireland"
-    if location.strip() in ["Tokyo"]:
-        json_obj["location"] = f"{json_obj['location']}, Japan"
-    if all(word in location for word in ["Tokyo", "Japan"]):
-        json_obj["location"] = "Tokyo, Japan"
-    if location.strip() in ["Paris"]:
-        json_obj['location'] = f"{json_obj['location']}, France"
-    if location.strip() in ["Bengaluru"]:
-        json_obj['location'] = f"{json_obj['location']}, India"
-    if location.strip() in ["Madrid", "Barcelona"]:
-        json_obj["location"] = f"{json_obj['location']}, Spain"
-
-
-def remove_usa(json_obj):
-    """
-    Removes "USA" from the location string
-
-    :param json_obj:
-    """
-    if json_obj["location"].endswith(" USA"):
-        json_obj["location"] = json_obj["location"].strip(" USA")
-
-
-def change_language_and_formatting_usa(json_obj, location):
-    """
-    Translates non-English "United States" to English
-
-    :param json_obj:
-    :param location:
-    :return:
-    """
-    if "États-Unis" in location:
-        json_obj["location"] = json_obj["location"].replace("États-Unis", "United States")
-    if "Stati Uniti" in location:
-        json_obj["location"] = json_obj["location"].replace("Stati Uniti", "United States")
-    if "Vereinigte Staaten" in location:
-        json_obj["location"] = json_obj["location"].replace("Vereinigte Staaten", "United States")
-    if "United States of America" in location:
-        json_obj["location"] = json_obj["location"].replace("United States of America", "United States")
-
-
-def append_united_states(json_obj, state_abbreviations):
-    """
-    A method to add ", United States" to the end of a location that ends with a state
-    abbreviation, i.e. "Somerville, MA" will become "Somerville, MA, United States"
-
-    :param json_obj:
-    :param state_abbreviations:
-    """
-    location = json_obj["location"]
-
-    # Add ", United States" to a location where city and state are known
-    if any(location.strip().endswith(abbrev) for abbrev in state_abbreviations.values()):
-        json_obj["location"] = f"{json_obj['location']}, United States"
-
-    location = json_obj["location"]
-
-    # Add ", United States" to a location where only the state is known
-    if any((location.strip() == abbrev) for abbrev in state_abbreviations.values()):
-        json_obj["location"] = f"{json_obj['location']}, United States"
-    return location
-
-
-def normalize_state_abbreviations(json_obj, state_abbreviations):
-    """
-    A method to replace all states with their two letter abbreviations.
-    Conditionals are included to prevent New York city and Washington, DC
-    from being converted.
-
-    :param json_obj:
-    :param state_abbreviations:
-    """
-    location = json_obj["location"]
-    if "New York, New York" in location or "New York, NY" in location:
-        json_obj["location"] = "New York, NY, United States"
-    elif "Washington, DC" in location:
-        json_obj["location"] = "Washington, DC, United States"
-    else:
-        for state, abbreviation in state_abbreviations.items():
-            if state in location:
-                json_obj["location"] = json_obj["location"].replace(state, abbreviation)
-
-
-def extract_city_state_country(address):
-    """
-    A method to extract city, state, and country from a full address.
-
-    Example: 123 Frost Ave, Winthrop, MA, United States, 02152, will
-    have "Winthrop, Ma, United States" extracted and returned
-
-    Pattern and match logic derived from Google Gemini AI query
-    """
-    # Regular expression pattern to match city, state abbreviation, and country
-    pattern = r"(\w+(?:[\s\w]+)?),\s([A-Z]{2}),\s([\w\s]+)$"
-
-    match = re.search(pattern, address)
-
-    if match:
-        city = match.group(1)
-        state_abbreviation = match.group(2)
-        country = match.group(3)
-        return f"{city}, {state_abbreviation}, {country}"
-    else:
-        return address
@@ -6,20 +6,133 @@ create_database(), which accepts a .db path as an argument, is the entry
 point for database creation.  If the given path does not exist this method
 will create and open that database, if it does exist it will simply open the
 database.  create_database() then leverages 3 helper methods to create 3
-predefined tables to hold the data from normalized .json files
+predefined tables to hold the data from normalized .json files.  The
+secondary indexes listed in INDEXES are built by build_indexes() once the
+database has been populated, which is much faster than maintaining them row
+by row during a bulk load.  create_database() can also create them up front.
 
 populate_database(), which accepts a .db path as well as a list of files as
 arguments, is the entry point for the insertion of data into the previously
 created database.  This method will open each file in the list, create a
 json object from each line in the file, then call the appropriate helper
-functions used to populate each table.
+functions used to populate each table.  Rows are buffered into batches that
+are inserted with executemany(), committed every COMMIT_INTERVAL rows, and
+loaded under ingest-time pragmas (INGEST_PRAGMAS) that are restored once the
+load is finished.  The ingest rate, in rows per second, is printed at the end.
+
+Every job_listings row stores a content hash of its columns.  With upsert
+enabled, populate_database() compares the hash of each incoming row with the
+stored hash: new ids are inserted, rows whose hash differs are updated with
+INSERT ... ON CONFLICT DO UPDATE, and unchanged rows are not written at all.
+
+populate_database() also makes sure job_listings_fts, an FTS5 full text
+index over the title, company and description of every job listing, exists.
+The index is an external content table that stores only the index, not a
+second copy of the descriptions, and is kept in sync with job_listings by
+triggers, so inserts, upserts and deletes on re-ingest update it as well.
 """
+import hashlib
 import json
 import sqlite3
-from sqlite3 import Cursor
+import time
+from pathlib import Path
+from sqlite3 import Connection, Cursor
+
+BATCH_SIZE = 1000  # Rows buffered per executemany() call
+COMMIT_INTERVAL = 50000  # Rows inserted between commits
+HASH_LOOKUP_SIZE = 500  # Ids per query when looking up stored content hashes
+
+# Secondary indexes on the columns users filter and page job listings by.
+# The *_key indexes are paged through, missing titles and locations are paged
+# as empty strings and the id column breaks ties between equal ones
+INDEXES = {
+    "idx_job_listings_title_key": "job_listings(COALESCE(title, ''), id)",
+    "idx_job_listings_location_key": "job_listings(COALESCE(location, ''), id)",
+    "idx_job_listings_location": "job_listings(location, id)",
+    "idx_job_listings_company": "job_listings(company)",
+    "idx_job_listings_employment_type": "job_listings(employment_type)",
+    "idx_job_listings_date_posted": "job_listings(date_posted)",
+    "idx_user_profiles_profile_name": "user_profiles(profile_name)"
+}
+# Indexes that were replaced by one of INDEXES, dropped by create_indexes()
+OBSOLETE_INDEXES = ("idx_job_listings_title",)
+
+# Pragmas applied for the duration of a bulk load, in the order they are applied
+INGEST_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,  # Negative values are KiB, a 64 MiB page cache
+    "temp_store": "MEMORY"
+}
+
+SHARED_TABLE_INSERT = """
+    INSERT OR IGNORE INTO job_listings (
+        id, title, company, location, date_posted, description, 
+        employment_type, interval, compensation, job_url, content_hash
+    ) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SHARED_TABLE_UPSERT = """
+    INSERT INTO job_listings (
+        id, title, company, location, date_posted, description,
+        employment_type, interval, compensation, job_url, content_hash
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        title = excluded.title, company = excluded.company,
+        location = excluded.location, date_posted = excluded.date_posted,
+        description = excluded.description, employment_type = excluded.employment_type,
+        interval = excluded.interval, compensation = excluded.compensation,
+        job_url = excluded.job_url, content_hash = excluded.content_hash
+    WHERE job_listings.content_hash IS NOT excluded.content_hash
+"""
+
+# Full text index over job_listings, kept in sync by the triggers below
+SEARCH_TABLE_CREATE = """
+    CREATE VIRTUAL TABLE job_listings_fts USING fts5(
+        title, company, description,
+        content='job_listings', content_rowid='rowid'
+    )
+"""
+
+SEARCH_TABLE_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS job_listings_fts_insert AFTER INSERT ON job_listings BEGIN
+        INSERT INTO job_listings_fts (rowid, title, company, description)
+        VALUES (new.rowid, new.title, new.company, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS job_listings_fts_delete AFTER DELETE ON job_listings BEGIN
+        INSERT INTO job_listings_fts (job_listings_fts, rowid, title, company, description)
+        VALUES ('delete', old.rowid, old.title, old.company, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS job_listings_fts_update
+    AFTER UPDATE OF title, company, description ON job_listings BEGIN
+        INSERT INTO job_listings_fts (job_listings_fts, rowid, title, company, description)
+        VALUES ('delete', old.rowid, old.title, old.company, old.description);
+        INSERT INTO job_listings_fts (rowid, title, company, description)
+        VALUES (new.rowid, new.title, new.company, new.description);
+    END
+    """
+)
+
+RAPID_RESULTS_UNIQUE_TABLE_INSERT = """
+    INSERT OR IGNORE INTO rapid_results_unique_data (
+        id, company_url_direct, company_description,
+        currency, job_function, company_num_employees, job_url_direct,
+        company_revenue, job_level,
+        salary_source, emails, site, is_remote, listing_type,
+        company_industry, company_url
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
 
-def create_database(database_path: str):
+def create_database(database_path: str, with_indexes: bool = False):
     """
     Creates a database with the passed argument as the database name
 
@@ -29,6 +142,8 @@ def create_database(database_path: str):
     hold data from json objects representing job listings.
 
     :param database_path:
+    :param with_indexes: Create the secondary indexes now instead of calling
+        build_indexes() once the database has been populated
     :return:
     """
     try:
@@ -36,9 +151,35 @@ def create_database(database_path: str):
         cursor = connection.cursor()
 
         create_shared_table(cursor)
+        add_content_hash_column(cursor)
         create_rapid_results_unique_table(cursor)
         create_user_profile_table(cursor)
 
+        if with_indexes:
+            create_indexes(cursor)
+
+        connection.commit()
+        connection.close()
+
+    except sqlite3.Error as error:
+        print(f"Database error: {error}")
+
+
+def build_indexes(database_path: str):
+    """
+    Creates the secondary indexes of a loaded database, then gathers the
+    statistics the query planner uses to choose between them
+
+    :param database_path: .db path to database file
+    :return:
+    """
+    try:
+        connection = sqlite3.connect(database_path)
+        cursor = connection.cursor()
+
+        create_indexes(cursor)
+        cursor.execute("ANALYZE")
+
         connection.commit()
         connection.close()
 
@@ -46,6 +187,20 @@ def create_database(database_path: str):
         print(f"Database error: {error}")
 
 
+def create_indexes(cursor: Cursor):
+    """
+    Creates every secondary index listed in INDEXES that does not exist yet,
+    and drops the ones listed in OBSOLETE_INDEXES
+
+    :param cursor: A cursor object used to execute SQL queries
+    :return:
+    """
+    for index_name in OBSOLETE_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+    for index_name, indexed_columns in INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {indexed_columns}")
+
+
 def create_shared_table(cursor: Cursor):
     """
     Creates a table that contains the shared keys of both json files
@@ -65,11 +220,47 @@ def create_shared_table(cursor: Cursor):
             employment_type TEXT,
             interval TEXT,
             compensation TEXT,
-            job_url TEXT
+            job_url TEXT,
+            content_hash TEXT
         )   
     """)
 
 
+def add_content_hash_column(cursor: Cursor):
+    """
+    Adds the content_hash column to a job_listings table created before
+    the column existed
+
+    :param cursor: A cursor object used to execute SQL queries
+    :return:
+    """
+    cursor.execute("PRAGMA table_info(job_listings)")
+    if "content_hash" not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE job_listings ADD COLUMN content_hash TEXT")
+
+
+def create_search_index(cursor: Cursor):
+    """
+    Creates the job_listings_fts full text index and the triggers that keep
+    it in sync with job_listings.  An index created for a job_listings table
+    that already holds rows is rebuilt from those rows.
+
+    :param cursor: A cursor object used to execute SQL queries
+    :return: True if the index was created, False if it already existed
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'job_listings_fts'")
+    created = cursor.fetchone() is None
+
+    if created:
+        cursor.execute(SEARCH_TABLE_CREATE)
+        cursor.execute("INSERT INTO job_listings_fts (job_listings_fts) VALUES ('rebuild')")
+
+    for trigger in SEARCH_TABLE_TRIGGERS:
+        cursor.execute(trigger)
+
+    return created
+
+
 def create_rapid_results_unique_table(cursor: Cursor):
     """
     Creates a table for the unique values of rapidResults_normalized.json
@@ -120,63 +311,314 @@ def create_user_profile_table(cursor: Cursor):
         """)
 
 
-def populate_database(database_path: str, source_files: list):
+def populate_database(database_path: str, source_files: list,
+                      batch_size: int = BATCH_SIZE, commit_interval: int = COMMIT_INTERVAL,
+                      upsert: bool = False):
     """
     A method to parse json objects from a file and populate a .db
     database
 
     populate_database() creates a connection via sqlite3 to the
-    database passed in as argument, then opens each file in the
-    passed list, creates a json object from each line in that
-    list, then passes those objects into the appropriate helper
-    function to populate the tables in the database.
+    database passed in as argument, applies the ingest pragmas, then
+    opens each file in the passed list, creates a json object from each
+    line in that list, and buffers the rows for each table.  Every
+    batch_size rows the buffers are inserted with executemany(), and
+    every commit_interval rows the transaction is committed.  The
+    original pragmas are restored, and the connection closed, once
+    every file is loaded or as soon as the load fails.  The
+    job_listings_fts full text index is created if needed, after the
+    load when the database was empty, otherwise before it so that its
+    triggers index every row as it is written.
+
+    Without upsert, job listings whose id is already in the database
+    are ignored.  With upsert, they are updated when their content hash
+    differs from the stored one, and the number of inserted, updated
+    and unchanged job listings is counted.
 
     :param database_path: .db path to database file
     :param source_files: list of files containing json objects
-    :return:
+    :param batch_size: The number of rows inserted per executemany() call
+    :param commit_interval: The number of rows inserted between commits
+    :param upsert: Update job listings whose content has changed
+    :return: A dictionary with the number of rows processed, the number
+        of job listings inserted, the seconds taken, the rows per second
+        and, with upsert, the number of updated and unchanged rows, or None
+        on a database error
     """
     try:
         connection = sqlite3.connect(database_path)
-        cursor = connection.cursor()
-
-        for file in source_files:
-            with open(file, "r", encoding="utf-8") as source_file:
-                for line in source_file:
-                    json_object = json.loads(line)
-                    populate_shared_table(cursor, json_object)
-                    if file.name == "rapid_results_normalized.json":
-                        populate_rapid_results_unique_table(cursor, json_object)
+    except sqlite3.Error as error:
+        print(f"Database error: {error}")
+        return None
 
-        connection.commit()
-        connection.close()
+    try:
+        previous_pragmas = apply_ingest_pragmas(connection)
+        try:
+            stats = load_source_files(connection, source_files, batch_size,
+                                      commit_interval, upsert)
+        finally:
+            # Pragmas such as journal_mode can't change inside a transaction
+            connection.rollback()
+            restore_pragmas(connection, previous_pragmas)
+
+        if upsert:
+            print(f"Upserted {stats['rows']} rows in {stats['seconds']:.2f}s "
+                  f"({stats['rows_per_second']:.0f} rows/s): "
+                  f"{stats['inserted']} inserted, {stats['updated']} updated, "
+                  f"{stats['unchanged']} unchanged")
+        else:
+            print(f"Inserted {stats['inserted']} of {stats['rows']} rows in "
+                  f"{stats['seconds']:.2f}s ({stats['rows_per_second']:.0f} rows/s)")
+        return stats
 
     except sqlite3.Error as error:
         print(f"Database error: {error}")
+        return None
+
+    finally:
+        connection.close()
 
 
-def populate_shared_table(cursor: Cursor, json_object: dict):
+def load_source_files(connection: Connection, source_files: list, batch_size: int,
+                      commit_interval: int, upsert: bool):
     """
-    Executes a sql statement to populate a table within a database
+    Loads the rows of every normalized file in batches, see populate_database()
 
-    *** Proper syntax assisted with Google Gemini AI ***
+    :param connection: A connection to the database being loaded, with the
+        ingest pragmas applied
+    :param source_files: list of files containing json objects
+    :param batch_size: The number of rows inserted per executemany() call
+    :param commit_interval: The number of rows inserted between commits
+    :param upsert: Update job listings whose content has changed
+    :return: The statistics dictionary returned by populate_database()
+    """
+    cursor = connection.cursor()
+    defer_search_index = should_defer_search_index(cursor)
+    if not defer_search_index:
+        create_search_index(cursor)
 
-    :param cursor:
-    :param json_object:
+    start_time = time.perf_counter()
+    row_count = 0
+    uncommitted_rows = 0
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    for file in source_files:
+        for batch in iter_row_batches(file, batch_size):
+            insert_batch(cursor, *batch, counts, upsert)
+            row_count += len(batch[0])
+            uncommitted_rows += len(batch[0])
+
+            if uncommitted_rows >= commit_interval:
+                connection.commit()
+                uncommitted_rows = 0
+
+    if defer_search_index:
+        create_search_index(cursor)
+
+    connection.commit()
+    elapsed = time.perf_counter() - start_time
+
+    stats = {"rows": row_count, "seconds": elapsed,
+             "rows_per_second": row_count / elapsed if elapsed else 0.0}
+    stats.update(counts if upsert else {"inserted": counts["inserted"]})
+    return stats
+
+
+def should_defer_search_index(cursor):
+    """
+    Indexing rows one trigger at a time is several times slower than
+    rebuilding the index in one pass, so the index of a new database is only
+    created once it has been loaded
+
+    :param cursor: A cursor of the database being loaded
+    :return: True if the database is empty and has no search index yet
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'job_listings_fts'")
+    if cursor.fetchone() is not None:
+        return False
+    cursor.execute("SELECT 1 FROM job_listings LIMIT 1")
+    return cursor.fetchone() is None
+
+
+def iter_row_batches(file: Path, batch_size: int):
+    """
+    Reads the rows of a normalized file in batches
+
+    :param file: A Path object representing a normalized json file
+    :param batch_size: The most rows in a batch
+    :return: A generator of (shared rows, unique rows) batches.  Unique rows
+        are only read from rapid_results_normalized.json, and the last batch
+        may be empty
+    """
+    is_rapid_results = file.name == "rapid_results_normalized.json"
+    shared_rows = []
+    unique_rows = []
+
+    with open(file, "r", encoding="utf-8") as source_file:
+        for line in source_file:
+            json_object = json.loads(line)
+            shared_rows.append(shared_table_row(json_object))
+            if is_rapid_results:
+                unique_rows.append(rapid_results_unique_row(json_object))
+
+            if len(shared_rows) >= batch_size:
+                yield shared_rows, unique_rows
+                shared_rows, unique_rows = [], []
+
+    yield shared_rows, unique_rows
+
+
+def apply_ingest_pragmas(connection: Connection):
+    """
+    Applies INGEST_PRAGMAS to a connection before a bulk load
+
+    :param connection: A connection to the database being loaded
+    :return previous_pragmas: A dictionary of the values that were replaced
+    """
+    previous_pragmas = {}
+    for pragma, value in INGEST_PRAGMAS.items():
+        previous_pragmas[pragma] = connection.execute(f"PRAGMA {pragma}").fetchone()[0]
+        connection.execute(f"PRAGMA {pragma} = {value}")
+
+    return previous_pragmas
+
+
+def restore_pragmas(connection: Connection, previous_pragmas: dict):
+    """
+    Restores the pragmas replaced by apply_ingest_pragmas(), in reverse order
+
+    :param connection: A connection to the database that was loaded
+    :param previous_pragmas: The dictionary returned by apply_ingest_pragmas()
     :return:
     """
-    cursor.execute("""
-        INSERT OR IGNORE INTO job_listings (
-            id, title, company, location, date_posted, description, 
-            employment_type, interval, compensation, job_url
-        ) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+    for pragma, value in reversed(previous_pragmas.items()):
+        connection.execute(f"PRAGMA {pragma} = {value}")
+
+
+def insert_batch(cursor: Cursor, shared_rows: list, unique_rows: list, counts: dict,
+                 upsert: bool = False):
+    """
+    Inserts a batch of buffered rows into their tables with executemany()
+
+    :param cursor: A cursor object used to execute SQL queries
+    :param shared_rows: A list of job_listings rows
+    :param unique_rows: A list of rapid_results_unique_data rows
+    :param counts: A dictionary of inserted, updated and unchanged counts,
+        updated with the job_listings rows written
+    :param upsert: Upsert the job_listings rows instead of ignoring the ids
+        that already exist
+    :return:
+    """
+    if shared_rows and upsert:
+        upsert_shared_rows(cursor, shared_rows, counts)
+    elif shared_rows:
+        cursor.executemany(SHARED_TABLE_INSERT, shared_rows)
+        # The rows INSERT OR IGNORE actually wrote, without the trigger writes
+        # that connection.total_changes would include
+        counts["inserted"] += cursor.rowcount
+    if unique_rows:
+        cursor.executemany(RAPID_RESULTS_UNIQUE_TABLE_INSERT, unique_rows)
+
+
+def upsert_shared_rows(cursor: Cursor, shared_rows: list, counts: dict):
+    """
+    Upserts a batch of job_listings rows, only writing the rows that are new
+    or whose content hash differs from the stored content hash
+
+    :param cursor: A cursor object used to execute SQL queries
+    :param shared_rows: A list of job_listings rows built by shared_table_row()
+    :param counts: A dictionary of inserted, updated and unchanged counts
+    :return:
+    """
+    stored_hashes = get_content_hashes(cursor, [row[0] for row in shared_rows])
+    changed_rows = []
+
+    for row in shared_rows:
+        job_id, content_hash = row[0], row[-1]
+        if job_id not in stored_hashes:
+            counts["inserted"] += 1
+        elif stored_hashes[job_id] != content_hash:
+            counts["updated"] += 1
+        else:
+            counts["unchanged"] += 1
+            continue
+        # Later rows of the same batch compare against this one
+        stored_hashes[job_id] = content_hash
+        changed_rows.append(row)
+
+    if changed_rows:
+        cursor.executemany(SHARED_TABLE_UPSERT, changed_rows)
+
+
+def get_content_hashes(cursor: Cursor, job_ids: list):
+    """
+    Looks up the stored content hash of each job listing id that exists
+
+    :param cursor: A cursor object used to execute SQL queries
+    :param job_ids: A list of job listing ids
+    :return: A dictionary mapping job listing id to content hash
+    """
+    content_hashes = {}
+    for start in range(0, len(job_ids), HASH_LOOKUP_SIZE):
+        ids = job_ids[start:start + HASH_LOOKUP_SIZE]
+        cursor.execute(f"""
+            SELECT id, content_hash FROM job_listings
+            WHERE id IN ({", ".join("?" * len(ids))})
+        """, ids)
+        content_hashes.update(cursor.fetchall())
+
+    return content_hashes
+
+
+def shared_table_row(json_object: dict):
+    """
+    Builds the job_listings row for a normalized json object, with the
+    content hash of its values as the last column
+
+    :param json_object:
+    :return: A tuple of values in the column order of SHARED_TABLE_INSERT
+    """
+    row = (
         json_object["id"], json_object["title"],
         json_object["company"], json_object["location"],
         json_object["date_posted"], json_object["description"],
         json_object["employment_type"], json_object["interval"],
         json_object["compensation"], json_object["job_url"]
-    ))
+    )
+    content_hash = hashlib.sha1(json.dumps(row).encode("utf-8")).hexdigest()
+    return row + (content_hash,)
+
+
+def rapid_results_unique_row(json_object: dict):
+    """
+    Builds the rapid_results_unique_data row for a normalized json object
+
+    :param json_object:
+    :return: A tuple of values in the column order of RAPID_RESULTS_UNIQUE_TABLE_INSERT
+    """
+    return (json_object["id"],
+            json_object["company_url_direct"], json_object["company_description"],
+            json_object["currency"], json_object["job_function"],
+            json_object["company_num_employees"], json_object["job_url_direct"],
+            json_object["company_revenue"], json_object["job_level"],
+            json_object["salary_source"], json_object["emails"],
+            json_object["site"], json_object["is_remote"],
+            json_object["listing_type"], json_object["company_industry"],
+            json_object["company_url"]
+            )
+
+
+def populate_shared_table(cursor: Cursor, json_object: dict):
+    """
+    Executes a sql statement to populate a table within a database
+
+    *** Proper syntax assisted with Google Gemini AI ***
+
+    :param cursor:
+    :param json_object:
+    :return:
+    """
+    cursor.execute(SHARED_TABLE_INSERT, shared_table_row(json_object))
 
 
 def populate_rapid_results_unique_table(cursor: Cursor, json_object: dict):
@@ -187,22 +629,4 @@ def populate_rapid_results_unique_table(cursor: Cursor, json_object: dict):
     :param json_object:
     :return:
     """
-    cursor.execute("""
-        INSERT OR IGNORE INTO rapid_results_unique_data (
-            id, company_url_direct, company_description,
-            currency, job_function, company_num_employees, job_url_direct,
-            company_revenue, job_level,
-            salary_source, emails, site, is_remote, listing_type,
-            company_industry, company_url
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (json_object["id"],
-          json_object["company_url_direct"], json_object["company_description"],
-          json_object["currency"], json_object["job_function"],
-          json_object["company_num_employees"], json_object["job_url_direct"],
-          json_object["company_revenue"], json_object["job_level"],
-          json_object["salary_source"], json_object["emails"],
-          json_object["site"], json_object["is_remote"],
-          json_object["listing_type"], json_object["company_industry"],
-          json_object["company_url"]
-          ))
+    cursor.execute(RAPID_RESULTS_UNIQUE_TABLE_INSERT, rapid_results_unique_row(json_object))
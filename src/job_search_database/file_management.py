@@ -7,13 +7,19 @@ data of the original file, it will then pass both original file (Path)
 and new file (Path) into the read_and_write_files() method where the
 source file is read and normalized, then written to the new, normalized
 file location.
+
+When streaming is requested the source file is instead parsed incrementally
+by process_json_stream(), which keeps memory use bounded no matter how large
+a single line (or a single json array) of the source file is.
 """
 import os
 from pathlib import Path
-from src.job_search_database.data_normalization import process_json_array, process_json_object
+from typing import TextIO
+from src.job_search_database.data_normalization import (
+    process_json_array, process_json_object, process_json_stream)
 
 
-def normalize_file(file: str, is_test: bool):
+def normalize_file(file: str, is_test: bool, streaming: bool = False):
     """
     Normalizes each file of JSON objects into a standardized data structure
 
@@ -26,9 +32,29 @@ def normalize_file(file: str, is_test: bool):
 
     :param is_test:
     :param file: The name of a json file (as string) containing job listings
+    :param streaming: Parse the source file incrementally instead of line by line
     :return normalized_file_path_obj: A path object representing the new
         file containing normalized data.
     """
+    source_file, normalized_file_path_obj = get_file_paths(file, is_test)
+
+    read_and_write_files(source_file, normalized_file_path_obj, streaming)
+
+    return normalized_file_path_obj
+
+
+def get_file_paths(file: str, is_test: bool):
+    """
+    A method to locate a source json file and the file that will hold its
+    normalized data.
+
+    Source files are looked up in the json_files directory of this module, or
+    in the test directory when is_test is True.
+
+    :param file: The name of a json file (as string) containing job listings
+    :param is_test:
+    :return: A tuple of Path objects (source_file, normalized_file_path_obj)
+    """
     source_file = None
     normalized_file_path_obj = None
 
@@ -53,12 +79,11 @@ def normalize_file(file: str, is_test: bool):
         normalized_file_path_obj = Path(os.path.join
                                         (test_directory, build_path_object(source_file)))
 
-    read_and_write_files(source_file, normalized_file_path_obj)
-
-    return normalized_file_path_obj
+    return source_file, normalized_file_path_obj
 
 
-def read_and_write_files(input_file: Path, normalized_file_path_obj: Path):
+def read_and_write_files(input_file: Path, normalized_file_path_obj: Path,
+                         streaming: bool = False):
     """
     A method that opens a json file that may require normalization and creates
     and opens another json file to hold the normalized data.
@@ -67,23 +92,44 @@ def read_and_write_files(input_file: Path, normalized_file_path_obj: Path):
     and opens the output (normalized file) for writing.  This method will then
     determine the format of the input file and will send it through the
     appropriate method (either process_json_array() or process_json_object())
-    for normalization.
+    for normalization.  In streaming mode the whole file is handed to
+    process_json_stream() instead, which yields one json object at a time.
 
     :param input_file: Path object representing one of the original json files
     :param normalized_file_path_obj: Path object representing a file containing
         the normalized data of the input file.
+    :param streaming: Parse the input file incrementally instead of line by line
     :return:
     """
     with open(input_file, "r", encoding="utf-8") as read_file:  # Open input file
         # Create and open output file
         with open(normalized_file_path_obj, "w", encoding="utf-8") as write_file:
+            if streaming:
+                process_json_stream(input_file, read_file, write_file)
+                return
+
             for line in read_file:
-                line = line.strip()
-                # If each line is an list of JSON objects: [{json obj}, {json obj}, {json obj}]
-                if line.startswith("[") and line.endswith("]"):
-                    process_json_array(input_file, line, write_file)
-                else:
-                    process_json_object(input_file, line, write_file)
+                process_line(input_file, line, write_file)
+
+
+def process_line(input_file: Path, line: str, write_file: TextIO):
+    """
+    A method that sends one line of a source json file through the appropriate
+    method (either process_json_array() or process_json_object()) for
+    normalization, depending on whether the line holds a list of json objects
+    or a single json object.
+
+    :param input_file: Path object representing one of the original json files
+    :param line: A string containing the contents of one line from the source file
+    :param write_file: A TextIO wrapper representing the output (normalized) file
+    :return:
+    """
+    line = line.strip()
+    # If each line is an list of JSON objects: [{json obj}, {json obj}, {json obj}]
+    if line.startswith("[") and line.endswith("]"):
+        process_json_array(input_file, line, write_file)
+    else:
+        process_json_object(input_file, line, write_file)
 
 
 def build_path_object(source_file: Path):
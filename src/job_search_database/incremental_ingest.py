@@ -0,0 +1,250 @@
+"""
+A module for re-ingesting source json files incrementally, so that a run only
+normalizes and inserts the data that was added or changed since the last run.
+
+incremental_ingest() is the entry point for this module.  For every source
+file it keeps a checkpoint in the ingest_checkpoints table of the database:
+the byte offset up to which the file has been ingested, the file's mtime and
+size at that time, and a content hash of the ingested bytes.  On the next run
+each source file is compared against its checkpoint:
+
+    - unchanged: same size and same mtime; nothing is done, and nothing is read
+    - appended: the ingested bytes still hash the same, so only the lines after
+      the checkpointed offset are normalized, appended to the normalized file,
+      and inserted into the database
+    - changed (or never ingested): the whole file is normalized and upserted,
+      so job listings whose content changed are updated in place
+
+Only complete lines are ingested, a partially written last line is left for
+the next run.  The content hash covers every ingested byte, so an edit
+anywhere in the ingested range, not just a rewrite or a truncation, makes the
+whole file ingest again.  It is only computed when the size or mtime of the
+file changed, and then every byte is hashed once: the ingested bytes to
+check the checkpoint, and the same digest is carried on over the new bytes
+for the next checkpoint.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from src.job_search_database.database_management import populate_database
+from src.job_search_database.file_management import get_file_paths
+from src.job_search_database.parallel_normalization import normalize_line_range
+
+BLOCK_SIZE = 1024 * 1024  # Bytes read at a time while hashing or looking for a line end
+
+
+def incremental_ingest(database_path: str, files: list, is_test: bool = False):
+    """
+    Normalizes and inserts only the new or changed data of each source file
+
+    :param database_path: .db path to a database created by create_database()
+    :param files: A list of json file names (as string) containing job listings
+    :param is_test:
+    :return normalized_files: A list of Path objects representing the full
+        normalized file of each source file
+    """
+    connection = sqlite3.connect(database_path)
+    create_checkpoint_table(connection)
+    normalized_files = []
+
+    for file in files:
+        source_file, normalized_file_path_obj = get_file_paths(file, is_test)
+        normalized_files.append(normalized_file_path_obj)
+
+        checkpoint = get_checkpoint(connection, source_file)
+        file_stat = os.stat(source_file)
+
+        if (checkpoint is not None and file_stat.st_size == checkpoint["size"]
+                and file_stat.st_mtime == checkpoint["mtime"]):
+            print(f"{source_file.name}: unchanged, skipped")
+            continue
+
+        start, digest = find_resume_offset(source_file, file_stat.st_size, checkpoint)
+
+        end = find_ingest_end(source_file, file_stat.st_size)
+        if start < end:
+            print(f"{source_file.name}: ingesting bytes {start} to {end}")
+            ingest_range(database_path, source_file, normalized_file_path_obj, start, end)
+
+        # The digest of the bytes already ingested is carried on over the new
+        # ones, so no byte is hashed twice in a run
+        update_digest(digest, source_file, start, end)
+        save_checkpoint(connection, source_file, {
+            "byte_offset": end, "mtime": file_stat.st_mtime, "size": file_stat.st_size,
+            "content_hash": digest.hexdigest()})
+
+    connection.close()
+    return normalized_files
+
+
+def create_checkpoint_table(connection: sqlite3.Connection):
+    """
+    Creates the table that holds one ingest checkpoint per source file
+
+    :param connection: A connection to the job listings database
+    :return:
+    """
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+            source_path TEXT PRIMARY KEY,
+            byte_offset INTEGER,
+            mtime REAL,
+            size INTEGER,
+            content_hash TEXT
+        )
+    """)
+    connection.commit()
+
+
+def get_checkpoint(connection: sqlite3.Connection, source_file: Path):
+    """
+    Retrieves the checkpoint of a source file
+
+    :param connection: A connection to the job listings database
+    :param source_file: A Path object representing a source json file
+    :return: A dictionary holding the checkpoint, or None if the file has
+        never been ingested
+    """
+    row = connection.execute("""
+        SELECT byte_offset, mtime, size, content_hash
+        FROM ingest_checkpoints WHERE source_path = ?
+    """, (str(source_file),)).fetchone()
+
+    if row is None:
+        return None
+
+    return {"byte_offset": row[0], "mtime": row[1], "size": row[2], "content_hash": row[3]}
+
+
+def save_checkpoint(connection: sqlite3.Connection, source_file: Path, checkpoint: dict):
+    """
+    Records how much of a source file has been ingested
+
+    :param connection: A connection to the job listings database
+    :param source_file: A Path object representing a source json file
+    :param checkpoint: Like the checkpoints returned by get_checkpoint():
+        byte_offset, the offset just past the last ingested line, the mtime
+        and size of the source file, and content_hash, the hex sha256 digest
+        of every byte up to byte_offset
+    :return:
+    """
+    connection.execute("""
+        INSERT OR REPLACE INTO ingest_checkpoints (
+            source_path, byte_offset, mtime, size, content_hash
+        )
+        VALUES (?, ?, ?, ?, ?)
+    """, (str(source_file), checkpoint["byte_offset"], checkpoint["mtime"], checkpoint["size"],
+          checkpoint["content_hash"]))
+    connection.commit()
+
+
+def find_resume_offset(source_file: Path, size: int, checkpoint: dict):
+    """
+    Determines where ingestion of a source file should start.  Ingestion
+    resumes at the checkpoint when every previously ingested byte is still
+    intact (data was only appended), otherwise it starts over from the
+    beginning of the file.
+
+    :param source_file: A Path object representing a source json file
+    :param size: The current size of the source file
+    :param checkpoint: The checkpoint of the source file, or None
+    :return: A tuple (byte offset to start ingesting from, sha256 digest of
+        every byte before that offset), the digest is updated with the bytes
+        ingested next
+    """
+    if checkpoint is None or size < checkpoint["byte_offset"]:
+        return 0, hashlib.sha256()
+
+    digest = update_digest(hashlib.sha256(), source_file, 0, checkpoint["byte_offset"])
+    if digest.hexdigest() != checkpoint["content_hash"]:
+        return 0, hashlib.sha256()
+
+    return checkpoint["byte_offset"], digest
+
+
+def find_ingest_end(source_file: Path, size: int):
+    """
+    Finds the end of the last complete line of a source file.  A last line
+    without a trailing newline is only counted as complete if it holds valid
+    json, otherwise it is assumed to still be in the middle of being written.
+
+    :param source_file: A Path object representing a source json file
+    :param size: The current size of the source file
+    :return: The byte offset just past the last complete line
+    """
+    with open(source_file, "rb") as read_file:
+        position = size
+        tail = b""
+        while position > 0:
+            block_start = max(0, position - BLOCK_SIZE)
+            read_file.seek(block_start)
+            tail = read_file.read(position - block_start) + tail
+            newline = tail.rfind(b"\n")
+            if newline != -1:
+                tail = tail[newline + 1:]
+                break
+            position = block_start
+
+    if not tail.strip():
+        return size
+
+    try:
+        json.loads(tail)
+        return size
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return size - len(tail)
+
+
+def update_digest(digest, source_file: Path, start: int, end: int):
+    """
+    Hashes the bytes of a source file between two byte offsets
+
+    :param digest: A hashlib object, i.e. hashlib.sha256()
+    :param source_file: A Path object representing a source json file
+    :param start: Byte offset of the first byte to hash
+    :param end: Byte offset just past the last byte to hash
+    :return: The digest, updated with the bytes
+    """
+    with open(source_file, "rb") as read_file:
+        read_file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = read_file.read(min(remaining, BLOCK_SIZE))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+
+    return digest
+
+
+def ingest_range(database_path: str, source_file: Path, normalized_file_path_obj: Path,
+                 start: int, end: int):
+    """
+    Normalizes the lines of a source file between two byte offsets, inserts
+    them into the database, and adds them to the normalized file.  When
+    ingestion starts from the beginning of the file the normalized file is
+    replaced, otherwise the new lines are appended to it.
+
+    :param database_path: .db path to the job listings database
+    :param source_file: A Path object representing a source json file
+    :param normalized_file_path_obj: Path object representing the normalized file
+    :param start: Byte offset of the first line to ingest
+    :param end: Byte offset just past the last line to ingest
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        # The delta keeps the normalized file's name, populate_database() relies on it
+        delta_file = Path(os.path.join(temporary_directory, normalized_file_path_obj.name))
+        normalize_line_range(source_file, delta_file, start, end)
+
+        populate_database(database_path, [delta_file], upsert=True)
+
+        with open(normalized_file_path_obj, "ab" if start else "wb") as write_file:
+            with open(delta_file, "rb") as read_file:
+                shutil.copyfileobj(read_file, write_file)
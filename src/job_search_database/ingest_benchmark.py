@@ -0,0 +1,99 @@
+"""
+A program to compare the batched ingest of populate_database() against the
+original row by row ingest on a synthetic feed of normalized job listings.
+
+The program writes a normalized json file holding the requested number of
+synthetic job listings to a temporary directory, loads it into a fresh
+database once with one cursor.execute() per row in a single transaction
+under the default pragmas, and once with populate_database(), then prints
+the rows per second of each.
+
+To run (from the project root, with PYTHONPATH set to the project root):
+
+    python src/job_search_database/ingest_benchmark.py --rows 1000000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from src.job_search_database.database_management import (
+    BATCH_SIZE, COMMIT_INTERVAL, create_database, populate_database, populate_shared_table)
+
+
+def write_synthetic_feed(file_path: Path, row_count: int):
+    """
+    Writes a normalized json file of synthetic job listings, one per line
+
+    :param file_path: Path of the file to write
+    :param row_count: The number of job listings to write
+    :return:
+    """
+    with open(file_path, "w", encoding="utf-8") as write_file:
+        for index in range(row_count):
+            write_file.write(json.dumps({
+                "id": f"synthetic-{index}", "title": f"Software Engineer {index % 500}",
+                "company": f"Company {index % 2000}", "location": "Boston, MA, United States",
+                "date_posted": "2025-02-01", "description": "A synthetic job description. " * 20,
+                "employment_type": "Full-time", "interval": "yearly",
+                "compensation": "100000 - 120000", "job_url": f"https://example.com/{index}"
+            }) + "\n")
+
+
+def populate_row_by_row(database_path: str, source_files: list):
+    """
+    The original ingest path: one execute() per row, one transaction, and
+    the default pragmas
+
+    :param database_path: .db path to database file
+    :param source_files: list of files containing json objects
+    :return: The number of rows inserted
+    """
+    connection = sqlite3.connect(database_path)
+    cursor = connection.cursor()
+    row_count = 0
+
+    for file in source_files:
+        with open(file, "r", encoding="utf-8") as source_file:
+            for line in source_file:
+                populate_shared_table(cursor, json.loads(line))
+                row_count += 1
+
+    connection.commit()
+    connection.close()
+    return row_count
+
+
+def main(argv=None):
+    """
+    Program entry
+    """
+    parser = argparse.ArgumentParser(description="Compare row by row and batched ingest")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--commit-interval", type=int, default=COMMIT_INTERVAL)
+    arguments = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        feed = Path(os.path.join(temporary_directory, "synthetic_normalized.json"))
+        write_synthetic_feed(feed, arguments.rows)
+
+        row_by_row_database = os.path.join(temporary_directory, "row_by_row.db")
+        create_database(row_by_row_database)
+        start_time = time.perf_counter()
+        row_count = populate_row_by_row(row_by_row_database, [feed])
+        elapsed = time.perf_counter() - start_time
+        print(f"Row by row: {row_count} rows in {elapsed:.2f}s ({row_count / elapsed:.0f} rows/s)")
+
+        batched_database = os.path.join(temporary_directory, "batched.db")
+        create_database(batched_database)
+        print("Batched:    ", end="")
+        populate_database(batched_database, [feed],
+                          arguments.batch_size, arguments.commit_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -34,12 +34,29 @@ database_management.py.
 Finally, the previously created database is populated with the data
 from each json file.  This process begins with the populate_database()
 method found in database_management.py.
+
+Passing --stream on the command line parses each source file incrementally,
+one json object at a time, which keeps memory use bounded for source files
+that hold very large json arrays on a single line.  Passing --workers N
+normalizes each source file across N processes (0 uses every core), see
+parallel_normalization.py.  Normalized locations are cached in memory, the
+cache size is set with --location-cache-size and --location-cache-file keeps
+the cache in a sidecar file between runs.  The cache hit ratio is printed
+after normalization.  Passing --incremental only normalizes and inserts the
+data that was added or changed since the previous run, see
+incremental_ingest.py, and can't be combined with --stream or --workers.
+Passing --upsert updates job listings that are already
+in the database when their content has changed, instead of ignoring them.
 """
+import argparse
 import os
 
-from src.job_search_database.database_management import create_database, populate_database
-from src.job_search_database.file_management import normalize_file
+from src.job_search_database.database_management import (
+    build_indexes, create_database, populate_database)
+from src.job_search_database.incremental_ingest import incremental_ingest
+from src.job_search_database.parallel_normalization import normalize_file_parallel
 from src.job_search_database.key_comparison import compare_keys
+from src.job_search_database.location_normalization import LOCATION_CACHE, LOCATION_CACHE_SIZE
 
 SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIRECTORY = os.path.abspath(os.path.join(SCRIPT_DIRECTORY, "../../"))
@@ -68,24 +85,80 @@ def create_symlink_database_in_root():
     os.symlink(MODULE_DATABASE_PATH, ROOT_DATABASE_PATH)  # Works on Linux/macOS
 
 
-def launch_job_database():
+def launch_job_database(streaming: bool = False, workers: int = 1, incremental: bool = False,
+                        upsert: bool = False):
     """
     Program entry
+
+    :param streaming: Parse the source files incrementally instead of line by line
+    :param workers: The number of processes used to normalize each source file
+    :param incremental: Only ingest data added or changed since the previous run
+    :param upsert: Update existing job listings whose content has changed
     """
+    if incremental:
+        create_database(MODULE_DATABASE_PATH)
+        normalized_files.extend(incremental_ingest(MODULE_DATABASE_PATH, FILE_PATHS.values()))
+        compare_keys(normalized_files)
+        build_indexes(MODULE_DATABASE_PATH)
+        return
 
     for file_path in FILE_PATHS.values():
-        normalized_files.append(normalize_file(file_path, False))
+        normalized_files.append(normalize_file_parallel(file_path, False, workers, streaming))
 
     # Prints shared and unique keys after initial normalization
     # Can be used for further comparison and normalization of data
     compare_keys(normalized_files)
 
+    # Indexes are built after the bulk load rather than maintained during it
     create_database(MODULE_DATABASE_PATH)
-    populate_database(MODULE_DATABASE_PATH, normalized_files)
+    populate_database(MODULE_DATABASE_PATH, normalized_files, upsert=upsert)
+    build_indexes(MODULE_DATABASE_PATH)
+
 
+def parse_arguments(argv=None):
+    """
+    Parses the command line options of the job database program
+
+    :param argv: A list of command line arguments, defaults to sys.argv
+    :return: An argparse.Namespace holding the parsed options
+    """
+    parser = argparse.ArgumentParser(description="Normalize job listings and build the database")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse source files incrementally with bounded memory")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes used for normalization, 0 uses every core")
+    parser.add_argument("--location-cache-size", type=int, default=LOCATION_CACHE_SIZE,
+                        help="number of normalized locations cached, 0 disables the cache")
+    parser.add_argument("--location-cache-file",
+                        help="sidecar file the location cache is loaded from and saved to")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only ingest data added or changed since the previous run")
+    parser.add_argument("--upsert", action="store_true",
+                        help="update existing job listings whose content has changed")
+    arguments = parser.parse_args(argv)
+
+    # Checkpoints are line offsets, and the delta of a run is normalized in this process
+    if arguments.incremental and arguments.stream:
+        parser.error("--incremental can't be combined with --stream")
+    if arguments.incremental and arguments.workers != 1:
+        parser.error("--incremental can't be combined with --workers")
+    return arguments
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    workers = arguments.workers or os.cpu_count() or 1
+
+    LOCATION_CACHE.resize(arguments.location_cache_size)
+    if arguments.location_cache_file:
+        LOCATION_CACHE.load(arguments.location_cache_file)
+
+    launch_job_database(arguments.stream, workers, arguments.incremental, arguments.upsert)
+
+    print(f"\n{LOCATION_CACHE.stats()}")
+    if arguments.location_cache_file:
+        LOCATION_CACHE.save(arguments.location_cache_file)
 
-def main():
-    launch_job_database()
     create_symlink_database_in_root()
 
 
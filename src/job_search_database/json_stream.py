@@ -0,0 +1,94 @@
+"""
+A module for incrementally reading json objects from a source file without
+holding the whole file, or even a whole line of it, in memory.
+
+iter_json_objects() is the entry point for this module.  It reads the source
+file in fixed size chunks and uses json.JSONDecoder.raw_decode() to pull one
+json object at a time out of the buffered text.  Top level arrays are entered
+rather than decoded, so a file that holds a single (possibly enormous) array
+on one line, a pretty-printed array spread over many lines, one array per
+line, or one object per line all yield the same stream of job objects.
+Memory use is bounded by the chunk size plus the size of the largest single
+job object, regardless of how large the file is.
+"""
+import json
+from typing import Iterator, TextIO
+
+CHUNK_SIZE = 64 * 1024  # Number of characters read from the source file at a time
+WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_objects(read_file: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator:
+    """
+    Yields each json object found in an open json file, one at a time.
+
+    iter_json_objects() keeps a small text buffer over the file.  Whitespace
+    and the "[", "," and "]" punctuation of top level arrays are skipped,
+    everything else is handed to raw_decode().  When raw_decode() fails
+    because the buffer ends part way through an object, more of the file is
+    read (doubling the amount read each time so that very large objects are
+    still decoded in linear time) and the decode is retried.  Text that has
+    already been decoded is discarded from the buffer as the file is consumed.
+
+    :param read_file: A TextIO wrapper representing an open source json file
+    :param chunk_size: The number of characters to read from the file at a time
+    :return: An iterator of json objects (dictionaries)
+    :raises json.JSONDecodeError: If the file contains malformed json
+    """
+    buffer = ""
+    position = 0
+    in_array = False
+    end_of_file = False
+
+    while True:
+        # Skip whitespace and array punctuation between json values
+        while position < len(buffer) and (buffer[position] in WHITESPACE or
+                                          (in_array and buffer[position] == ",")):
+            position += 1
+
+        if position == len(buffer):
+            if end_of_file:
+                if in_array:
+                    raise json.JSONDecodeError("Unterminated array", buffer, position)
+                return
+            buffer, position = buffer[position:], 0
+            chunk = read_file.read(chunk_size)
+            end_of_file = not chunk
+            buffer += chunk
+            continue
+
+        if buffer[position] == "[" and not in_array:
+            in_array = True  # Enter the array, its elements are decoded one by one
+            position += 1
+            continue
+
+        if buffer[position] == "]" and in_array:
+            in_array = False
+            position += 1
+            continue
+
+        try:
+            json_object, end = _decoder.raw_decode(buffer, position)
+            # A number or literal that ends with the buffer may continue in the next chunk
+            incomplete = (end == len(buffer) and not end_of_file
+                          and not isinstance(json_object, (dict, list)))
+        except json.JSONDecodeError:
+            if end_of_file:
+                raise
+            incomplete = True
+
+        if incomplete:
+            # Drop the consumed text, then read at least as much as is pending
+            buffer, position = buffer[position:], 0
+            chunk = read_file.read(max(chunk_size, len(buffer)))
+            end_of_file = not chunk
+            buffer += chunk
+            continue
+
+        position = end
+        if position >= chunk_size:
+            buffer, position = buffer[position:], 0
+
+        yield json_object
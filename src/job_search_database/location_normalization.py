@@ -0,0 +1,320 @@
+"""
+A module for normalizing the location of a job listing with tables that are
+built once, when the module is imported, instead of once per job listing.
+
+LocationNormalizer.normalize() is the entry point for this module, and the
+one implementation of the location rules: zip code removal, "USA" removal,
+state name abbreviation, appending ", United States", translating "United
+States", extracting the city, state, and country, and the best guess city
+fallbacks.  It looks everything up in precompiled structures:
+
+    - STATE_NAME_PATTERN: a single alternation regex that tells us whether a
+      location contains any state name at all, so the ordered replacement of
+      state names only runs for the few locations that need it
+    - STATE_ABBREVIATION_SET: a frozenset of the two letter abbreviations
+    - CITY_SUFFIXES and CITY_REPLACEMENTS: dictionaries mapping a bare city
+      name to the text appended to it, or to its full replacement
+
+Job feeds repeat a small set of raw locations thousands of times, so the
+shared normalizer also remembers raw -> normalized locations in a LocationCache,
+a bounded least recently used cache with hit and miss counters.  The cache can
+be saved to and loaded from a sidecar json file so repeated runs start warm.
+"""
+import json
+import os
+import re
+from collections import OrderedDict
+
+STATE_ABBREVIATIONS = {
+    "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR", "California": "CA",
+    "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE", "Florida": "FL", "Georgia": "GA",
+    "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL", "Indiana": "IN", "Iowa": "IA",
+    "Kansas": "KS", "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD",
+    "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS",
+    "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV", "New Hampshire": "NH",
+    "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY", "North Carolina": "NC",
+    "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK", "Oregon": "OR", "Pennsylvania": "PA",
+    "Rhode Island": "RI", "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN",
+    "Texas": "TX", "Utah": "UT", "Vermont": "VT", "Virginia": "VA", "Washington": "WA",
+    "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY"
+}
+
+# Ordered (state, abbreviation) pairs.  The order matters, "Virginia" is replaced
+# before "West Virginia", as the original location rules did
+STATE_ITEMS = tuple(STATE_ABBREVIATIONS.items())
+STATE_ABBREVIATION_SET = frozenset(STATE_ABBREVIATIONS.values())
+STATE_NAME_PATTERN = re.compile("|".join(re.escape(state) for state in STATE_ABBREVIATIONS))
+
+# Non-English (and long form) names of the United States, in replacement order
+FOREIGN_UNITED_STATES = ("États-Unis", "Stati Uniti", "Vereinigte Staaten",
+                         "United States of America")
+FOREIGN_UNITED_STATES_PATTERN = re.compile(
+    "|".join(re.escape(name) for name in FOREIGN_UNITED_STATES))
+
+# Numbers and dashes at the end of a location (zip codes)
+ZIP_CODE_PATTERN = re.compile(r'[\s\d,.-]+$')
+# City, state abbreviation, and country.  Pattern derived from Google Gemini AI
+CITY_STATE_COUNTRY_PATTERN = re.compile(r"(\w+(?:[\s\w]+)?),\s([A-Z]{2}),\s([\w\s]+)$")
+
+# Best guess locations for listings that only name a city, see complete_city()
+CITY_SUFFIXES = {
+    "Boston": ", MA, United States", "Cambridge": ", MA, United States",
+    "Somerville": ", MA, United States", "San Francisco": ", CA, United States",
+    "San Jose": ", CA, United States", "Sacramento": ", CA, United States",
+    "Pittsburgh": ", PA, United States", "Atlanta": ", GA, United States",
+    "Chicago": ", IL, United States", "Austin": ", TX, United States",
+    "New Orleans": ", LA, United States", "Las Vegas": ", NV, United States",
+    "Tokyo": ", Japan", "Paris": ", France", "Bengaluru": ", India",
+    "Madrid": ", Spain", "Barcelona": ", Spain"
+}
+CITY_REPLACEMENTS = {
+    "WA DC": "Washington, DC, United States",
+    "Dublin, Dublin": "Dublin, Ireland"
+}
+
+LOCATION_CACHE_SIZE = 10000  # Default number of raw locations remembered
+# Bump when the normalization rules change so stale sidecar files are ignored
+LOCATION_CACHE_VERSION = 1
+
+
+class LocationCache:
+    """
+    A bounded, least recently used cache of raw -> normalized locations.
+
+    Key Attributes:
+        - max_size: The number of entries kept, 0 disables the cache
+        - hits / misses: Counters of successful and failed lookups
+
+    Key Methods:
+        - get(location): Returns the cached normalized location, or None
+        - put(location, normalized): Stores a location, evicting the least
+            recently used entry when the cache is full
+        - update(entries): Stores several (location, normalized) pairs
+        - load(path) / save(path): Reads or writes the cache as a sidecar file
+        - stats(): A one line summary of the counters for the ingest logs
+    """
+
+    def __init__(self, max_size: int = LOCATION_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, location: str):
+        """
+        Looks up a raw location and marks it as recently used
+
+        :param location: The raw location of a job listing
+        :return: The normalized location, or None if it is not cached
+        """
+        if location in self.entries:
+            self.entries.move_to_end(location)
+            self.hits += 1
+            return self.entries[location]
+
+        self.misses += 1
+        return None
+
+    def put(self, location: str, normalized: str):
+        """
+        Stores a normalized location, evicting the least recently used
+        entries once the cache holds more than max_size entries
+
+        :param location: The raw location of a job listing
+        :param normalized: The normalized location
+        """
+        if self.max_size <= 0:
+            return
+
+        self.entries[location] = normalized
+        self.entries.move_to_end(location)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def update(self, entries):
+        """
+        Stores several normalized locations, in order
+
+        :param entries: An iterable of (location, normalized) pairs
+        """
+        for location, normalized in entries:
+            self.put(location, normalized)
+
+    def resize(self, max_size: int):
+        """
+        Changes the size bound of the cache, evicting entries if needed
+
+        :param max_size: The number of entries kept, 0 disables the cache
+        """
+        self.max_size = max_size
+        while len(self.entries) > max(self.max_size, 0):
+            self.entries.popitem(last=False)
+
+    def record(self, hits: int, misses: int):
+        """
+        Adds lookups counted elsewhere (i.e. by worker processes) to the counters
+
+        :param hits:
+        :param misses:
+        """
+        self.hits += hits
+        self.misses += misses
+
+    def hit_ratio(self):
+        """
+        :return: The fraction of lookups that were served from the cache
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """
+        :return: A one line summary of the cache counters
+        """
+        return (f"Location cache: {self.hits} hits, {self.misses} misses, "
+                f"{self.hit_ratio():.1%} hit ratio, {len(self)}/{self.max_size} entries")
+
+    def load(self, path: str):
+        """
+        Warms the cache from a sidecar file written by save().  Missing files
+        and files written by another version of the normalization rules are
+        ignored.
+
+        :param path: Path to the sidecar json file
+        """
+        if not os.path.exists(path):
+            return
+
+        try:
+            with open(path, "r", encoding="utf-8") as sidecar_file:
+                sidecar = json.load(sidecar_file)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading location cache {path}: {e}")
+            return
+
+        if sidecar.get("version") != LOCATION_CACHE_VERSION:
+            return
+
+        self.update(sidecar.get("entries", []))
+
+    def save(self, path: str):
+        """
+        Writes the cache, least recently used entry first, to a sidecar file
+
+        :param path: Path to the sidecar json file
+        """
+        with open(path, "w", encoding="utf-8") as sidecar_file:
+            json.dump({"version": LOCATION_CACHE_VERSION,
+                       "entries": list(self.entries.items())}, sidecar_file)
+
+
+class LocationNormalizer:
+    """
+    A table driven engine for normalizing location strings.
+
+    Every table the class uses is compiled once at module level, the only
+    per-instance state is an optional LocationCache of previous results.
+    Use the shared LOCATION_NORMALIZER instance.
+
+    Key Methods:
+        - normalize(location): Returns the normalized form of a raw location string
+            from the cache, normalizing and caching it on a miss
+        - normalize_uncached(location): Normalizes a raw location string
+    """
+
+    def __init__(self, cache: LocationCache = None):
+        self.cache = cache
+
+    def normalize(self, location: str):
+        """
+        Normalizes a raw location string, consulting the cache first
+
+        :param location: The raw location of a job listing
+        :return location: The normalized location
+        """
+        if self.cache is None:
+            return self.normalize_uncached(location)
+
+        normalized = self.cache.get(location)
+        if normalized is None:
+            normalized = self.normalize_uncached(location)
+            self.cache.put(location, normalized)
+        return normalized
+
+    def normalize_uncached(self, location: str):
+        """
+        Normalizes a raw location string, i.e. "Boston, Massachusetts 02110"
+        becomes "Boston, MA, United States"
+
+        :param location: The raw location of a job listing
+        :return location: The normalized location
+        """
+        # Remove numbers and dashes from the end of locations (zip codes)
+        location = ZIP_CODE_PATTERN.sub('', location).strip()
+
+        # Remove "USA" from the location string
+        if location.endswith(" USA"):
+            location = location.strip(" USA")
+
+        location = self.abbreviate_states(location)
+
+        # Add ", United States" to a location that ends with a state abbreviation
+        if location.strip()[-2:] in STATE_ABBREVIATION_SET:
+            location = f"{location}, United States"
+
+        # Translate non-English "United States" to English
+        if FOREIGN_UNITED_STATES_PATTERN.search(location):
+            original_location = location
+            for name in FOREIGN_UNITED_STATES:
+                if name in original_location:
+                    location = location.replace(name, "United States")
+
+        # Extract city, state, and country from a full address
+        match = CITY_STATE_COUNTRY_PATTERN.search(location)
+        if match:
+            location = f"{match.group(1)}, {match.group(2)}, {match.group(3)}"
+
+        return self.complete_city(location)
+
+    @staticmethod
+    def abbreviate_states(location: str):
+        """
+        Replaces state names with their two letter abbreviations, leaving
+        New York city and Washington, DC intact.
+
+        :param location:
+        :return location:
+        """
+        if "New York, New York" in location or "New York, NY" in location:
+            return "New York, NY, United States"
+        if "Washington, DC" in location:
+            return "Washington, DC, United States"
+        if STATE_NAME_PATTERN.search(location):
+            original_location = location
+            for state, abbreviation in STATE_ITEMS:
+                if state in original_location:
+                    location = location.replace(state, abbreviation)
+        return location
+
+    @staticmethod
+    def complete_city(location: str):
+        """
+        Completes locations that contain only a city name, and a few other
+        outliers, with a best guess state and/or country.
+
+        :param location:
+        :return location:
+        """
+        city = location.strip()
+        if "Tokyo" in location and "Japan" in location:
+            return "Tokyo, Japan"
+        if city in CITY_SUFFIXES:
+            return f"{location}{CITY_SUFFIXES[city]}"
+        return CITY_REPLACEMENTS.get(city, location)
+
+
+LOCATION_CACHE = LocationCache()
+LOCATION_NORMALIZER = LocationNormalizer(LOCATION_CACHE)
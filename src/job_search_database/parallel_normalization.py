@@ -0,0 +1,423 @@
+"""
+A module to normalize a single source json file across a pool of processes.
+
+normalize_file_parallel() is the entry point for this module.  It splits the
+source file into chunks, sends each chunk through the same normalization
+methods used by file_management.py in a separate worker process, then merges
+the results, in order, into the normalized file.  The merged file is byte for
+byte identical to the file produced by normalize_file().
+
+Every chunk is a byte range of the source file that a worker reads and
+parses for itself, the parent process never reads the source file.  Chunks
+are cut on line boundaries for the line by line format.  In streaming mode
+they are cut at even byte offsets instead, so a file holding one enormous
+json array on a single line is still spread across every worker, and each
+worker finds where the first json object (array element) of its range
+starts:
+
+    - A worker guesses that its first object starts at the first "{" at or
+      after the start of its range, and parses objects from there.  If the
+      guess was inside a nested object or a string, the parse fails before
+      long and the next "{" is tried
+    - Each worker parses every object that starts inside its range, reading
+      past the end of the range to finish the last one, and reports where
+      the first object after its range starts
+    - The parent checks the guess of each worker against the report of the
+      worker before it.  A worker that guessed wrong is run again from the
+      right offset, so the result is always that of the serial parser
+
+Each worker writes its chunk to its own shard file next to the normalized
+file, the shards are concatenated in order and then deleted.  The shards are
+also deleted if a worker fails.
+
+Each worker process keeps its own location cache.  The pool's initializer
+gives every worker the size and the entries of the parent's cache, so
+--location-cache-size and --location-cache-file reach the workers whatever
+the start method of the platform.  The hits and misses a worker counts, and
+the locations it normalizes that its cache did not hold yet, are handed back
+with each shard and added to the parent's cache.
+"""
+import codecs
+import json
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from src.job_search_database.data_normalization import normalize_json_object
+from src.job_search_database.file_management import (
+    get_file_paths, normalize_file, process_line)
+from src.job_search_database.location_normalization import LOCATION_CACHE
+
+CHUNKS_PER_WORKER = 4  # More chunks than workers keeps every worker busy until the end
+READ_SIZE = 64 * 1024  # Bytes read at a time while looking past the end of a range
+SEPARATORS = " \t\n\r,[]"  # Text between the objects of a json array, or of several
+# A decode error further than this from the end of the text is not caused by
+# the text ending part way through an object
+TRUNCATION_MARGIN = 16
+
+# What a worker hands back: the shard it wrote, the location cache lookups it
+# counted and the (location, normalized) pairs it learned.  Streaming workers
+# also return the offset their first object starts at and the offset of the
+# first object after their range.
+ShardResult = namedtuple("ShardResult",
+                         ["shard_path", "hits", "misses", "locations",
+                          "first_start", "next_start"],
+                         defaults=(None, None))
+
+_decoder = json.JSONDecoder()
+_reported_locations = set()  # Locations a worker has already handed back
+
+
+def normalize_file_parallel(file: str, is_test: bool, workers: int, streaming: bool = False):
+    """
+    Normalizes a file of JSON objects using a pool of worker processes
+
+    normalize_file_parallel() locates the source and normalized files exactly
+    like normalize_file(), splits the source into byte ranges, normalizes the
+    ranges in a ProcessPoolExecutor with one shard file per range, then merges
+    the shards in order into the normalized file.  With a single worker the
+    serial normalize_file() path is used instead.
+
+    :param file: The name of a json file (as string) containing job listings
+    :param is_test:
+    :param workers: The number of worker processes to normalize with
+    :param streaming: Split the file on json object boundaries instead of lines
+    :return normalized_file_path_obj: A path object representing the new
+        file containing normalized data.
+    """
+    if workers <= 1:
+        return normalize_file(file, is_test, streaming)
+
+    source_file, normalized_file_path_obj = get_file_paths(file, is_test)
+    if streaming:
+        byte_ranges = split_into_byte_ranges(source_file, workers * CHUNKS_PER_WORKER)
+    else:
+        byte_ranges = split_on_line_boundaries(source_file, workers * CHUNKS_PER_WORKER)
+    shards = [build_shard_path(normalized_file_path_obj, index)
+              for index in range(len(byte_ranges))]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker,
+                                 initargs=(LOCATION_CACHE.max_size,
+                                           list(LOCATION_CACHE.entries.items()))) as executor:
+            if streaming:
+                collect_element_ranges(executor, source_file, shards, byte_ranges)
+            else:
+                futures = [executor.submit(normalize_line_range, source_file, shard_path,
+                                           start, end)
+                           for shard_path, (start, end) in zip(shards, byte_ranges)]
+                for future in futures:
+                    collect_shard(future.result())
+        merge_shards(shards, normalized_file_path_obj)
+    finally:
+        # The pool is done with every shard by now, whether it succeeded or not
+        for shard_path in shards:
+            shard_path.unlink(missing_ok=True)
+
+    return normalized_file_path_obj
+
+
+def split_on_line_boundaries(source_file: Path, chunk_count: int):
+    """
+    Splits a file into byte ranges of roughly equal size that each start and
+    end on a line boundary.
+
+    :param source_file: A Path object representing a source json file
+    :param chunk_count: The number of ranges to aim for
+    :return: A list of (start, end) byte offset tuples covering the whole file
+    """
+    file_size = os.path.getsize(source_file)
+    chunk_size = max(1, file_size // max(1, chunk_count))
+    byte_ranges = []
+    start = 0
+
+    with open(source_file, "rb") as read_file:
+        while start < file_size:
+            # Jump ahead by one chunk, then move forward to the end of that line
+            read_file.seek(min(start + chunk_size, file_size) - 1)
+            read_file.readline()
+            end = read_file.tell()
+            byte_ranges.append((start, end))
+            start = end
+
+    return byte_ranges
+
+
+def split_into_byte_ranges(source_file: Path, chunk_count: int):
+    """
+    Splits a file into byte ranges of equal size, wherever they fall
+
+    :param source_file: A Path object representing a source json file
+    :param chunk_count: The number of ranges
+    :return: A list of (start, end) byte offset tuples covering the whole file
+    """
+    file_size = os.path.getsize(source_file)
+    chunk_size = max(1, -(-file_size // max(1, chunk_count)))
+    return [(start, min(start + chunk_size, file_size))
+            for start in range(0, file_size, chunk_size)]
+
+
+def collect_element_ranges(executor, source_file: Path, shards: list, byte_ranges: list):
+    """
+    Normalizes the byte ranges of a file in streaming mode, and runs a range
+    again whenever its worker guessed wrong where its first object starts.
+    A worker that stops at a malformed object reports no next start, and the
+    ranges after it are left empty, as process_json_stream() stops there too.
+
+    :param executor: A ProcessPoolExecutor to normalize the ranges with
+    :param source_file: A Path object representing a source json file
+    :param shards: The shard path of each range
+    :param byte_ranges: A list of (start, end) byte offset tuples
+    :return:
+    """
+    futures = [executor.submit(normalize_element_range, source_file, shard_path, start, end)
+               for shard_path, (start, end) in zip(shards, byte_ranges)]
+
+    next_start = 0  # Where the previous range found the first object of this one
+    for shard_path, (start, end), future in zip(shards, byte_ranges, futures):
+        if next_start is None:
+            # Like the serial parser, stop at the first malformed object, the
+            # objects of every later range are dropped
+            if not future.cancel():
+                future.exception()  # Wait for the worker to be done with its shard
+            shard_path.write_bytes(b"")
+            continue
+        result = future.result()
+        if next_start is not None and result.first_start != next_start:
+            # The locations normalized on the wrong guess are still right
+            LOCATION_CACHE.update(result.locations)
+            result = executor.submit(normalize_element_range, source_file, shard_path,
+                                     start, end, next_start).result()
+        next_start = collect_shard(result).next_start
+
+
+def collect_shard(result: ShardResult):
+    """
+    Adds the location cache lookups a worker counted for a shard to the
+    counters of this process, and the locations it learned to its cache.
+
+    :param result: A ShardResult returned by one of the worker methods
+    :return result:
+    """
+    LOCATION_CACHE.record(result.hits, result.misses)
+    LOCATION_CACHE.update(result.locations)
+    return result
+
+
+def initialize_worker(cache_size: int, locations: list):
+    """
+    Worker initializer that gives the location cache of a worker process the
+    size and the entries of the parent's cache.  Under the fork start method
+    the worker already has them, under spawn it starts from the defaults.
+
+    :param cache_size: The number of entries kept, 0 disables the cache
+    :param locations: The (location, normalized) pairs of the parent's cache
+    :return:
+    """
+    LOCATION_CACHE.entries.clear()
+    LOCATION_CACHE.resize(cache_size)
+    LOCATION_CACHE.update(locations)
+    _reported_locations.clear()
+    _reported_locations.update(LOCATION_CACHE.entries)
+
+
+def take_learned_locations():
+    """
+    A method to collect the locations the cache of this worker process
+    learned since they were last collected
+
+    :return: A list of (location, normalized) pairs
+    """
+    locations = [(location, normalized) for location, normalized in LOCATION_CACHE.entries.items()
+                 if location not in _reported_locations]
+    _reported_locations.update(location for location, _ in locations)
+    return locations
+
+
+def normalize_line_range(input_file: Path, shard_path: Path, start: int, end: int):
+    """
+    Worker method that normalizes the lines between two byte offsets of a
+    source file and writes them to a shard file.
+
+    :param input_file: Path object representing one of the original json files
+    :param shard_path: Path object representing the shard file to write
+    :param start: Byte offset of the first line to normalize
+    :param end: Byte offset just past the last line to normalize
+    :return: A ShardResult
+    """
+    hits, misses = LOCATION_CACHE.hits, LOCATION_CACHE.misses
+
+    with open(input_file, "rb") as read_file:
+        read_file.seek(start)
+        with open(shard_path, "w", encoding="utf-8") as write_file:
+            position = start
+            while position < end:
+                line = read_file.readline()
+                position += len(line)
+                process_line(input_file, line.decode("utf-8"), write_file)
+
+    return ShardResult(shard_path, LOCATION_CACHE.hits - hits, LOCATION_CACHE.misses - misses,
+                       take_learned_locations())
+
+
+def normalize_element_range(input_file: Path, shard_path: Path, start: int, end: int,
+                            first_start: int = None):
+    """
+    Worker method that normalizes the json objects starting between two byte
+    offsets of a source file and writes them to a shard file, one per line.
+
+    :param input_file: Path object representing one of the original json files
+    :param shard_path: Path object representing the shard file to write
+    :param start: Byte offset of the range
+    :param end: Byte offset just past the range
+    :param first_start: Byte offset the first object is known to start at.
+        By default it is guessed, see the module docstring
+    :return: A ShardResult with the offset of the first object, and the
+        offset of the first object after the range, None if a malformed
+        object was found
+    """
+    hits, misses = LOCATION_CACHE.hits, LOCATION_CACHE.misses
+    guessing = first_start is None and start > 0
+    candidate = start if first_start is None else first_start
+
+    with open(input_file, "rb") as read_file, \
+            open(shard_path, "w", encoding="utf-8") as write_file:
+        while True:
+            if guessing:
+                candidate = find_byte(read_file, b"{", candidate)
+            next_start = None
+            try:
+                next_start = write_normalized(read_elements(read_file, candidate, end), write_file)
+                break
+            except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+                # Objects found by a wrong guess may not be job listings at all
+                if not guessing and isinstance(e, json.JSONDecodeError):
+                    print(f"Error parsing {input_file}: {e}")
+                    break
+                if not guessing:
+                    raise
+                # The guess was wrong, try the next "{"
+                write_file.seek(0)
+                write_file.truncate()
+                candidate += 1
+
+    return ShardResult(shard_path, LOCATION_CACHE.hits - hits, LOCATION_CACHE.misses - misses,
+                       take_learned_locations(), candidate, next_start)
+
+
+def find_byte(read_file, byte: bytes, offset: int):
+    """
+    A method to find the next occurrence of a byte in a file
+
+    :param read_file: A file open in binary mode
+    :param byte: i.e. b"{"
+    :param offset: Where to start looking
+    :return: The offset of the byte, or the size of the file if there is none
+    """
+    read_file.seek(offset)
+    while True:
+        data = read_file.read(READ_SIZE)
+        if not data:
+            return offset
+        index = data.find(byte)
+        if index >= 0:
+            return offset + index
+        offset += len(data)
+
+
+def write_normalized(elements, write_file):
+    """
+    A method to normalize the json objects of a reader and write them to a
+    shard file, one per line
+
+    :param elements: A generator from read_elements()
+    :param write_file: The shard file, open for writing
+    :return: The value the generator returned, see read_elements()
+    """
+    while True:
+        try:
+            json_object = next(elements)
+        except StopIteration as stop:
+            return stop.value
+        write_file.write(json.dumps(normalize_json_object(json_object)) + "\n")
+
+
+def read_elements(read_file, start: int, end: int):
+    """
+    A generator to read the json objects that start between two byte offsets
+    of a source file, reading past the end offset to finish the last one.
+    Whitespace, commas and array brackets between the objects are skipped.
+
+    :param read_file: A file open in binary mode
+    :param start: Byte offset of the first object
+    :param end: Byte offset just past the range
+    :return: Once every object has been yielded, the byte offset of the first
+        object after the range, or the size of the file if there is none
+    """
+    read_file.seek(start)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    text = decoder.decode(read_file.read(max(0, end - start)))
+    # Objects starting at or after this character start at or after end
+    boundary = len(text)
+    boundary_offset = max(start, end) - len(decoder.getstate()[0])
+    position = 0
+    end_of_file = False
+
+    while True:
+        while position < len(text) and text[position] in SEPARATORS:
+            position += 1
+
+        if position >= boundary and (position < len(text) or end_of_file):
+            return boundary_offset + len(text[boundary:position].encode("utf-8"))
+
+        if position < len(text):
+            try:
+                json_object, object_end = _decoder.raw_decode(text, position)
+                # A number that ends with the text may continue past it
+                complete = end_of_file or object_end < len(text) or \
+                    isinstance(json_object, (dict, list))
+            except json.JSONDecodeError as e:
+                # Fail early on a bad guess, rather than reading to the end of the file
+                if end_of_file or (e.pos < len(text) - TRUNCATION_MARGIN and
+                                   not e.msg.startswith("Unterminated string")):
+                    raise
+                complete = False
+            if complete:
+                position = object_end
+                yield json_object
+                continue
+
+        # Read at least as much again as is pending
+        data = read_file.read(max(READ_SIZE, len(text) - position))
+        end_of_file = not data
+        text += decoder.decode(data, final=end_of_file)
+
+
+def build_shard_path(normalized_file_path_obj: Path, index: int):
+    """
+    A method to name the shard file that holds one chunk of normalized data,
+    "source_normalized.json" becomes "source_normalized.json.00003.shard"
+
+    :param normalized_file_path_obj: Path object representing the normalized file
+    :param index: The position of the chunk within the source file
+    :return: A Path object representing the shard file
+    """
+    return normalized_file_path_obj.with_name(f"{normalized_file_path_obj.name}.{index:05d}.shard")
+
+
+def merge_shards(shards: list, normalized_file_path_obj: Path):
+    """
+    Concatenates the shard files, in order, into the normalized file and
+    deletes each shard once it has been copied.
+
+    :param shards: A list of shard paths in the order of the source file
+    :param normalized_file_path_obj: Path object representing the normalized file
+    :return:
+    """
+    with open(normalized_file_path_obj, "wb") as write_file:
+        for shard_path in shards:
+            with open(shard_path, "rb") as shard_file:
+                shutil.copyfileobj(shard_file, write_file)
+            Path(shard_path).unlink()
@@ -0,0 +1,210 @@
+"""
+A module that defines JobLoader, a worker thread that reads the pages of the
+job listings from the database so the main window can open before they have
+been read, and BackgroundLoader, the progress bar that runs it for the main
+window.
+
+The main window never holds every job listing, it reads the pages it shows
+with get_job_page() (see job_index.py), and to read a page it needs the page
+key its previous page ended on.  The loader reads every page of a sort order
+once, from the first page or from where an earlier loader stopped, keeping
+only the page keys, so the listbox can show any page with a single query.
+
+sqlite3 connections may only be used by the thread that created them, so the
+loader opens its own connection to the database and never touches the
+connection of the Tk thread.  It puts a message on a queue for every step:
+
+    - ("total", count): The number of job listings in the database
+    - ("pages", (sort_order, page_keys, row_count, next_key)): The page keys
+        of PAGES_PER_MESSAGE more pages, see JobIndex.add_pages()
+    - ("done", None): Every page has been read
+    - ("error", message): Loading stopped because of a database error
+
+Tk widgets may only be used from the Tk thread, which polls the queue with
+after() (see BackgroundLoader.poll()) and hands each message to its widgets.
+The queue is bounded so a loader that runs ahead of the GUI waits for it.
+"""
+import queue
+import sqlite3
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+from src.job_search_gui.database_handler import JOB_PAGE_SIZE, count_jobs, get_job_page
+from src.job_search_gui.job_index import SORT_ORDERS
+
+LOAD_QUEUE_SIZE = 8  # Messages waiting for the Tk thread before the loader waits
+PUT_TIMEOUT = 0.1  # Seconds between checks for a stop request while waiting
+LOAD_POLL_MS = 50  # Milliseconds between checks of the loader queue
+MESSAGES_PER_POLL = 4  # Messages handled per check, so the window stays responsive
+PAGES_PER_MESSAGE = 10  # Page keys put on the queue at a time
+
+
+class JobLoader(threading.Thread):
+    """
+    A daemon thread that reads the pages of one sort order and puts their
+    page keys onto a queue.
+
+    Key Attributes:
+        - database_path: Path of the database file, opened by the thread itself
+        - sort_order: A key of SORT_ORDERS
+        - start_key: The page key of the first page to read, None for the
+            first page of the sort order
+        - start_rows: The number of job listings before that page, see
+            JobIndex.resume_points
+        - messages: The queue of (kind, value) messages for the Tk thread
+
+    Key Methods:
+        - start(): Starts loading, inherited from threading.Thread
+        - stop(): Asks the thread to stop, i.e. when the window is closed
+    """
+
+    def __init__(self, database_path: str, sort_order: str = "name", start: tuple = (None, 0),
+                 page_size: int = JOB_PAGE_SIZE):
+        super().__init__(daemon=True)
+        self.database_path = database_path
+        self.sort_order = sort_order
+        self.start_key, self.start_rows = start
+        self.page_size = page_size
+        self.messages = queue.Queue(maxsize=LOAD_QUEUE_SIZE)
+        self.stop_event = threading.Event()
+
+    def run(self):
+        """
+        Reads every page from the start page on, using a connection that
+        belongs to this thread
+        """
+        try:
+            database_connection = sqlite3.connect(self.database_path)
+            try:
+                if self.put(("total", count_jobs(database_connection))) and self.read_pages(
+                        database_connection):
+                    self.put(("done", None))
+            finally:
+                database_connection.close()
+
+        except sqlite3.Error as error:
+            self.put(("error", f"Database error: {error}"))
+
+    def read_pages(self, database_connection):
+        """
+        Reads the pages and puts their page keys on the queue,
+        PAGES_PER_MESSAGE at a time
+
+        :param database_connection: The connection of this thread
+        :return: False if the thread was asked to stop
+        """
+        order_by, descending = SORT_ORDERS[self.sort_order]
+        page_key, row_count = self.start_key, self.start_rows
+        page_keys = []
+
+        while True:
+            rows, next_key = get_job_page(database_connection, order_by, page_key,
+                                          self.page_size, descending)
+            if rows:  # The page after a full last page is empty
+                page_keys.append(page_key)
+                row_count += len(rows)
+            if next_key is None or len(page_keys) == PAGES_PER_MESSAGE:
+                if not self.put(("pages", (self.sort_order, page_keys, row_count, next_key))):
+                    return False
+                page_keys = []
+            if next_key is None:
+                return True
+            page_key = next_key
+
+    def put(self, message: tuple):
+        """
+        Puts a message on the queue, waiting while the queue is full
+
+        :param message: A (kind, value) tuple
+        :return: False if the thread was asked to stop while waiting
+        """
+        while not self.stop_event.is_set():
+            try:
+                self.messages.put(message, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def stop(self):
+        """
+        Asks the thread to stop loading
+        """
+        self.stop_event.set()
+
+
+class BackgroundLoader(tk.Frame):
+    """
+    A progress bar that runs a JobLoader thread and hands the page keys it
+    finds to a callback on the Tk thread.  The frame removes itself once
+    loading is finished, and stops the thread if it is destroyed first, i.e.
+    along with the window it was packed into or when the list is re-sorted.
+
+    Key Attributes:
+        - thread: The JobLoader reading the pages
+        - on_pages: Called with the (sort_order, page_keys, row_count,
+            next_key) of each "pages" message, on the Tk thread
+        - loaded: The number of job listings on the pages found so far
+
+    Key Methods:
+        - start(): Shows the progress bar and starts loading
+        - poll(): Handles the messages of the thread, scheduled with after()
+    """
+
+    def __init__(self, parent, thread: JobLoader, on_pages):
+        super().__init__(parent)
+        self.thread = thread
+        self.on_pages = on_pages
+        self.loaded = thread.start_rows
+        self.poll_id = None
+        self.label = tk.Label(self, text="Loading job listings...")
+        self.label.pack(side=tk.LEFT)
+        self.progress_bar = ttk.Progressbar(self, mode="determinate")
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(10, 0))
+
+    def start(self):
+        """
+        Shows the progress bar at the bottom of the parent and starts loading
+        """
+        self.pack(side=tk.BOTTOM, fill=tk.X, padx=10)
+        self.thread.start()
+        self.poll_id = self.after(LOAD_POLL_MS, self.poll)
+
+    def poll(self):
+        """
+        Handles the messages the thread put on its queue since the last poll,
+        then schedules the next poll until loading is finished
+        """
+        for _ in range(MESSAGES_PER_POLL):
+            try:
+                kind, value = self.thread.messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "total":
+                self.progress_bar.config(maximum=max(value, 1), value=self.loaded)
+            elif kind == "pages":
+                self.on_pages(*value)
+                self.loaded = value[2]
+                self.progress_bar.config(value=self.loaded)
+                self.label.config(text=f"Loaded {self.loaded} job listings")
+            else:
+                if kind == "error":
+                    print(value)
+                self.destroy()
+                return
+
+        self.poll_id = self.after(LOAD_POLL_MS, self.poll)
+
+    def destroy(self):
+        """
+        Stops the thread, if it is still running, and removes the progress bar.
+        A poll that is still scheduled is cancelled, so no more messages are
+        handed on once the frame is gone, i.e. after a re-sort.
+        """
+        if self.poll_id is not None:
+            self.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.thread.stop()
+        super().destroy()
@@ -0,0 +1,423 @@
+"""
+A program to generate resumes and cover letters for many job listings and
+profiles in one run, without the GUI.
+
+run_batch() is the entry point for this module.  It selects the job listings
+matching an SQL condition, pairs every one of them with every requested user
+profile, and generates the documents of each pair with generate_documents(),
+BATCH_WORKERS pairs at a time, and renders their PDFs on a PdfRenderPool
+that uses every core.  Every AI query goes through a shared
+RateLimiter, so the whole run stays under REQUESTS_PER_MINUTE, and a query
+that fails with a transient error (rate limited, unavailable, timed out) is
+retried with exponential backoff up to MAX_ATTEMPTS times.
+
+The outcome of each pair is recorded in the batch_generations table of the
+database as soon as the pair finishes.  Pairs recorded as done are skipped
+on the next run, so a run that crashed or was interrupted picks up where it
+left off; pairs that failed are tried again.  The PDFs of each profile are
+saved to their own directory, resumes_and_cover_letters/batch/<profile name>,
+with the whitespace and path separators of the profile name replaced by "_".
+
+To run (from the project root, with PYTHONPATH set to the project root):
+
+    python src/job_search_gui/batch_generation.py --profiles my_profile \
+        --where "title LIKE '%Software%' AND location LIKE '%MA%'"
+"""
+import argparse
+import functools
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable
+
+from google.api_core import exceptions as api_exceptions
+
+from src.ai_resume_builder.resume_generator import get_api_key
+from src.job_search_gui.database_handler import (
+    JOB_LISTINGS_QUERY, ROOT_DATABASE_PATH, build_job_info)
+from src.job_search_gui.document_jobs import DocumentRequest
+from src.job_search_gui.generate_resume_and_cover_letter import (
+    GENERATION_ERRORS, DocumentOptions, format_timings, generate_documents,
+    get_cached_response, query_ai, resume_and_cover_letter_directory, sanitize_filename)
+from src.job_search_gui.job_listing_popup_class import get_relevant_info
+from src.job_search_gui.pdf_render_pool import RENDER_WORKERS, PdfRenderPool
+from src.job_search_gui.profile_selection_popup_class import (
+    format_user_profile, get_contact_details)
+from src.job_search_gui.prompt_builder import PROMPT_TOKEN_BUDGET, format_prompt_tokens
+
+BATCH_WORKERS = 4  # Pairs generated at the same time
+REQUESTS_PER_MINUTE = 15  # AI queries per minute across every worker
+MAX_ATTEMPTS = 5  # Attempts per AI query before the pair fails
+BACKOFF_BASE = 2.0  # Seconds before the first retry, doubled for each retry after it
+BACKOFF_MAX = 60.0  # Longest wait between two attempts
+BATCH_DIRECTORY = os.path.join(resume_and_cover_letter_directory, "batch")
+
+# Errors worth retrying: the request may succeed if it is sent again later
+TRANSIENT_ERRORS = (
+    api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable, api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError, TimeoutError, ConnectionError
+)
+
+
+@dataclass
+class QueryPolicy:
+    """
+    How often the AI is queried, and how failed queries are retried.
+
+    Key Attributes:
+        - requests_per_minute: The most AI queries started per minute
+        - max_attempts: Attempts per AI query before the pair fails
+        - backoff_base: Seconds before the first retry of a query
+    """
+    requests_per_minute: float = REQUESTS_PER_MINUTE
+    max_attempts: int = MAX_ATTEMPTS
+    backoff_base: float = BACKOFF_BASE
+
+
+@dataclass
+class BatchOptions:
+    """
+    How run_batch() generates the documents of its pairs.
+
+    Key Attributes:
+        - workers: The number of pairs generated at the same time
+        - query_policy: The QueryPolicy of every AI query of the run
+        - output_directory: The PDFs of each profile are saved to a
+            directory named after the profile inside this directory
+        - query_function: The function that queries the AI, query_ai() by default
+        - use_cache: Set to False to bypass the AI response cache of query_ai()
+        - render_workers: Processes rendering PDFs, 0 to render them on the
+            worker threads instead
+        - token_budget: The most tokens an AI query may take, None for no limit
+    """
+    workers: int = BATCH_WORKERS
+    query_policy: QueryPolicy = field(default_factory=QueryPolicy)
+    output_directory: str = BATCH_DIRECTORY
+    query_function: Callable = None
+    use_cache: bool = True
+    render_workers: int = RENDER_WORKERS
+    token_budget: int = PROMPT_TOKEN_BUDGET
+
+
+class RateLimiter:
+    """
+    Spaces calls evenly so that no more than a given number start per minute,
+    across every thread that shares the limiter.
+
+    Key Methods:
+        - reserve(): Reserves the next free start time
+        - acquire(): Waits until the next call may start
+    """
+
+    def __init__(self, requests_per_minute: float, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self.next_start = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Reserves the next free start time
+
+        :return: Seconds until the reserved start time
+        """
+        with self.lock:
+            now = self.clock()
+            start = max(self.next_start, now)
+            self.next_start = start + self.interval
+        return start - now
+
+    def acquire(self):
+        """
+        Reserves the next free start time, then waits for it
+        """
+        delay = self.reserve()
+        if delay > 0:
+            self.sleep(delay)
+
+
+def backoff_delay(attempt: int, backoff_base: float = BACKOFF_BASE):
+    """
+    Exponential backoff with jitter, so workers that failed together do not
+    retry together
+
+    :param attempt: The number of attempts made so far, starting at 1
+    :param backoff_base: Seconds before the first retry
+    :return: Seconds to wait before the next attempt
+    """
+    delay = min(BACKOFF_MAX, backoff_base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def build_query_function(rate_limiter: RateLimiter, max_attempts: int = MAX_ATTEMPTS,
+                         backoff_base: float = BACKOFF_BASE, query_function=None,
+                         use_cache: bool = True):
+    """
+    Wraps an AI query function so that every attempt waits for the rate
+    limiter and transient errors are retried with exponential backoff.
+    With query_ai(), a query is first looked up in the AI response cache,
+    and only a query that misses it waits for the rate limiter.
+
+    :param rate_limiter: The RateLimiter shared by every worker
+    :param max_attempts: Attempts per query before the error is raised
+    :param backoff_base: Seconds before the first retry
+    :param query_function: The function that queries the AI, query_ai() by default
+    :param use_cache: Set to False to bypass the AI response cache of
+        query_ai().  Ignored with a query_function
+    :return: A function with the signature of query_ai()
+    """
+    check_cache = query_function is None and use_cache
+    if query_function is None:
+        query_function = functools.partial(query_ai, use_cache=use_cache)
+
+    def query(api_key, query_text, timeout=None):
+        if check_cache:
+            cached_response = get_cached_response(query_text)
+            if cached_response is not None:
+                return cached_response
+        last_error = None
+        for attempt in range(1, max(max_attempts, 1) + 1):
+            if attempt > 1:
+                delay = backoff_delay(attempt - 1, backoff_base)
+                print(f"Transient error ({last_error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+            rate_limiter.acquire()
+            try:
+                return query_function(api_key, query_text, timeout=timeout)
+            except TRANSIENT_ERRORS as error:
+                last_error = error
+        raise last_error
+
+    return query
+
+
+def create_batch_table(connection: sqlite3.Connection):
+    """
+    Creates the table that records the outcome of each job listing and
+    profile pair
+
+    :param connection: A connection to the job listings database
+    :return:
+    """
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS batch_generations (
+            job_id TEXT,
+            profile_name TEXT,
+            status TEXT,
+            detail TEXT,
+            finished_at TEXT,
+            PRIMARY KEY (job_id, profile_name)
+        )
+    """)
+    connection.commit()
+
+
+def get_finished_pairs(connection: sqlite3.Connection):
+    """
+    :param connection: A connection to the job listings database
+    :return: A set of the (job id, profile name) pairs already generated
+    """
+    rows = connection.execute(
+        "SELECT job_id, profile_name FROM batch_generations WHERE status = 'done'")
+    return set(rows.fetchall())
+
+
+def record_pair(connection: sqlite3.Connection, job_id: str, profile_name: str,
+                status: str, detail: str):
+    """
+    Records the outcome of a pair, committing it right away so it survives
+    a crash
+
+    :param connection: A connection to the job listings database
+    :param job_id:
+    :param profile_name:
+    :param status: "done" or "failed"
+    :param detail: The timing breakdown, or the error
+    :return:
+    """
+    connection.execute("""
+        INSERT OR REPLACE INTO batch_generations (
+            job_id, profile_name, status, detail, finished_at
+        )
+        VALUES (?, ?, ?, ?, datetime('now'))
+    """, (job_id, profile_name, status, detail))
+    connection.commit()
+
+
+def select_jobs(connection: sqlite3.Connection, where: str):
+    """
+    Selects the job listings matching an SQL condition
+
+    :param connection: A connection to the job listings database
+    :param where: i.e. "title LIKE '%Python%'"
+    :return: A dictionary of job info keyed by job id
+    """
+    rows = connection.execute(f"{JOB_LISTINGS_QUERY} WHERE {where} ORDER BY id")
+    return {row[0]: build_job_info(row) for row in rows.fetchall()}
+
+
+def select_profiles(connection: sqlite3.Connection, profile_names: list):
+    """
+    Looks up user profiles by profile name
+
+    :param connection: A connection to the job listings database
+    :param profile_names:
+    :return: A dictionary of user_profiles rows keyed by profile name
+    """
+    profiles = {}
+    for profile_name in profile_names:
+        row = connection.execute("SELECT * FROM user_profiles WHERE profile_name = ?",
+                                 (profile_name,)).fetchone()
+        if row is None:
+            print(f"Profile {profile_name} not found, skipped")
+            continue
+        profiles[profile_name] = row
+    return profiles
+
+
+def run_batch(database_path: str, where: str, profile_names: list,
+              options: BatchOptions = None):
+    """
+    Generates a resume and cover letter for every pair of a matching job
+    listing and a requested profile that has not been generated yet
+
+    :param database_path: .db path to the job listings database
+    :param where: An SQL condition on the job_listings columns
+    :param profile_names: The profile names to generate documents for
+    :param options: The BatchOptions of the run, the defaults if None
+    :return summary: A dictionary with the number of pairs done, skipped
+        (done by an earlier run) and failed
+    """
+    options = options or BatchOptions()
+    connection = sqlite3.connect(database_path)
+    render_pool = None
+    try:
+        create_batch_table(connection)
+        job_listings = select_jobs(connection, where)
+        profiles = select_profiles(connection, profile_names)
+        finished_pairs = get_finished_pairs(connection)
+
+        pairs = [(job_id, profile_name) for job_id in job_listings
+                 for profile_name in profiles]
+        pending_pairs = [pair for pair in pairs if pair not in finished_pairs]
+        summary = {"done": 0, "skipped": len(pairs) - len(pending_pairs), "failed": 0}
+        print(f"{len(pairs)} pairs, {summary['skipped']} already generated")
+
+        get_api_key()  # Asks for the api key now, rather than from a worker thread
+        if options.render_workers:
+            render_pool = PdfRenderPool(options.render_workers, options.output_directory)
+        generate_pair = build_pair_generator(job_listings, profiles, options, render_pool)
+        generate_pairs(connection, pending_pairs, generate_pair, options.workers, summary)
+    finally:
+        if render_pool is not None:
+            render_pool.shutdown()
+        connection.close()
+
+    print(f"{summary['done']} generated, {summary['skipped']} skipped, "
+          f"{summary['failed']} failed")
+    return summary
+
+
+def build_pair_generator(job_listings: dict, profiles: dict, options: BatchOptions,
+                         render_pool: PdfRenderPool = None):
+    """
+    Builds the function that generates the documents of one pair, with every
+    AI query going through one rate limited, retrying query function
+
+    :param job_listings: A dictionary of job info keyed by job id
+    :param profiles: A dictionary of user_profiles rows keyed by profile name
+    :param options: The BatchOptions of the run
+    :param render_pool: The PdfRenderPool the PDFs are rendered in, if any
+    :return: A function of a job id and a profile name returning the result
+        of generate_documents()
+    """
+    policy = options.query_policy
+    query = build_query_function(RateLimiter(policy.requests_per_minute), policy.max_attempts,
+                                 policy.backoff_base, options.query_function, options.use_cache)
+
+    def generate_pair(job_id, profile_name):
+        job_info = job_listings[job_id]
+        profile = profiles[profile_name]
+        request = DocumentRequest(job_info["job_title"], job_info["company"],
+                                  get_relevant_info(job_info), profile_name,
+                                  format_user_profile(profile), get_contact_details(profile))
+        output_directory = os.path.join(options.output_directory,
+                                        sanitize_filename(profile_name))
+        return generate_documents(request, options=DocumentOptions(
+            query_function=query, output_directory=output_directory,
+            render_pool=render_pool, token_budget=options.token_budget))
+
+    return generate_pair
+
+
+def generate_pairs(connection: sqlite3.Connection, pairs: list, generate_pair,
+                   workers: int, summary: dict):
+    """
+    Generates pairs on a pool of worker threads, recording the outcome of
+    each pair as soon as it finishes
+
+    :param connection: A connection to the job listings database
+    :param pairs: The (job id, profile name) pairs to generate
+    :param generate_pair: A function returned by build_pair_generator()
+    :param workers: The number of pairs generated at the same time
+    :param summary: The counts of done and failed pairs, updated in place
+    :return:
+    """
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(generate_pair, *pair): pair for pair in pairs}
+        for future in as_completed(futures):
+            job_id, profile_name = futures[future]
+            try:
+                result = future.result()
+            except GENERATION_ERRORS as error:  # Recorded, and tried again next run
+                summary["failed"] += 1
+                record_pair(connection, job_id, profile_name, "failed", str(error))
+                print(f"Failed {job_id} for {profile_name}: {error}")
+                continue
+            timings = format_timings(result["timings"])
+            summary["done"] += 1
+            record_pair(connection, job_id, profile_name, "done", timings)
+            print(f"Generated {job_id} for {profile_name} in {timings}, "
+                  f"{format_prompt_tokens(result['prompt_tokens'])}")
+    finally:
+        # On an interrupt, drop the pairs that have not started
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main(argv=None):
+    """
+    Program entry
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate resumes and cover letters for many job listings and profiles")
+    parser.add_argument("--profiles", nargs="+", required=True,
+                        help="profile names to generate documents for")
+    parser.add_argument("--where", default="1",
+                        help="SQL condition selecting job listings, every job listing by default")
+    parser.add_argument("--database", default=ROOT_DATABASE_PATH)
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--requests-per-minute", type=float, default=REQUESTS_PER_MINUTE)
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS,
+                        help="processes rendering PDFs, 0 to render on the worker threads")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always query the AI instead of reusing cached responses")
+    parser.add_argument("--token-budget", type=int, default=PROMPT_TOKEN_BUDGET,
+                        help="the most tokens an AI query may take, 0 for no limit")
+    arguments = parser.parse_args(argv)
+
+    query_policy = QueryPolicy(arguments.requests_per_minute, arguments.max_attempts)
+    run_batch(arguments.database, arguments.where, arguments.profiles, BatchOptions(
+        workers=arguments.workers, query_policy=query_policy, use_cache=not arguments.no_cache,
+        render_workers=arguments.render_workers, token_budget=arguments.token_budget or None))
+
+
+if __name__ == "__main__":
+    main()
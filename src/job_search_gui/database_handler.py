@@ -1,9 +1,132 @@
 """
 A module for connecting to an SQL database and making basic queries
+
+The SQL issued by the GUI and by this module is kept in the constants below so
+that explain_query_plans() can run EXPLAIN QUERY PLAN over every one of them
+and flag the queries that still scan a whole table instead of using an index,
+or, if they only want some of the rows, scan anything instead of searching.
+
+iter_job_chunks() reads the job listings JOB_CHUNK_SIZE rows at a time, so the
+GUI can start showing job listings before all of them have been read.
+
+get_job_page() pages through the job listings with keyset pagination: each
+page holds only the (id, title, location) of JOB_PAGE_SIZE job listings and
+the next page starts right after the last (sort value, id) of the previous
+one.  The page query bounds the sort value on its own as well as the (sort
+value, id) pair, so SQLite searches the idx_job_listings_*_key index for the
+start of the page instead of walking the index from its first entry.  A
+missing (NULL) title or location sorts as an empty string, a NULL would
+never compare greater than the page key.  get_job_by_id() fetches the full
+record of a single job.
+
+search_jobs() runs keyword searches against job_listings_fts, the FTS5 full
+text index built by populate_database(), and returns the matches ranked by
+bm25 with a highlighted snippet of each description.
 """
+import os
+import re
 import sqlite3
 from sqlite3 import Connection
 
+DATA_BASE_PATH = "job_listings.db"
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIRECTORY = os.path.abspath(os.path.join(SCRIPT_DIRECTORY, "../../"))
+ROOT_DATABASE_PATH = os.path.join(ROOT_DIRECTORY, DATA_BASE_PATH)
+
+JOB_LISTINGS_QUERY = """
+    SELECT id, 
+           title, 
+           company, 
+           location, 
+           date_posted, 
+           description, 
+           employment_type, 
+           interval, 
+           compensation, 
+           job_url 
+    FROM job_listings
+"""
+
+JOB_BY_ID_QUERY = JOB_LISTINGS_QUERY + "    WHERE id = ?\n"
+
+JOB_COUNT_QUERY = "SELECT COUNT(*) FROM job_listings"
+
+JOB_CHUNK_SIZE = 1000  # Default number of job listings per chunk
+JOB_PAGE_SIZE = 100  # Default number of job listings per page
+JOB_PAGE_ORDERS = ("title", "location")  # Columns a page can be ordered by
+
+
+def build_page_query(order_by: str, descending: bool, first_page: bool):
+    """
+    Builds the keyset pagination query for one ordering of the job listings
+
+    :param order_by: One of JOB_PAGE_ORDERS
+    :param descending: Order from Z to A instead of A to Z
+    :param first_page: Leave out the condition that skips the previous pages
+    :return: The SQL query
+    """
+    direction, bound, comparison = ("DESC", "<=", "<") if descending else ("ASC", ">=", ">")
+    # Matches the expression of the idx_job_listings_*_key indexes
+    sort_key = f"COALESCE({order_by}, '')"
+    # SQLite cannot seek an index on a row value comparison alone, the
+    # leading bound on the sort key turns the scan into a search
+    after = "" if first_page else \
+        f"WHERE {sort_key} {bound} ?1 AND ({sort_key}, id) {comparison} (?1, ?2)"
+    return f"""
+    SELECT id, title, location
+    FROM job_listings
+    {after}
+    ORDER BY {sort_key} {direction}, id {direction}
+    LIMIT ?{"1" if first_page else "3"}
+"""
+
+
+# Page queries keyed by (order_by, descending, first_page)
+JOB_PAGE_QUERIES = {
+    (order_by, descending, first_page): build_page_query(order_by, descending, first_page)
+    for order_by in JOB_PAGE_ORDERS for descending in (False, True) for first_page in (False, True)
+}
+
+PROFILE_NAMES_QUERY = "SELECT profile_name FROM user_profiles"
+
+PROFILE_BY_NAME_QUERY = "SELECT * FROM user_profiles WHERE profile_name = ?"
+
+SEARCH_LIMIT = 50  # Default number of search results returned
+# bm25 weights of the title, company and description columns
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+SEARCH_TOKEN_PATTERN = re.compile(r"\w+")
+
+SEARCH_QUERY = f"""
+    SELECT job_listings.id,
+           job_listings.title,
+           job_listings.company,
+           job_listings.location,
+           snippet(job_listings_fts, 2, '[', ']', '...', 16),
+           bm25(job_listings_fts, {", ".join(str(weight) for weight in SEARCH_WEIGHTS)}) AS rank
+    FROM job_listings_fts
+    JOIN job_listings ON job_listings.rowid = job_listings_fts.rowid
+    WHERE job_listings_fts MATCH ?
+    ORDER BY rank
+    LIMIT ?
+"""
+
+# Queries that only want some of the rows, these must search an index
+SELECTIVE_QUERY_PATTERN = re.compile(r"\b(?:WHERE|LIMIT)\b", re.IGNORECASE)
+
+# Every query issued by the GUI and this module, with sample parameters
+# used when explaining its query plan
+GUI_QUERIES = {
+    "get_jobs_from_database": (JOB_LISTINGS_QUERY, ()),
+    "get_job_by_id": (JOB_BY_ID_QUERY, ("",)),
+    "get_job_page(title)": (JOB_PAGE_QUERIES["title", False, False], ("", "", 1)),
+    "get_job_page(title, descending)": (JOB_PAGE_QUERIES["title", True, False], ("", "", 1)),
+    "get_job_page(location)": (JOB_PAGE_QUERIES["location", False, False], ("", "", 1)),
+    "get_job_page(location, descending)":
+        (JOB_PAGE_QUERIES["location", True, False], ("", "", 1)),
+    "ProfileSelectionPopup.fetch_profiles": (PROFILE_NAMES_QUERY, ()),
+    "ProfileSelectionPopup.on_select": (PROFILE_BY_NAME_QUERY, ("",))
+}
+
 
 def create_database_connection(database_path: str):
     """
@@ -23,36 +146,197 @@ def get_jobs_from_database(database_connection: Connection):
     :param database_connection:
     :return job_listings:
     """
-    cursor = database_connection.cursor()
-    cursor.execute("""
-        SELECT id, 
-               title, 
-               company, 
-               location, 
-               date_posted, 
-               description, 
-               employment_type, 
-               interval, 
-               compensation, 
-               job_url 
-        FROM job_listings
-        """
-                   )
     job_listings = {}  # Create a dictionary to hold job data
 
-    rows = cursor.fetchall()
+    for job_chunk in iter_job_chunks(database_connection):
+        job_listings.update(job_chunk)
+
+    return job_listings
+
+
+def iter_job_chunks(database_connection: Connection, chunk_size: int = JOB_CHUNK_SIZE):
+    """
+    A method to retrieve all job listings and associated data in chunks
+
+    :param database_connection:
+    :param chunk_size: The maximum number of job listings per chunk
+    :return: An iterator of dictionaries of job info keyed by job id
+    """
+    cursor = database_connection.cursor()
+    cursor.execute(JOB_LISTINGS_QUERY)
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield {row[0]: build_job_info(row) for row in rows}
+
+
+def build_job_info(row: tuple):
+    """
+    Builds the dictionary of job info the GUI works with from a row of
+    JOB_LISTINGS_QUERY
+
+    :param row:
+    :return job_info:
+    """
+    return {
+        "job_title": row[1],
+        "company": row[2],
+        "location": row[3],
+        "date_posted": row[4],
+        "description": row[5],
+        "employment_type": row[6],
+        "interval": row[7],
+        "compensation": row[8],
+        "job_url": row[9]
+    }
+
+
+def count_jobs(database_connection: Connection):
+    """
+    :param database_connection:
+    :return: The number of job listings in the database
+    """
+    return database_connection.execute(JOB_COUNT_QUERY).fetchone()[0]
+
+
+def get_job_page(database_connection: Connection, order_by: str = "title", after: tuple = None,
+                 page_size: int = JOB_PAGE_SIZE, descending: bool = False):
+    """
+    A method to retrieve one page of lightweight job listing rows.
+
+    Pass the page key returned with a page as after to retrieve the page
+    that follows it.
+
+    :param database_connection:
+    :param order_by: "title" or "location"
+    :param after: The page key of the previous page, None for the first page
+    :param page_size: The maximum number of rows in the page
+    :param descending: Order from Z to A instead of A to Z
+    :return: A tuple (rows, page key).  rows is a list of (id, title, location)
+        tuples, the page key is None once the last page has been reached
+    """
+    if order_by not in JOB_PAGE_ORDERS:
+        raise ValueError(f"Cannot order job listings by {order_by}")
+
+    query = JOB_PAGE_QUERIES[order_by, descending, after is None]
+    parameters = (page_size,) if after is None else (*after, page_size)
+    rows = database_connection.execute(query, parameters).fetchall()
+
+    if len(rows) < page_size:
+        return rows, None
+
+    last_row = rows[-1]
+    sort_value = last_row[1] if order_by == "title" else last_row[2]
+    return rows, (sort_value or "", last_row[0])
+
+
+def get_job_by_id(database_connection: Connection, job_id: str):
+    """
+    A method to retrieve the full record of a single job listing
+
+    :param database_connection:
+    :param job_id:
+    :return job_info: A dictionary of job info, or None if there is no job
+        listing with that id
+    """
+    row = database_connection.execute(JOB_BY_ID_QUERY, (job_id,)).fetchone()
+    return None if row is None else build_job_info(row)
+
+
+def build_match_expression(search_text: str):
+    """
+    Turns free text typed by a user into an FTS5 MATCH expression.  Each word
+    is quoted so punctuation and FTS5 operators in the text are searched for
+    literally, every word must match, and the last word also matches as a
+    prefix so results show up while a word is still being typed.
+
+    :param search_text: i.e. "python dev"
+    :return: i.e. '"python" "dev"*', or None if the text holds no words
+    """
+    tokens = SEARCH_TOKEN_PATTERN.findall(search_text)
+    if not tokens:
+        return None
+
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
 
+def search_jobs(database_connection: Connection, search_text: str, limit: int = SEARCH_LIMIT):
+    """
+    A method to search the title, company and description of every job
+    listing for keywords.
+
+    :param database_connection:
+    :param search_text: The keywords to search for
+    :param limit: The maximum number of matches returned
+    :return search_results: A list of dictionaries, best match first, each
+        holding the job id, title, company, location, a snippet of the
+        description with the matched words in [brackets], and the bm25 rank
+    """
+    match_expression = build_match_expression(search_text)
+    if match_expression is None:
+        return []
+
+    try:
+        cursor = database_connection.cursor()
+        cursor.execute(SEARCH_QUERY, (match_expression, limit))
+        rows = cursor.fetchall()
+    except sqlite3.Error as error:
+        print(f"Database error: {error}")
+        return []
+
+    search_results = []
     for row in rows:
-        job_listings[row[0]] = {
+        search_results.append({
+            "id": row[0],
             "job_title": row[1],
             "company": row[2],
             "location": row[3],
-            "date_posted": row[4],
-            "description": row[5],
-            "employment_type": row[6],
-            "interval": row[7],
-            "compensation": row[8],
-            "job_url": row[9]
-        }
+            "snippet": row[4],
+            "rank": row[5]
+        })
 
-    return job_listings
+    return search_results
+
+
+def explain_query_plans(database_connection: Connection, queries: dict = None):
+    """
+    A diagnostic that runs EXPLAIN QUERY PLAN on each query and flags the
+    queries that scan a whole table without the help of an index, and the
+    keyed, filtered or paged queries that scan at all.
+
+    :param database_connection:
+    :param queries: A dictionary of {name: (query, parameters)}, defaults to
+        GUI_QUERIES
+    :return query_plans: A dictionary of {name: (plan details, flagged)}
+    """
+    cursor = database_connection.cursor()
+    query_plans = {}
+
+    for name, (query, parameters) in (queries or GUI_QUERIES).items():
+        cursor.execute(f"EXPLAIN QUERY PLAN {query}", parameters)
+        details = [row[3] for row in cursor.fetchall()]
+        # "SCAN ... USING INDEX" still reads every entry of the index, which
+        # is only fine for a query that lists the whole table.  A keyed,
+        # filtered or paged query has to "SEARCH" an index instead
+        selective = SELECTIVE_QUERY_PATTERN.search(query) is not None
+        flagged = any(detail.startswith("SCAN") and (selective or "USING" not in detail)
+                      for detail in details)
+        query_plans[name] = (details, flagged)
+
+    return query_plans
+
+
+def print_query_plan_report(database_connection: Connection):
+    """
+    Prints the query plan of every GUI query, marking the ones that still
+    scan a table, or scan where they should search an index
+
+    :param database_connection:
+    :return:
+    """
+    for name, (details, flagged) in explain_query_plans(database_connection).items():
+        print(f"{'SCAN' if flagged else 'ok':<10} {name}: {'; '.join(details)}")
@@ -0,0 +1,184 @@
+"""
+A module for generating resumes and cover letters in the background, so the
+GUI stays responsive during the AI queries and PDF rendering.
+
+DocumentJobManager is the entry point for this module.  The GUI describes each
+resume and cover letter it wants as a DocumentJob and submits it to the
+shared DOCUMENT_JOBS manager, which queues it on a small thread pool and runs
+generate_documents() for it.  Tk widgets may only be used from the Tk thread,
+so a running job never touches the GUI: it puts (job, status, description)
+messages on the queue it was submitted with, and the window that submitted it
+polls that queue with after().
+
+A job that is still queued is cancelled outright.  A job that is already
+running stops reading the responses the AI streams to it at their next chunk,
+and stops before any step it has not started yet.
+"""
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from src.job_search_gui.generate_resume_and_cover_letter import (
+    GENERATION_ERRORS, DocumentOptions, format_timings, generate_documents)
+from src.job_search_gui.prompt_builder import format_prompt_tokens
+
+MAX_DOCUMENT_WORKERS = 2  # Jobs generated at the same time, the rest wait in the queue
+
+# Job statuses, in the order a job moves through them
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+FINISHED_STATUSES = (DONE, CANCELLED, FAILED)
+
+# Everything generate_documents() reads about a job listing and profile: the
+# job listing, the user profile, and the ContactDetails drawn in the header
+# of the PDFs
+DocumentRequest = namedtuple(
+    "DocumentRequest",
+    ["job_title", "company", "relevant_job_info", "profile_name", "user_profile",
+     "contact_details"],
+    defaults=(None,))
+
+
+class DocumentJob:
+    """
+    A request for a resume and cover letter for one job listing and profile.
+
+    The job keeps its own copy of everything generate_documents() reads, so
+    the window it came from can be closed while it runs.
+
+    Key Attributes:
+        - request: The DocumentRequest of the job listing and profile, with
+            the ContactDetails of the profile
+        - options: The DocumentOptions passed to generate_documents().  The
+            GUI renders each response as it streams in by default
+        - status: One of QUEUED, RUNNING, DONE, CANCELLED or FAILED
+        - result: The dictionary returned by generate_documents(), with the
+            timing breakdown of the job, once it has run
+
+    Key Methods:
+        - cancel(): Cancels the job, or stops it at its next step
+        - describe(): A one line description for the GUI
+    """
+
+    def __init__(self, request: DocumentRequest, options: DocumentOptions = None):
+        self.request = request
+        self.options = options or DocumentOptions(stream=True)
+        self.status = QUEUED
+        self.result = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        """
+        Cancels the job.  A queued job is removed from the queue, a running
+        job stops at its next step or streamed chunk.
+        """
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def describe(self):
+        """
+        :return: i.e. "Software Engineer at Acme (my_profile)"
+        """
+        request = self.request
+        return f"{request.job_title} at {request.company} ({request.profile_name})"
+
+
+class DocumentJobManager:
+    """
+    Runs DocumentJobs on a thread pool and reports on them through queues.
+
+    Key Methods:
+        - submit(job, messages): Queues a job, its progress is put on messages
+        - cancel_all(): Cancels every job that has not finished
+    """
+
+    def __init__(self, max_workers: int = MAX_DOCUMENT_WORKERS, generate=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="document_job")
+        self.generate = generate or generate_documents
+        self.jobs = []
+        self.lock = threading.Lock()
+
+    def submit(self, job: DocumentJob, messages: queue.Queue):
+        """
+        Queues a job.  (job, status, description) messages are put on the
+        messages queue as the job starts, progresses and finishes.
+
+        :param job: The DocumentJob to run
+        :param messages: The queue the submitting window polls
+        :return job:
+        """
+        with self.lock:
+            self.jobs = [other for other in self.jobs if other.status not in FINISHED_STATUSES]
+            self.jobs.append(job)
+
+        def report_cancelled(future):
+            # A job cancelled while still queued never reaches run()
+            if future.cancelled():
+                self.finish(job, messages, CANCELLED, "Cancelled")
+
+        messages.put((job, QUEUED, "Waiting to start"))
+        job.future = self.executor.submit(self.run, job, messages)
+        job.future.add_done_callback(report_cancelled)
+        return job
+
+    def run(self, job: DocumentJob, messages: queue.Queue):
+        """
+        Worker method that generates the documents of a job
+
+        :param job:
+        :param messages:
+        """
+        if job.cancel_event.is_set():
+            self.finish(job, messages, CANCELLED, "Cancelled")
+            return
+
+        job.status = RUNNING
+        try:
+            job.result = self.generate(
+                job.request, job.cancel_event,
+                lambda description: messages.put((job, RUNNING, description)), job.options)
+        except GENERATION_ERRORS as error:  # i.e. from the AI service, fails only this job
+            self.finish(job, messages, FAILED, f"Failed: {error}")
+            return
+
+        if job.result["completed"]:
+            description = ("Resume and cover letter saved in "
+                           f"{format_timings(job.result['timings'])}")
+            if job.result.get("prompt_tokens"):
+                description += f", {format_prompt_tokens(job.result['prompt_tokens'])}"
+            self.finish(job, messages, DONE, description)
+        else:
+            self.finish(job, messages, CANCELLED, "Cancelled")
+
+    @staticmethod
+    def finish(job: DocumentJob, messages: queue.Queue, status: str, description: str):
+        """
+        Records the final status of a job and reports it
+
+        :param job:
+        :param messages:
+        :param status: DONE, CANCELLED or FAILED
+        :param description:
+        """
+        job.status = status
+        messages.put((job, status, description))
+
+    def cancel_all(self):
+        """
+        Cancels every job that has not finished yet
+        """
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            if job.status not in FINISHED_STATUSES:
+                job.cancel()
+
+
+DOCUMENT_JOBS = DocumentJobManager()
@@ -10,20 +10,41 @@ Key Methods:
       fetches user_profile, job_listing, api_key, and the relevant queries,
       then calls two helper functions (listed below) to make a query to
       Google Gemini AI and convert that feedback to a PDF to be stored in
-      the resume_and_cover_letters directory
+      the resume_and_cover_letters directory.  The resume and the cover
+      letter are generated concurrently and the time taken by each step
+      is returned.
     - query_ai(api_key, query): Sends a query to Google Gemini AI to generate
       content and return a response.
     - generate_pdf(): Formats the AI generated content into a structured, readable
       format, then saves the PDF to resume_and_cover_letters.
+    - query_ai_stream() / generate_pdf_stream(): The streaming path.  The
+      response is laid out line by line as it arrives, so the first page is
+      ready long before the response is complete and the response is never
+      held in memory as a whole.  Cached responses are served, but streamed
+      responses are not added to the cache.
 """
 
 import os
 import re
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from dataclasses import dataclass
+from typing import Callable
 import google.generativeai as genai
-import markdown
+from google.api_core import exceptions as api_exceptions
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
+from src.ai_resume_builder.ai_client import AI_CLIENT, AI_MODEL_NAME
+from src.ai_resume_builder.response_cache import AI_RESPONSE_CACHE, CachedResponse
 from src.ai_resume_builder.resume_generator import get_api_key
+from src.job_search_gui.markdown_blocks import MarkdownConverter, markdown_to_blocks
+from src.job_search_gui.pdf_layout import (
+    MARGIN_TOP, LayoutEngine, define_header, draw_page, layout_blocks, layout_header)
+from src.job_search_gui.prompt_builder import PROMPT_TOKEN_BUDGET, build_prompts, format_query
 
 
 # ...\AJanedy_Comp490_002_Sprints\src\job_search_gui
@@ -31,41 +52,279 @@ script_directory = os.path.dirname(os.path.abspath(__file__))
 # \AJanedy_Comp490_002_Sprints\src\ai_resume_builder\resumes_and_cover_letters
 resume_and_cover_letter_directory = os.path.join(script_directory, "resumes_and_cover_letters")
 
-# Constants for layout.
-# This is an extension of the AI assisted code from pdf_formatting()
-MARGIN_LEFT = 40
-MARGIN_TOP = 750
-LINE_HEIGHT = 12  # Spacing between lines
-PAGE_HEIGHT = letter[1]
-PARAGRAPH_SPACING = 10
-BOTTOM_MARGIN = 50  # Margin before starting a new page
-MAX_WIDTH = 520  # Max text width before wrapping
+AI_TIMEOUT = 120  # Seconds an AI query may take
+DOCUMENT_TIMEOUT = 180  # Seconds a document may take, AI query and PDF together
+DOCUMENT_THREAD_PREFIX = "document"  # Name prefix of the threads generating documents
+UNSAFE_FILENAME_PATTERN = re.compile(r"[\s/\\]")  # Replaced by "_" in file names
+DOCUMENT_NAMES = {"resume": "Resume", "cover_letter": "Cover letter"}
+# Closes the queries of a profile whose contact header is drawn from its
+# contact details, see pdf_layout.layout_header()
+CONTACT_HEADER_NOTE = ("Do not start the document with my name and contact details, "
+                       "they are added above it separately.")
+RESUME_PROMPT = ("Given the job description and the information I have "
+                 "provided about myself, please write me a sample resume "
+                 "in markdown format that is specifically designed around "
+                 "my skills and the job description provided.")
+COVER_LETTER_PROMPT = ("Given the job description and the information I have "
+                       "provided about myself, please write me a sample cover letter "
+                       "in markdown format that is specifically designed around "
+                       "my skills and the job description provided.")
+DOCUMENT_PROMPTS = {"resume": RESUME_PROMPT, "cover_letter": COVER_LETTER_PROMPT}
+
+GENERATION_PARAMETERS = {}  # Passed to the model, part of the response cache key
+
+# Errors generating the documents of a job listing and profile can fail with:
+# errors of the AI service, responses it refused or cut short, timeouts, and
+# PDFs that could not be laid out, rendered or written
+GENERATION_ERRORS = (
+    api_exceptions.GoogleAPIError, genai.types.BlockedPromptException,
+    genai.types.StopCandidateException, genai.types.IncompleteIterationError,
+    TimeoutError, ValueError, OSError, BrokenExecutor
+)
+
+
+@dataclass
+class DocumentOptions:
+    """
+    How generate_documents() generates the documents of a job listing and
+    profile.
+
+    Key Attributes:
+        - query_function: The function that queries the AI, query_ai() by
+            default.  The batch mode passes a rate limited, retrying wrapper
+        - output_directory: The directory the PDFs are saved to,
+            resumes_and_cover_letters by default
+        - stream: Set to True to render each response as it is streamed.
+            Ignored with a query_function, which returns complete responses
+        - render_pool: A PdfRenderPool to render the PDFs in, so rendering
+            does not hold up the other documents of a batch.  By default the
+            PDFs are rendered on the document's own thread
+        - token_budget: The most tokens a query may take, None for no limit
+    """
+    query_function: Callable = None
+    output_directory: str = None
+    stream: bool = False
+    render_pool: object = None
+    token_budget: int = PROMPT_TOKEN_BUDGET
+
+
+# How generate_pdf_stream() is stopped, and told its first line is laid out
+StreamHooks = namedtuple("StreamHooks", ["is_cancelled", "report_first_line"],
+                         defaults=(None, None))
+
+
+class DocumentRun:
+    """
+    What the threads generating the documents of one generate_documents()
+    call share.
+
+    Key Attributes:
+        - parent: The job listing and profile, i.e. a DocumentRequest
+        - options: The DocumentOptions of the call
+        - timings: The seconds taken by each step
+        - timed_out: Set once a document timed out, so the others stop and
+            save nothing
+
+    Key Methods:
+        - is_cancelled(): True once the call was cancelled or timed out
+        - report(): Reports the progress of the call
+        - timed(): Runs a step and records the seconds it took
+    """
+
+    def __init__(self, parent, options, cancel_event=None, report_progress=None):
+        self.parent = parent
+        self.options = options
+        self.cancel_event = cancel_event
+        self.report_progress = report_progress
+        self.api_key = get_api_key()
+        self.timings = {}
+        self.timed_out = threading.Event()
+
+    def is_cancelled(self):
+        """
+        :return: True once the call was cancelled or a document timed out
+        """
+        return self.timed_out.is_set() or \
+            (self.cancel_event is not None and self.cancel_event.is_set())
+
+    def report(self, description):
+        """
+        :param description: A description of the step that was reached
+        """
+        if self.report_progress is not None:
+            self.report_progress(description)
 
+    def timed(self, step, function, *args, **kwargs):
+        """
+        Calls function and records the seconds it took under step
 
-def generate_documents(parent):
+        :return: What function returned
+        """
+        step_start = time.perf_counter()
+        value = function(*args, **kwargs)
+        self.timings[step] = time.perf_counter() - step_start
+        return value
+
+
+def generate_documents(parent, cancel_event=None, report_progress=None, options=None):
     """
     Generates a resume and cover letter based on the user's chosen profile
     and the selected job listing.  A PDF is then created for each of those
     generated documents and saved to resumes_and_cover_letters.
 
-    :param parent:
+    The resume and the cover letter are generated concurrently, each on its
+    own thread: the AI query for a document is sent, and its PDF is rendered
+    as soon as its answer arrives, so the whole call takes about as long as
+    the slower of the two documents rather than the sum of all four steps.
+    Each AI query is limited to AI_TIMEOUT seconds and each document to
+    DOCUMENT_TIMEOUT seconds.  Once a document times out, the thread of the
+    other stops at its next step, and neither saves its PDF.
+
+    Both queries are built by prompt_builder from one compacted copy of the
+    job listing and profile, cut down to the token budget if needed.  The
+    estimated tokens of the queries, and the tokens compaction saved, are
+    returned with the result.
+
+    With stream set, each response is streamed from the AI straight into
+    generate_pdf_stream(), so rendering starts with the first line of the
+    response.  The timings then hold the seconds to the first laid out line
+    and for the whole document, instead of the query and the PDF.
+
+    generate_documents() is run on a worker thread by DocumentJobManager, so
+    it only reads plain attributes of parent.  It reports its progress and
+    stops at the next step once it has been cancelled.
+
+    :param parent: An object with user_profile, relevant_job_info, job_title
+        and company attributes, i.e. a DocumentRequest
+    :param cancel_event: A threading.Event that is set to cancel generation
+    :param report_progress: A function called with a description of each step
+    :param options: The DocumentOptions, the defaults if None
+    :return result: A dictionary with "completed", False if generation was
+        cancelled, "timings", the seconds taken by each step and in total,
+        and "prompt_tokens", the token summary of the queries
+    :raises TimeoutError: If a document took longer than DOCUMENT_TIMEOUT
     """
+    start_time = time.perf_counter()
+    options = options or DocumentOptions()
+
     # Make the directory if it does not exist
-    if not os.path.exists(resume_and_cover_letter_directory):
-        os.mkdir(resume_and_cover_letter_directory)
+    os.makedirs(options.output_directory or resume_and_cover_letter_directory, exist_ok=True)
 
-    user_profile = parent.user_profile
-    job_listing = parent.relevant_job_info
+    run = DocumentRun(parent, options, cancel_event, report_progress)
+    # Only a document that gets a contact header is written without one
+    closing_note = None if get_header(parent) is None else CONTACT_HEADER_NOTE
+    prompts = build_prompts(parent.user_profile, parent.relevant_job_info, DOCUMENT_PROMPTS,
+                            options.token_budget, closing_note)
+    result = {"completed": False, "timings": run.timings, "prompt_tokens": prompts.summary()}
 
-    api_key = get_api_key()
-    resume_query = get_resume_query(user_profile, job_listing)
-    cover_letter_query = get_cover_letter_query(user_profile, job_listing)
+    if run.is_cancelled():
+        return result
+    run.report("Generating resume and cover letter")
 
-    resume = query_ai(api_key, resume_query).text
-    cover_letter = query_ai(api_key, cover_letter_query).text
+    result["completed"] = run_documents(run, prompts.queries)
+    run.timings["total"] = time.perf_counter() - start_time
+    return result
 
-    generate_pdf(resume, parent, "resume")
-    generate_pdf(cover_letter, parent, "cover_letter")
+
+def run_documents(run, queries):
+    """
+    A method to generate each document on its own thread and wait for all of
+    them, DOCUMENT_TIMEOUT seconds at most
+
+    :param run: The DocumentRun of the documents
+    :param queries: The query of each document, by kind
+    :return: False if any document was cancelled
+    :raises TimeoutError: If a document took longer than DOCUMENT_TIMEOUT
+    """
+    if run.options.stream and run.options.query_function is None:
+        generate = stream_document
+    else:
+        generate = generate_document
+
+    executor = ThreadPoolExecutor(max_workers=len(queries),
+                                  thread_name_prefix=DOCUMENT_THREAD_PREFIX)
+    try:
+        futures = {letter_or_resume: executor.submit(generate, run, letter_or_resume, query)
+                   for letter_or_resume, query in queries.items()}
+        deadline = time.monotonic() + DOCUMENT_TIMEOUT
+        completed = True
+        for letter_or_resume, future in futures.items():
+            try:
+                completed = future.result(timeout=max(0.0, deadline - time.monotonic())) \
+                    and completed
+            except FuturesTimeoutError as error:
+                run.timed_out.set()
+                raise TimeoutError(f"{DOCUMENT_NAMES[letter_or_resume]} took longer than "
+                                   f"{DOCUMENT_TIMEOUT}s") from error
+    finally:
+        # Do not wait for a document that timed out, its thread stops at its next step
+        executor.shutdown(wait=False)
+    return completed
+
+
+def generate_document(run, letter_or_resume, query):
+    """
+    A method to query the AI for a document, then render its PDF
+
+    :param run: The DocumentRun of the document
+    :param letter_or_resume: "resume" or "cover_letter"
+    :param query:
+    :return: False if the document was cancelled and not saved
+    """
+    if run.is_cancelled():
+        return False
+    options = run.options
+    content = run.timed(f"{letter_or_resume}_query", options.query_function or query_ai,
+                        run.api_key, query, timeout=AI_TIMEOUT).text
+    if run.is_cancelled():
+        return False
+    parent = run.parent
+    if options.render_pool is None:
+        run.timed(f"{letter_or_resume}_pdf", generate_pdf, content, parent, letter_or_resume,
+                  options.output_directory)
+    else:
+        run.timed(f"{letter_or_resume}_pdf", lambda: options.render_pool.submit(
+            (content, parent.company, parent.job_title, letter_or_resume,
+             getattr(parent, "contact_details", None)), options.output_directory).result())
+    run.report(f"{DOCUMENT_NAMES[letter_or_resume]} saved")
+    return True
+
+
+def stream_document(run, letter_or_resume, query):
+    """
+    A method to stream the AI's response for a document straight into its PDF
+
+    :param run: The DocumentRun of the document
+    :param letter_or_resume: "resume" or "cover_letter"
+    :param query:
+    :return: False if the document was cancelled and not saved
+    """
+    if run.is_cancelled():
+        return False
+    step_start = time.perf_counter()
+
+    def record_first_line():
+        run.timings[f"{letter_or_resume}_first_line"] = time.perf_counter() - step_start
+
+    chunks = query_ai_stream(run.api_key, query, timeout=AI_TIMEOUT)
+    if not run.timed(f"{letter_or_resume}_stream", generate_pdf_stream, chunks, run.parent,
+                     letter_or_resume, run.options.output_directory,
+                     StreamHooks(run.is_cancelled, record_first_line)):
+        return False
+    run.report(f"{DOCUMENT_NAMES[letter_or_resume]} saved")
+    return True
+
+
+def format_timings(timings):
+    """
+    A method to format the timing breakdown returned by generate_documents()
+
+    :param timings: i.e. {"resume_query": 8.1, "resume_pdf": 0.2, "total": 8.4}
+    :return: i.e. "8.4s total (resume_query 8.1s, resume_pdf 0.2s)"
+    """
+    steps = ", ".join(f"{step} {seconds:.1f}s" for step, seconds in timings.items()
+                      if step != "total")
+    return f"{timings.get('total', 0.0):.1f}s total ({steps})"
 
 
 def get_resume_query(user_profile, job_listing):
@@ -77,14 +336,7 @@ def get_resume_query(user_profile, job_listing):
     :param job_listing:
     :return resume_query:
     """
-    resume_prompt = ("Given the job description and the information I have "
-                     "provided about myself, please write me a sample resume "
-                     "in markdown format that is specifically designed around "
-                     "my skills and the job description provided.")
-
-    resume_query = (f"Job Description: {job_listing}\n\n"
-                    f"Personal Information: {user_profile}\n\n"
-                    f"{resume_prompt}")
+    resume_query = format_query(job_listing, user_profile, RESUME_PROMPT)
 
     return resume_query
 
@@ -98,101 +350,173 @@ def get_cover_letter_query(user_profile, job_listing):
         :param job_listing:
         :return resume_query:
         """
-    cover_letter_prompt = ("Given the job description and the information I have "
-                           "provided about myself, please write me a sample cover letter "
-                           "in markdown format that is specifically designed around "
-                           "my skills and the job description provided.")
-
-    cover_letter_query = (f"Job Description: {job_listing}\n\n"
-                          f"Personal Information: {user_profile}\n\n"
-                          f"{cover_letter_prompt}")
+    cover_letter_query = format_query(job_listing, user_profile, COVER_LETTER_PROMPT)
 
     return cover_letter_query
 
 
-def generate_pdf(content, parent, letter_or_resume):
+def generate_pdf(content, parent, letter_or_resume, output_directory=None):
     """
-    A method to generate an HTML formatted document, cleans that document
-    of HTML markers, formats it to a clean and human-readable structure,
-    then converts it to a PDF and saves it to resumes_and_cover_letters
+    A method to lay out the AI generated markdown with its headings and
+    bullets, then draw it to a PDF and save it to resumes_and_cover_letters.
+    The whole document is laid out by pdf_layout before the canvas is used.
+    If parent has contact details, their cached header is drawn on every page.
 
     :param content:
-    :param parent:
+    :param parent: An object with job_title and company attributes, and
+        optionally contact_details
     :param letter_or_resume:
-    :return:
+    :param output_directory: Defaults to resumes_and_cover_letters
+    :return file_path: The path the PDF was saved to
     """
 
-    # Convert to HTML format then clean HTML markers
-    cleaned_content = clean_html(content)
+    # Lay out the headings, paragraphs and bullets of the markdown, below the header
+    header = get_header(parent)
+    pages = layout_blocks(markdown_to_blocks(content),
+                          top=MARGIN_TOP if header is None else header.body_top)
 
     # Add "_" to company and job title for file naming
     company, job_title = format_job_for_filename(parent)
 
     # Construct the filepath for the new .pdf file
-    file_path = get_filepath(company, job_title, letter_or_resume)
-
-    # Create a blank canvas object for the PDF
-    pdf_canvas = canvas.Canvas(file_path, pagesize=letter)
-
-    # Set font
-    pdf_canvas.setFont("Helvetica", 10)
+    file_path = get_filepath(company, job_title, letter_or_resume, output_directory)
 
-    # Format text
-    pdf_formatting(cleaned_content, pdf_canvas)
+    # Draw each page on a blank canvas, then save it
+    def draw_pages(pdf_canvas):
+        if header is not None:
+            define_header(header, pdf_canvas)
+        for page in pages:
+            draw_page(page, pdf_canvas, header)
 
-    # Save the PDF
-    pdf_canvas.save()
+    write_pdf_atomically(file_path, draw_pages)
+    return file_path
 
 
-def pdf_formatting(cleaned_content, pdf_canvas):
+def generate_pdf_stream(chunks, parent, letter_or_resume, output_directory=None,
+                        hooks=StreamHooks()):
     """
-    This method was written with the assistance of Google Gemini AI
-    to quickly format text into a structured, readable format.
+    A method to render a streamed response to a PDF as it arrives.  Each
+    markdown line is laid out as soon as it is complete and each page is
+    drawn as soon as it is full, so only the unfinished last line of the
+    response is ever held in memory.  Once cancelled, the response is not
+    read past the chunk that is being handled.
 
-    :param cleaned_content:
-    :param pdf_canvas:
-    :return:
+    :param chunks: An iterable of response text chunks, i.e. query_ai_stream()
+    :param parent:
+    :param letter_or_resume:
+    :param output_directory: Defaults to resumes_and_cover_letters
+    :param hooks: StreamHooks with is_cancelled, a function returning True
+        once rendering should stop, and report_first_line, a function called
+        once the first line is laid out
+    :return: False if rendering was cancelled and no PDF was saved
     """
-    def wrap_text(text, max_width):
-        words = text.split(' ')
-        lines = []
-        current_line = words[0]
+    is_cancelled, report_first_line = hooks
+    company, job_title = format_job_for_filename(parent)
+    file_path = get_filepath(company, job_title, letter_or_resume, output_directory)
+    header = get_header(parent)
+    converter = MarkdownConverter()
+    engine = LayoutEngine(top=MARGIN_TOP if header is None else header.body_top)
+
+    def draw_stream(pdf_canvas):
+        if header is not None:
+            define_header(header, pdf_canvas)
+
+        def lay_out(blocks):
+            first_block = engine.lines_laid_out == 0
+            for block in blocks:
+                for page in engine.add_block(block):
+                    draw_page(page, pdf_canvas, header)
+            if first_block and engine.lines_laid_out and report_first_line is not None:
+                report_first_line()
+
+        for line in iter_markdown_lines(stop_when_cancelled(chunks, is_cancelled)):
+            lay_out(converter.feed(line))
+        if is_cancelled is not None and is_cancelled():
+            return False
 
-        for word in words[1:]:
-            test_line = current_line + ' ' + word
-            if pdf_canvas.stringWidth(test_line, "Helvetica", 10) <= max_width:
-                current_line = test_line
-            else:
-                lines.append(current_line)
-                current_line = word
+        lay_out(converter.finish())
+        for page in engine.finish():
+            draw_page(page, pdf_canvas, header)
+        return True
 
-        lines.append(current_line)  # Add the last line
-        return lines
+    return write_pdf_atomically(file_path, draw_stream)
 
-    # Track vertical position for text placement
-    y_position = MARGIN_TOP
-    # Process each paragraph separately
-    paragraphs = cleaned_content.split("\n")  # Use single newline to separate lines properly
-    for paragraph in paragraphs:
-        if not paragraph.strip():
-            y_position -= PARAGRAPH_SPACING  # Add space between paragraphs
-            continue  # Skip empty paragraphs
 
-        wrapped_lines = wrap_text(paragraph, MAX_WIDTH)
+def get_header(parent):
+    """
+    A method to get the laid out contact header of a document's profile,
+    cached by pdf_layout so each profile is laid out once
 
-        for wrapped_line in wrapped_lines:
-            if y_position < BOTTOM_MARGIN:  # If at bottom, start a new page
-                pdf_canvas.showPage()
-                pdf_canvas.setFont("Helvetica", 10)
-                y_position = MARGIN_TOP  # Reset y_position for the new page
+    :param parent: An object that may have a contact_details attribute
+    :return: A HeaderFragment, or None if there are no contact details
+    """
+    contact_details = getattr(parent, "contact_details", None)
+    return None if contact_details is None else layout_header(contact_details)
 
-            pdf_canvas.drawString(MARGIN_LEFT, y_position, wrapped_line)
-            y_position -= LINE_HEIGHT  # Move down for the next line
 
-        y_position -= PARAGRAPH_SPACING  # Add space after each paragraph
+def write_pdf_atomically(file_path, draw):
+    """
+    A method to draw a PDF into a temporary file next to file_path and only
+    then rename it to file_path, so a PDF that is being written, or failed,
+    is never mistaken for a finished one
+
+    :param file_path:
+    :param draw: A function that draws the pages on a canvas.  It may return
+        False to abandon the PDF
+    :return: False if the PDF was abandoned, True once it was saved
+    """
+    descriptor, temporary_path = tempfile.mkstemp(
+        suffix=".tmp", prefix=".", dir=os.path.dirname(file_path) or None)
+    os.close(descriptor)
+    try:
+        pdf_canvas = canvas.Canvas(temporary_path, pagesize=letter)
+        if draw(pdf_canvas) is False:
+            return False
+        pdf_canvas.save()
+        os.replace(temporary_path, file_path)
+        return True
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def stop_when_cancelled(chunks, is_cancelled=None):
+    """
+    A method to stop reading a stream of chunks once it is cancelled.  The
+    stream is closed, so a streamed AI response is not read any further.
 
+    :param chunks: An iterable of text chunks
+    :param is_cancelled: A function returning True once reading should stop
+    :return: A generator of the chunks read before cancellation
+    """
+    chunks = iter(chunks)
+    try:
+        while is_cancelled is None or not is_cancelled():
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def iter_markdown_lines(chunks):
+    """
+    A method to split streamed response chunks into complete lines
 
-def get_filepath(company, job_title, letter_or_resume):
+    :param chunks: An iterable of text chunks, split anywhere
+    :return: A generator of lines, without their newlines
+    """
+    pending = ""
+    for chunk in chunks:
+        *lines, pending = (pending + chunk).split("\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+def get_filepath(company, job_title, letter_or_resume, output_directory=None):
     """
     A method to create a filename/file path using the company name, the
     job title, and distinguish if it is a resume or cover letter
@@ -200,10 +524,12 @@ def get_filepath(company, job_title, letter_or_resume):
     :param company:
     :param job_title:
     :param letter_or_resume:
+    :param output_directory: Defaults to resumes_and_cover_letters
     :return:
     """
     file_name = f"{job_title}_{company}_{letter_or_resume}"
-    file_path = os.path.join(resume_and_cover_letter_directory, f"{file_name}.pdf")
+    file_path = os.path.join(output_directory or resume_and_cover_letter_directory,
+                             f"{file_name}.pdf")
     return file_path
 
 
@@ -214,38 +540,89 @@ def format_job_for_filename(parent):
     :param parent:
     :return:
     """
-    job_title = parent.job_title.replace(" ", "_")
-    company = parent.company.replace(" ", "_")
+    job_title = sanitize_filename(parent.job_title)
+    company = sanitize_filename(parent.company)
     return company, job_title
 
 
-def clean_html(content):
+def sanitize_filename(name):
     """
-    A method to remove HTML tags from resume/cover letter content
-    :param content:
-    :return:
+    A method to replace whitespace and path separators with "_", so that
+    name is a single file or directory name
+
+    :param name: i.e. "QA Engineer I/II"
+    :return: i.e. "QA_Engineer_I_II"
     """
-    # Convert markdown to HTML.  Pdfkit works with HTML format
-    html_content = markdown.markdown(content)
-    # Remove HTML tags.  Regex pattern obtained from Google AI
-    cleaned_content = re.sub(r'<[^>]+>', '', html_content)
-    return cleaned_content
+    name = UNSAFE_FILENAME_PATTERN.sub("_", name)
+    # "." and ".." name the directory itself and its parent
+    return name.replace(".", "_") if name and not name.strip(".") else name
 
 
-def query_ai(api_key, query):
+def query_ai(api_key, query, timeout=None, use_cache=True):
     """
     A method to connect with Google Gemini AI and initiate a query
 
+    Responses are cached in AI_RESPONSE_CACHE, keyed by the model name, the
+    query and the generation parameters, so the same query sent again is
+    answered from the cache without contacting Google Gemini AI.  Queries
+    that miss the cache are sent through AI_CLIENT, which reuses one
+    configured client and model for every query.
+
     :param api_key:
     :param query:
-    :return:
+    :param timeout: Seconds to wait for the response, None to wait as long
+        as the client library does by default
+    :param use_cache: Set to False to bypass the cache and always query the AI
+    :return: The response, its text attribute holds the generated content
     """
-    # This code is mirrored from the ai.google.dev website sample code and is modified only
-    # slightly to meet project requirements.  Original code can be found at
-    # https://ai.google.dev/gemini-api/docs?_gl=1*nqyqa0*_ga*NzExNDg0MDc0LjE3Mzg0Mjg3Njk.*_ga_P1DBVKWT6V
-    # *MTczODQyODc2OS4xLjEuMTczODQyOTAwNy42MC4wLjc3ODAwMjE5Mg..#python
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(query)  # Execute query, store response
+    if use_cache:
+        cached_response = get_cached_response(query)
+        if cached_response is not None:
+            return cached_response
+
+    cache_key = AI_RESPONSE_CACHE.make_key(AI_MODEL_NAME, query, GENERATION_PARAMETERS)
+    response = AI_CLIENT.generate(api_key, query, AI_MODEL_NAME, GENERATION_PARAMETERS,
+                                  timeout)  # Execute query
+
+    if use_cache and response.text:
+        AI_RESPONSE_CACHE.put(cache_key, AI_MODEL_NAME, response.text)
 
     return response
+
+
+def get_cached_response(query):
+    """
+    A method to look up the cached response of a query in AI_RESPONSE_CACHE
+
+    :param query:
+    :return: A CachedResponse, or None if the query is not cached
+    """
+    cached_text = AI_RESPONSE_CACHE.get(
+        AI_RESPONSE_CACHE.make_key(AI_MODEL_NAME, query, GENERATION_PARAMETERS))
+    return None if cached_text is None else CachedResponse(cached_text)
+
+
+def query_ai_stream(api_key, query, timeout=None, use_cache=True):
+    """
+    A method to send a query to Google Gemini AI and yield the response as it
+    is generated, for generate_pdf_stream()
+
+    With use_cache, a response already in AI_RESPONSE_CACHE is yielded as a
+    single chunk.  A streamed response is not stored in the cache: that
+    would mean keeping every chunk until the stream ends, and the streaming
+    path never holds a whole response.  query_ai() fills the cache.
+
+    :param api_key:
+    :param query:
+    :param timeout: Seconds to wait for the response, None to wait as long
+        as the client library does by default
+    :param use_cache: Set to False to always query the AI
+    :return: A generator of the response text, one chunk at a time
+    """
+    if use_cache:
+        cached_response = get_cached_response(query)
+        if cached_response is not None:
+            yield cached_response.text
+            return
+
+    yield from AI_CLIENT.stream(api_key, query, AI_MODEL_NAME, GENERATION_PARAMETERS, timeout)
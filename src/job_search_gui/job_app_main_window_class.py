@@ -2,8 +2,13 @@
 A class to represent the main window of a job listing GUI
 """
 import tkinter as tk
+from src.job_search_gui.background_loader import BackgroundLoader, JobLoader
+from src.job_search_gui.database_handler import get_job_by_id
+from src.job_search_gui.document_jobs import DOCUMENT_JOBS
+from src.job_search_gui.job_index import JobIndex
 from src.job_search_gui.job_listing_popup_class import JobListingPopup
 from src.job_search_gui.user_attribute_popup import UserAttributePopup
+from src.job_search_gui.virtual_listbox import VirtualListbox
 
 
 class AppMainWindow(tk.Tk):
@@ -13,28 +18,38 @@ class AppMainWindow(tk.Tk):
     and their location retrieved from a database connection.  It also contains
     functionalities for sorting job listings and closing the application.
 
+    The listbox is a VirtualListbox, only the job listings on screen are
+    formatted and handed to Tk, and the JobIndex behind it reads just the
+    (id, title, location) of the pages on screen from the database, so the
+    window opens and re-sorts just as quickly with 500,000 job listings as
+    with 50.  The full record of a job listing is read when it is selected.
+    start_loading() has a BackgroundLoader find the pages of the current sort
+    order on a thread, and add_pages() grows the listbox as they are found,
+    while the progress is shown below it.
+
     Key Attributes:
         - database_connection: A database connection object used to retrieve job listings.
-        - job_listings (list): A list of job listings, each being represented by a
-            dictionary containing job info.
+        - job_index (JobIndex): Maps listbox positions to job ids for the
+            current sort order.
 
     Key Methods:
         - populate_listbox(): Populates the lisbox with jobs from the 'job_listings' list
             attribute.
         - event_handler(): Registers event handlers (buttons clicks, listbox selection, etc.).
+        - start_loading(): Finds the pages of the job listings on a background thread.
     """
 
-    def __init__(self, database_connection, job_listings):
+    def __init__(self, database_connection):
         super().__init__()
         self.sort_by_location_button = None
         self.sort_by_name_button = None
         self.user_data_collection_button = None
         self.close_button = None
-        self.listbox = tk.Listbox(self, selectmode=tk.SINGLE, activestyle='none')
+        self.listbox = VirtualListbox(self)
         self.title("Job List")
         self.geometry("800x400")
         self.db_conn = database_connection
-        self.job_listings = job_listings
+        self.job_index = JobIndex(database_connection)
         self.populate_listbox()
         self.create_buttons()
         self.event_handler()
@@ -58,25 +73,29 @@ class AppMainWindow(tk.Tk):
 
     def populate_listbox(self):
         """
-        Populates the listbox with job listings after initially clearing the
-        existing entries in the listbox.  Job postings will be displayed in
-        the format job title: location.
+        Points the listbox at the job listings in their current sort order.
+        Job postings will be displayed in the format job title: location, each
+        row is formatted by format_row() when it scrolls into view.
         """
-        # Clear the listbox
-        self.listbox.delete(0, tk.END)
-
-        # Add all jobs to the listbox
-        for _, job_info in self.job_listings.items():
-            job_title = job_info['job_title']
-            location = job_info['location']
-            formatted_string = f"{job_title}: {location}"
-            self.listbox.insert(tk.END, formatted_string)
+        self.listbox.set_source(len(self.job_index), self.format_row)
 
         self.listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=(5, 0))
 
+    def format_row(self, index):
+        """
+        Formats a row of the listbox
+
+        :param index: Position of the job listing in the listbox
+        :return: The row text, job title: location
+        """
+        _, job_title, location = self.job_index.row(index)
+        return f"{job_title}: {location}"
+
     def navigate(self, event):
         """
-        Navigates through the listbox using up and down arrow keys.
+        Navigates through the listbox using up and down arrow keys.  The
+        VirtualListbox only handles the mouse, all keyboard navigation of the
+        job listings is done here.
         :param event: The event triggered by keypress (Up or Down).
         """
         current_selection = self.listbox.curselection()  # Get current selection
@@ -87,9 +106,9 @@ class AppMainWindow(tk.Tk):
         index = current_selection[0]  # Get the index of the selected item
 
         if event.keysym == 'Up':  # Check if the Up Arrow key is pressed
-            index = index - 1 if index > 0 else len(self.job_listings) - 1
+            index = index - 1 if index > 0 else self.listbox.size() - 1
         elif event.keysym == 'Down':  # Check if the Down Arrow key is pressed
-            index = index + 1 if index < len(self.job_listings) - 1 else 0
+            index = index + 1 if index < self.listbox.size() - 1 else 0
 
         self.listbox.select_clear(0, tk.END)  # Clear any previous selection
         self.listbox.select_set(index)  # Select the new item
@@ -104,10 +123,11 @@ class AppMainWindow(tk.Tk):
         selected_index = self.listbox.curselection()
 
         if selected_index:
-            job_id = list(self.job_listings.keys())[selected_index[0]]
-            job_info = self.job_listings[job_id]
+            job_id = self.job_index.job_id(selected_index[0])
+            job_info = get_job_by_id(self.db_conn, job_id)
             # Open a pop-up window for the selected job
-            JobListingPopup(self, job_info, self.db_conn)
+            if job_info is not None:
+                JobListingPopup(self, job_info, self.db_conn)
 
     def create_buttons(self):
         """
@@ -139,15 +159,69 @@ class AppMainWindow(tk.Tk):
 
     def sort_by_name(self):
         """Sort job listings by job title and update the listbox."""
-        self.job_listings = dict(sorted(self.job_listings.items(),
-                                        key=lambda item: item[1]['job_title']))
+        self.job_index.sort("name")
         self.populate_listbox()
+        self.load_pages()
 
     def sort_by_location(self):
         """Sort job listings by location and update the listbox."""
-        self.job_listings = dict(reversed(sorted(self.job_listings.items(),
-                                                 key=lambda item: item[1]['location'])))
+        self.job_index.sort("location")
         self.populate_listbox()
+        self.load_pages()
+
+    def start_loading(self, database_path):
+        """
+        Starts finding the pages of the job listings in the background, with
+        a progress bar below the listbox until every one has been found
+
+        :param database_path: Path of the database file, each loader opens
+            its own connection to it
+        """
+        self.job_index.database_path = database_path
+        self.load_pages()
+
+    def load_pages(self):
+        """
+        Stops finding the pages of the previous sort order, if they were still
+        being found, and starts finding the pages of the current one from
+        where they were left off.  Nothing is loaded before start_loading()
+        is called, or once every page of the sort order has been found.
+        """
+        for child in self.winfo_children():
+            if isinstance(child, BackgroundLoader):
+                child.destroy()
+
+        sort_order = self.job_index.sort_order
+        if self.job_index.database_path is None or self.job_index.is_complete(sort_order):
+            return
+
+        thread = JobLoader(self.job_index.database_path, sort_order,
+                           self.job_index.resume_points[sort_order], self.job_index.page_size)
+        BackgroundLoader(self, thread, self.add_pages).start()
+
+    def add_pages(self, sort_order, page_keys, row_count, next_key):
+        """
+        Adds the page keys a loader found to the job index, and grows the
+        listbox if they belong to the current sort order.  The new job
+        listings are appended below the ones on screen.
+
+        :param sort_order: A key of SORT_ORDERS
+        :param page_keys: The page key of each page found
+        :param row_count: The number of job listings on every page found so far
+        :param next_key: The page key of the page after them, None once every
+            page has been found
+        """
+        self.job_index.add_pages(sort_order, page_keys, row_count, next_key)
+        if sort_order == self.job_index.sort_order:
+            self.listbox.set_row_count(len(self.job_index))
+
+    def destroy(self):
+        """
+        Cancel any unfinished document jobs and close the window.  Destroying
+        the window also destroys the BackgroundLoader, which stops loading.
+        """
+        DOCUMENT_JOBS.cancel_all()
+        super().destroy()
 
     def make_profile(self):
         """Create a popup window for the user to create a profile"""
@@ -0,0 +1,135 @@
+"""
+A module that defines JobIndex, the ordered index the main window uses to
+map positions in its listbox to job ids.
+
+The job listings are never all held in memory.  Each sort order is an ORDER
+BY on one of the idx_job_listings_*_key indexes, read a page at a time with
+get_job_page(), and a listbox position is found by its page: position //
+page_size.  To fetch a page, the index needs the page key of the page before
+it, the (sort value, id) its last row ended on.  The page keys are found by
+reading every page once, on a JobLoader thread (see background_loader.py),
+and handed to add_pages() as they are found.  A page key is a couple of short
+strings for every page_size job listings, and only the most recently shown
+pages are kept, PAGE_CACHE_SIZE of them, so looking up a position is at most
+one indexed query no matter how many job listings there are.
+
+The page keys of a sort order are kept once they are found, so switching
+back and forth between sort orders does not read the pages again.
+"""
+from collections import OrderedDict
+from sqlite3 import Connection
+
+from src.job_search_gui.database_handler import JOB_PAGE_SIZE, get_job_page
+
+# Sort orders: (column to order by, whether the order is descending).
+# Locations are listed from Z to A, as the main window always has
+SORT_ORDERS = {
+    "name": ("title", False),
+    "location": ("location", True)
+}
+PAGE_CACHE_SIZE = 8  # Pages of rows kept, enough for a few screens of rows
+
+
+class JobIndex:
+    """
+    An index of job listings by listbox position, with the page keys of
+    every sort order that has been read so far.
+
+    Key Attributes:
+        - database_connection: The connection pages are read with
+        - database_path: Path of the database file, for the JobLoader threads
+            that find the pages, None until the main window starts loading
+        - sort_order: The current sort order, a key of SORT_ORDERS
+        - page_keys: The page key of each page found so far, by sort order.
+            The first page has the page key None
+        - resume_points: The (page key, row count) of the first page not
+            found yet and the job listings before it, by sort order
+
+    Key Methods:
+        - row(position): The (id, title, location) shown at a listbox position
+        - job_id(position): The job id shown at a listbox position
+        - sort(sort_order): Switches to a sort order
+        - is_complete(sort_order): Whether every page has been found
+        - add_pages(sort_order, page_keys, row_count, next_key): Adds page
+            keys, i.e. as a JobLoader finds them
+    """
+
+    def __init__(self, database_connection: Connection, page_size: int = JOB_PAGE_SIZE):
+        self.database_connection = database_connection
+        self.page_size = page_size
+        self.sort_order = "name"
+        self.database_path = None
+        self.page_keys = {sort_order: [] for sort_order in SORT_ORDERS}
+        self.resume_points = dict.fromkeys(SORT_ORDERS, (None, 0))
+        self.pages = OrderedDict()  # (sort order, page number): rows
+
+    def __len__(self):
+        return self.resume_points[self.sort_order][1]
+
+    def row(self, position: int):
+        """
+        :param position: A position in the listbox
+        :return: The (id, title, location) of the job listing shown at that
+            position
+        """
+        page_number, offset = divmod(position, self.page_size)
+        return self.page(page_number)[offset]
+
+    def job_id(self, position: int):
+        """
+        :param position: A position in the listbox
+        :return: The id of the job listing shown at that position
+        """
+        return self.row(position)[0]
+
+    def page(self, page_number: int):
+        """
+        A method to read a page of the current sort order, or take it from
+        the most recently read pages
+
+        :param page_number: A page whose page key has been found
+        :return: A list of (id, title, location) tuples
+        """
+        cache_key = (self.sort_order, page_number)
+        if cache_key in self.pages:
+            self.pages.move_to_end(cache_key)
+            return self.pages[cache_key]
+
+        order_by, descending = SORT_ORDERS[self.sort_order]
+        rows, _ = get_job_page(self.database_connection, order_by,
+                               self.page_keys[self.sort_order][page_number],
+                               self.page_size, descending)
+        self.pages[cache_key] = rows
+        if len(self.pages) > PAGE_CACHE_SIZE:
+            self.pages.popitem(last=False)
+        return rows
+
+    def sort(self, sort_order: str):
+        """
+        Switches to a sort order, reusing the page keys found for it before
+
+        :param sort_order: A key of SORT_ORDERS
+        """
+        if sort_order not in SORT_ORDERS:
+            raise ValueError(f"Cannot sort job listings by {sort_order}")
+        self.sort_order = sort_order
+
+    def is_complete(self, sort_order: str):
+        """
+        :param sort_order: A key of SORT_ORDERS
+        :return: True if every page of the sort order has been found
+        """
+        return self.resume_points[sort_order][0] is None and bool(self.page_keys[sort_order])
+
+    def add_pages(self, sort_order: str, page_keys: list, row_count: int, next_key: tuple):
+        """
+        Adds the page keys of the pages that follow the ones already found
+
+        :param sort_order: A key of SORT_ORDERS
+        :param page_keys: The page key of each page, in order
+        :param row_count: The number of job listings on every page found so far
+        :param next_key: The page key of the page after them, None if the
+            last page has been found
+        """
+        self.page_keys[sort_order].extend(page_keys)
+        self.resume_points[sort_order] = (next_key, row_count)
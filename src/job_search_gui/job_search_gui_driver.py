@@ -2,43 +2,48 @@
 job_search_gui_driver.py is the entry point for our job search
 database GUI.
 
-os.path is leveraged to determine the absolute path of the root
-directory, the name of the database file is then appended so the
-absolute path can be passed into create_database_connection() to
+database_handler determines the absolute path of the root directory and
+appends the name of the database file, so the absolute path,
+ROOT_DATABASE_PATH, can be passed into create_database_connection() to
 establish a connection.
 
-That connection is then used to extract all data from the database
-and create a dictionary containing all attributes from every job
-listing.  We then pass the list into our GUI's main window to be
-displayed to the end user.
+The GUI's main window is opened right away with that connection, which
+it reads the job listings on screen with, a page at a time.  The pages are
+found on a background thread, which opens a connection of its own, and
+the window grows its list as they are found.
+
+Passing --check-query-plans prints the query plan of every query the GUI
+issues, flagging the ones that scan instead of searching an index, instead
+of opening the GUI.
 """
 
-import os
+import argparse
 from src.job_search_gui.job_app_main_window_class import AppMainWindow
 from src.job_search_gui.database_handler import (
-    create_database_connection, get_jobs_from_database)
-
+    ROOT_DATABASE_PATH, create_database_connection, print_query_plan_report)
 
-DATA_BASE_PATH = "job_listings.db"
-SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
-ROOT_DIRECTORY = os.path.abspath(os.path.join(SCRIPT_DIRECTORY, "../../"))
-ROOT_DATABASE_PATH = os.path.join(ROOT_DIRECTORY, DATA_BASE_PATH)
 
-
-def main():
+def main(argv=None):
     """
-    Program entry.  Establish a database connection, retrieve all job listings
-    from the database, open the job_search_gui main window and display every
-    job listing
+    Program entry.  Establish a database connection, open the job_search_gui
+    main window and find the pages of the job listings in the background
     """
+    parser = argparse.ArgumentParser(description="Browse job listings")
+    parser.add_argument("--check-query-plans", action="store_true",
+                        help="print the query plan of every GUI query and exit")
+    arguments = parser.parse_args(argv)
+
     # Establish database connection
     database_connection = create_database_connection(ROOT_DATABASE_PATH)
 
-    # Create a dictionary containing all job info
-    job_listings = get_jobs_from_database(database_connection)
+    if arguments.check_query_plans:
+        print_query_plan_report(database_connection)
+        database_connection.close()
+        return
 
-    # Launch the GUI and display all job listings
-    app = AppMainWindow(database_connection, job_listings)
+    # Launch the GUI, then display the job listings as they are loaded
+    app = AppMainWindow(database_connection)
+    app.start_loading(ROOT_DATABASE_PATH)
     app.mainloop()
 
 
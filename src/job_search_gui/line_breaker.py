@@ -0,0 +1,340 @@
+"""
+A module that breaks paragraphs into lines that fit the width of a PDF page.
+
+The original wrap_text() in pdf_formatting() measured the whole line again
+with stringWidth() every time it tried to add a word, so the work grew with
+the square of the paragraph length.  LineBreaker measures each word only once
+and adds the widths up itself:
+
+    - Word widths are cached in font units (1/1000 of the font size), the
+      same integers stringWidth() adds up for the standard PDF fonts, so a
+      line is measured with one addition per word and the line breaks are
+      exactly those stringWidth() gives
+    - The width of a space is measured once per font
+    - A word wider than the whole line is split into pieces that fit,
+      instead of running off the page
+
+Words are measured with FontMetrics, a table of the width of every character
+of a font.  The table of each font is read from reportlab once, by
+get_font_metrics(), so measuring text never calls into reportlab after that.
+A FontMetrics can also be built from any table, which lets the layout be
+tested and timed with fonts of known widths.
+
+get_line_breaker() returns the shared LineBreaker of a font, so the word
+widths cached for one document are reused by the next.
+
+To compare it with the original wrap_text() on long generated documents, run
+(from the project root, with PYTHONPATH set to the project root):
+
+    python src/job_search_gui/line_breaker.py --paragraphs 200
+"""
+import argparse
+import random
+import string
+import threading
+import time
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+FONT_UNITS = 1000  # Font size at which a width equals the width in font units
+DEFAULT_CHARACTER_UNITS = 556  # Width of a character missing from a width table
+# Characters whose widths are read when a font's table is built, the others when first used
+PRECOMPUTED_CHARACTERS = string.printable + bytes(range(0xA0, 0x100)).decode("cp1252") + \
+    "\u2018\u2019\u201c\u201d\u2013\u2014\u2022\u2026\u20ac"
+WORD_CACHE_SIZE = 50000  # Words cached per font before the cache is cleared
+BENCHMARK_WORDS = ("experience", "Python", "developed", "a", "team", "of", "engineers",
+                   "designed", "scalable", "services", "with", "SQL", "and", "the",
+                   "cloud-native", "infrastructure", "leading", "to", "30%", "faster")
+
+
+class FontMetrics:
+    """
+    The width of every character of a font, in font units.
+
+    Key Attributes:
+        - font_name
+        - widths: A dictionary of character widths in font units
+
+    Key Methods:
+        - string_width(text, font_size): The width of text in points, like
+            reportlab's stringWidth() for this font
+    """
+
+    def __init__(self, font_name: str, widths: dict, measure=None,
+                 default_units: float = DEFAULT_CHARACTER_UNITS):
+        self.font_name = font_name
+        self.widths = dict(widths)
+        self.measure = measure
+        self.default_units = default_units
+
+    @classmethod
+    def from_reportlab(cls, font_name: str):
+        """
+        Reads the width table of a font from reportlab
+
+        :param font_name: A standard PDF font, i.e. "Helvetica-Bold"
+        :return: A FontMetrics that measures characters outside the table
+            with reportlab when they are first used
+        """
+
+        def measure(character):
+            return round(stringWidth(character, font_name, FONT_UNITS), 3)
+
+        return cls(font_name, {character: measure(character)
+                               for character in PRECOMPUTED_CHARACTERS}, measure)
+
+    def character_units(self, character: str):
+        """
+        :param character:
+        :return: The width of the character in font units
+        """
+        units = self.widths.get(character)
+        if units is None:
+            units = self.measure(character) if self.measure else self.default_units
+            self.widths[character] = units
+        return units
+
+    def string_width(self, text: str, font_size: float = FONT_UNITS):
+        """
+        :param text:
+        :param font_size:
+        :return: The width of text in points
+        """
+        widths = self.widths
+        units = 0
+        for character in text:
+            character_units = widths.get(character)
+            units += self.character_units(character) if character_units is None \
+                else character_units
+        return units * 0.001 * font_size
+
+
+FONT_METRICS = {}
+FONT_METRICS_LOCK = threading.Lock()
+
+
+def get_font_metrics(font_name: str):
+    """
+    :param font_name: A standard PDF font, i.e. "Helvetica"
+    :return: The FontMetrics of the font, read from reportlab the first time
+    """
+    with FONT_METRICS_LOCK:
+        if font_name not in FONT_METRICS:
+            FONT_METRICS[font_name] = FontMetrics.from_reportlab(font_name)
+        return FONT_METRICS[font_name]
+
+
+class LineBreaker:
+    """
+    Breaks text into lines no wider than a maximum width, measuring each word
+    of a font only once.
+
+    Key Attributes:
+        - font_name / font_size: The font the text is drawn in
+        - word_units: A dictionary of word widths in font units
+
+    Key Methods:
+        - wrap(text, max_width): Splits a paragraph into lines
+        - width(text): The width of text in points
+    """
+
+    def __init__(self, font_name: str = "Helvetica", font_size: float = 10,
+                 string_width=None):
+        self.font_name = font_name
+        self.font_size = font_size
+        # The font's width table by default, any function of text and font size will do
+        self.string_width = string_width or get_font_metrics(font_name).string_width
+        self.word_units = {}
+        self.lock = threading.Lock()
+        self.space_units = self.measure(" ")
+
+    def measure(self, word: str):
+        """
+        :param word:
+        :return: The width of word in font units, cached
+        """
+        units = self.word_units.get(word)
+        if units is None:
+            # Standard font widths are whole font units, rounding removes
+            # the floating point error of scaling them
+            units = round(self.string_width(word, FONT_UNITS), 3)
+            with self.lock:
+                if len(self.word_units) >= WORD_CACHE_SIZE:
+                    self.word_units.clear()
+                self.word_units[word] = units
+        return units
+
+    def fits(self, units: float, max_width: float):
+        """
+        :param units: A width in font units
+        :param max_width: The widest a line may be, in points
+        :return: True if the width is no wider than max_width, scaled
+            exactly as stringWidth() scales it
+        """
+        return units * 0.001 * self.font_size <= max_width
+
+    def width(self, text: str):
+        """
+        :param text:
+        :return: The width of text in points
+        """
+        words = text.split(" ")
+        units = sum(self.measure(word) for word in words) + self.space_units * (len(words) - 1)
+        return units * 0.001 * self.font_size
+
+    def wrap(self, text: str, max_width: float):
+        """
+        Splits a paragraph into lines at its spaces.  Each line takes as many
+        words as fit, and a word wider than max_width is split into pieces.
+
+        :param text: A paragraph
+        :param max_width: The widest a line may be, in points
+        :return: The lines of the paragraph
+        """
+        lines = []
+        line_words = None
+        line_units = 0
+
+        for word in text.split(" "):
+            units = self.measure(word)
+            if not self.fits(units, max_width):
+                pieces = self.split_word(word, max_width)
+                if line_words is not None:
+                    lines.append(" ".join(line_words))
+                lines.extend(pieces[:-1])
+                line_words, line_units = [pieces[-1]], self.measure(pieces[-1])
+            elif line_words is None:
+                line_words, line_units = [word], units
+            elif self.fits(line_units + self.space_units + units, max_width):
+                line_words.append(word)
+                line_units += self.space_units + units
+            else:
+                lines.append(" ".join(line_words))
+                line_words, line_units = [word], units
+
+        lines.append(" ".join(line_words))  # Add the last line
+        return lines
+
+    def split_word(self, word: str, max_width: float):
+        """
+        Splits a word that is wider than max_width into pieces that fit
+
+        :param word:
+        :param max_width: The widest a piece may be, in points
+        :return: The pieces of the word, every piece has at least one character
+        """
+        pieces = []
+        piece_start = 0
+        piece_units = 0
+        for index, character in enumerate(word):
+            units = self.measure(character)
+            if index > piece_start and not self.fits(piece_units + units, max_width):
+                pieces.append(word[piece_start:index])
+                piece_start, piece_units = index, 0
+            piece_units += units
+        pieces.append(word[piece_start:])
+        return pieces
+
+
+LINE_BREAKERS = {}
+LINE_BREAKERS_LOCK = threading.Lock()
+
+
+def get_line_breaker(font_name: str = "Helvetica", font_size: float = 10):
+    """
+    :param font_name:
+    :param font_size:
+    :return: The LineBreaker shared by every document drawn in this font
+    """
+    with LINE_BREAKERS_LOCK:
+        if (font_name, font_size) not in LINE_BREAKERS:
+            LINE_BREAKERS[(font_name, font_size)] = LineBreaker(font_name, font_size)
+        return LINE_BREAKERS[(font_name, font_size)]
+
+
+def wrap_text_by_measuring(text: str, max_width: float, font_name: str = "Helvetica",
+                           font_size: float = 10):
+    """
+    The original wrap_text() of pdf_formatting(), which measures the whole
+    line for every word.  Kept as the reference for tests and the benchmark.
+
+    :param text: A paragraph
+    :param max_width: The widest a line may be, in points
+    :param font_name:
+    :param font_size:
+    :return: The lines of the paragraph
+    """
+    words = text.split(' ')
+    lines = []
+    current_line = words[0]
+
+    for word in words[1:]:
+        test_line = current_line + ' ' + word
+        if stringWidth(test_line, font_name, font_size) <= max_width:
+            current_line = test_line
+        else:
+            lines.append(current_line)
+            current_line = word
+
+    lines.append(current_line)  # Add the last line
+    return lines
+
+
+def generate_document(paragraphs: int, words_per_paragraph: int = 120, seed: int = 0):
+    """
+    Generates a long document of random words for the benchmark
+
+    :param paragraphs: The number of paragraphs
+    :param words_per_paragraph:
+    :param seed: Seed of the random words, the same seed gives the same document
+    :return: A list of paragraphs
+    """
+    generator = random.Random(seed)
+    return [" ".join(generator.choice(BENCHMARK_WORDS) for _ in range(words_per_paragraph))
+            for _ in range(paragraphs)]
+
+
+def benchmark(paragraphs: int = 200, words_per_paragraph: int = 120, max_width: float = 520):
+    """
+    Times the original wrap_text() against LineBreaker on a generated document
+    and checks that both break every line in the same place
+
+    :param paragraphs:
+    :param words_per_paragraph:
+    :param max_width:
+    :return: A dictionary of the seconds each took, and the speedup
+    """
+    document = generate_document(paragraphs, words_per_paragraph)
+
+    start = time.perf_counter()
+    expected = [wrap_text_by_measuring(paragraph, max_width) for paragraph in document]
+    measuring_seconds = time.perf_counter() - start
+
+    line_breaker = LineBreaker()
+    start = time.perf_counter()
+    lines = [line_breaker.wrap(paragraph, max_width) for paragraph in document]
+    cached_seconds = time.perf_counter() - start
+
+    if lines != expected:
+        raise AssertionError("LineBreaker broke lines differently from wrap_text()")
+    return {"measuring": measuring_seconds, "cached": cached_seconds,
+            "speedup": measuring_seconds / cached_seconds}
+
+
+def main(argv=None):
+    """
+    Program entry
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare the original wrap_text() with LineBreaker")
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--words", type=int, default=120, help="words per paragraph")
+    arguments = parser.parse_args(argv)
+
+    result = benchmark(arguments.paragraphs, arguments.words)
+    print(f"{arguments.paragraphs} paragraphs of {arguments.words} words: "
+          f"wrap_text {result['measuring']:.3f}s, LineBreaker {result['cached']:.3f}s "
+          f"({result['speedup']:.1f}x faster), identical line breaks")
+
+
+if __name__ == "__main__":
+    main()
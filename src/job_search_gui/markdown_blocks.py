@@ -0,0 +1,342 @@
+"""
+A module that converts the markdown of an AI response straight into the
+layout Blocks of pdf_layout, in a single pass over its lines.
+
+The response used to be converted to HTML with markdown.markdown(), and then
+either stripped of every tag by clean_html() or parsed back into blocks.
+MarkdownConverter skips the HTML: it reads one line at a time, recognizes
+the subset of markdown Google Gemini AI writes, and returns each block as soon
+as it is complete:
+
+    - Headings: "# Title" to "###### Title", and a line underlined with
+      "===" or "---"
+    - Bullets: "-", "*" or "+" items and numbered "1." items, nested by
+      indentation, with their numbering kept
+    - Paragraphs: Consecutive lines, each kept on its own line as before.  A
+      paragraph that is entirely bold, i.e. "**Experience**", is a heading
+    - Inline markup: bold, italics, code and links ([text](url) keeps the
+      text) are removed in one regex pass per line, and entities are unescaped
+
+Lines are fed as they arrive, so a streamed response is converted while it
+is still being generated.
+
+To compare the converter with clean_html() on a large response, run (from the
+project root, with PYTHONPATH set to the project root):
+
+    python src/job_search_gui/markdown_blocks.py --sections 200
+"""
+import argparse
+import html
+import re
+import time
+
+import markdown
+
+from src.job_search_gui.line_breaker import generate_document
+
+BULLET = "•"
+HEADING_PATTERN = re.compile(r" *(#{1,6})\s+(.*?)(?:\s+#+)?\s*$")
+BULLET_PATTERN = re.compile(r"( *)(?:([-*+])|(\d{1,9})[.)])\s+(.*)$")
+SETEXT_PATTERN = re.compile(r" *(=+|-+)\s*$")
+RULE_PATTERN = re.compile(r" *(?:(?:-\s*){3,}|(?:\*\s*){3,}|(?:_\s*){3,})$")
+FENCE_PATTERN = re.compile(r"\s*(```|~~~)")
+BLANK_PATTERN = re.compile(r"$")
+BOLD_LINE_PATTERN = re.compile(r"(\*\*|__)([^*_]+?)\1:?$")
+# Bold, italics, code, images and links, and backslash escapes, in one pass
+INLINE_PATTERN = re.compile(
+    r"\*\*(.+?)\*\*|__(.+?)__|\*(?=\S)(.+?)\*|`([^`]*)`|!?\[([^\]]*)\]\([^)]*\)"
+    r"|\\([\\`*_{}\[\]()#+\-.!])")
+TAB_WIDTH = 4  # Spaces a tab is worth when measuring indentation
+
+
+class Block:
+    """
+    A heading, paragraph or bullet of a document.
+
+    Key Attributes:
+        - kind: "heading", "paragraph" or "bullet"
+        - text: The text, newlines separate lines that are broken on purpose
+        - level: The heading level, or the nesting depth of a bullet
+        - marker: What a bullet is marked with, BULLET or its number, i.e. "2."
+    """
+
+    def __init__(self, kind: str, text: str, level: int = 1, marker: str = BULLET):
+        self.kind = kind
+        self.text = text
+        self.level = level
+        self.marker = marker
+
+    def style_name(self):
+        """
+        :return: The key of the block's style in STYLES
+        """
+        if self.kind == "heading":
+            return f"heading{min(self.level, 3)}"
+        return self.kind
+
+    def __eq__(self, other):
+        return isinstance(other, Block) and (self.kind, self.text, self.level, self.marker) == \
+            (other.kind, other.text, other.level, other.marker)
+
+    def __repr__(self):
+        return f"Block({self.kind!r}, {self.text!r}, {self.level}, {self.marker!r})"
+
+
+def clean_inline(text: str):
+    """
+    A method to remove inline markdown from a line of text
+
+    :param text: i.e. "**Python** and [SQL](https://example.com)"
+    :return: i.e. "Python and SQL"
+    """
+    if any(character in text for character in "*_`[\\"):
+        text = INLINE_PATTERN.sub(lambda match: next(
+            group for group in match.groups() if group is not None), text)
+    if "&" in text:
+        text = html.unescape(text)
+    return text
+
+
+class MarkdownConverter:
+    """
+    Converts markdown into Blocks one line at a time.
+
+    Each line is matched against LINE_TYPES, the pattern of each kind of line
+    and the method reading it, and is otherwise a line of text.
+
+    Key Methods:
+        - feed(line): Reads a line, returns the blocks it completed
+        - finish(): Returns the last block
+    """
+
+    def __init__(self):
+        self.block = None  # The block being read
+        self.block_indent = 0
+        self.list_indents = []  # Indentation of each open list level
+        self.in_fence = False
+
+    def feed(self, line: str):
+        """
+        Reads the next line of the document
+
+        :param line: A line, without its newline
+        :return: A list of the blocks completed by the line, usually one or none
+        """
+        line = line.expandtabs(TAB_WIDTH).rstrip()
+        if self.in_fence and not FENCE_PATTERN.match(line):
+            # Code is kept as it is, line by line
+            return self.add_paragraph_line(line) if line else []
+
+        for pattern, read_line in self.LINE_TYPES:
+            match = pattern.match(line)
+            completed = read_line(self, match) if match else None
+            if completed is not None:
+                return completed
+        return self.read_text(line)
+
+    def read_fence(self, _match):
+        """
+        Opens or closes a code block
+        """
+        self.in_fence = not self.in_fence
+        return self.end_block()
+
+    def read_break(self, _match):
+        """
+        Ends the block on a blank line or a horizontal rule
+        """
+        return self.end_block()
+
+    def read_underline(self, match):
+        """
+        Makes the paragraph line above a heading, if there is one
+        """
+        if self.block is None or self.block.kind != "paragraph" or "\n" in self.block.text:
+            return None  # Not an underline, i.e. a horizontal rule
+        self.block.kind = "heading"
+        self.block.level = 1 if match.group(1)[0] == "=" else 2
+        return self.end_block()
+
+    def read_heading(self, match):
+        """
+        Reads a "#" heading, which also ends any list
+        """
+        completed = self.end_block()
+        self.list_indents = []
+        completed.append(Block("heading", clean_inline(match.group(2)), len(match.group(1))))
+        return completed
+
+    def read_bullet(self, match):
+        """
+        Starts a bullet, at the list level of its indentation
+        """
+        completed = self.end_block()
+        indent, symbol, number, text = match.groups()
+        marker = BULLET if symbol else f"{number}."
+        self.block = Block("bullet", clean_inline(text), self.list_level(len(indent)), marker)
+        self.block_indent = len(indent)
+        return completed
+
+    def read_text(self, line: str):
+        """
+        Reads a line of text, which continues a wrapped bullet or a paragraph
+        """
+        stripped = line.lstrip()
+        indent = len(line) - len(stripped)
+        if self.block is not None and self.block.kind == "bullet" and \
+                indent > self.block_indent:
+            self.block.text += " " + clean_inline(stripped)  # A wrapped bullet
+            return []
+        completed = []
+        if self.block is not None and self.block.kind == "bullet":
+            completed = self.end_block()
+        if indent == 0:
+            self.list_indents = []
+        return completed + self.add_paragraph_line(stripped)
+
+    # The kinds of line, tried in order, and the methods reading them.  A
+    # method returns None if the line is not of its kind after all
+    LINE_TYPES = (
+        (FENCE_PATTERN, read_fence),
+        (BLANK_PATTERN, read_break),
+        (SETEXT_PATTERN, read_underline),
+        (RULE_PATTERN, read_break),
+        (HEADING_PATTERN, read_heading),
+        (BULLET_PATTERN, read_bullet),
+    )
+
+    def add_paragraph_line(self, line: str):
+        """
+        Adds a line to the paragraph being read, or starts one
+
+        :param line:
+        :return: The blocks completed, none
+        """
+        text = line if self.in_fence else clean_inline(line)
+        if self.block is None:
+            bold_line = None if self.in_fence else BOLD_LINE_PATTERN.match(line)
+            if bold_line:
+                # A line that is entirely bold, i.e. "**Experience**", is a heading
+                return [Block("heading", clean_inline(bold_line.group(2)), 3)]
+            self.block = Block("paragraph", text)
+        else:
+            self.block.text += "\n" + text
+        return []
+
+    def list_level(self, indent: int):
+        """
+        Finds the nesting level of a list item from its indentation, closing
+        the lists it is outdented from and opening a list if it is indented
+        further
+
+        :param indent: Spaces before the bullet
+        :return: The level, 1 for a top level item
+        """
+        while self.list_indents and indent < self.list_indents[-1]:
+            self.list_indents.pop()
+        if not self.list_indents or indent > self.list_indents[-1]:
+            self.list_indents.append(indent)
+        return len(self.list_indents)
+
+    def end_block(self):
+        """
+        :return: The block being read as a list, empty if there is none
+        """
+        block, self.block = self.block, None
+        return [block] if block is not None and block.text.strip() else []
+
+    def finish(self):
+        """
+        :return: The last block as a list, empty if there is none
+        """
+        self.in_fence = False
+        return self.end_block()
+
+
+def markdown_to_blocks(content: str):
+    """
+    A method to convert a whole markdown document into Blocks
+
+    :param content: A markdown document, i.e. an AI response
+    :return: A list of Blocks
+    """
+    converter = MarkdownConverter()
+    blocks = []
+    for line in content.split("\n"):
+        blocks.extend(converter.feed(line))
+    blocks.extend(converter.finish())
+    return blocks
+
+
+def clean_html(content):
+    """
+    The original clean_html() of generate_resume_and_cover_letter, which
+    converts markdown to HTML and then removes every tag.  Kept as the
+    reference for the benchmark.
+
+    :param content:
+    :return:
+    """
+    # Convert markdown to HTML.  Pdfkit works with HTML format
+    html_content = markdown.markdown(content)
+    # Remove HTML tags.  Regex pattern obtained from Google AI
+    cleaned_content = re.sub(r'<[^>]+>', '', html_content)
+    return cleaned_content
+
+
+def generate_response(sections: int, seed: int = 0):
+    """
+    Generates a large markdown response, with the headings, bullets, bold
+    text and links Google Gemini AI writes, for the benchmark
+
+    :param sections: The number of sections
+    :param seed: The same seed gives the same response
+    :return: The response
+    """
+    paragraphs = iter(generate_document(sections * 4, 60, seed))
+    lines = ["# Jane Doe", "jane@example.com | [Portfolio](https://example.com/jane)", ""]
+    for section in range(sections):
+        lines += [f"## Section {section + 1}", "", f"**Role {section + 1}** | *2020 - 2024*",
+                  next(paragraphs), ""]
+        lines += [f"* **Skill:** {next(paragraphs)}", f"    * {next(paragraphs)}",
+                  f"* Used `Python` with [SQL](https://example.com): {next(paragraphs)}", ""]
+    return "\n".join(lines)
+
+
+def benchmark(sections: int = 200):
+    """
+    Times clean_html() against markdown_to_blocks() on a generated response
+
+    :param sections:
+    :return: A dictionary of the seconds each took, and the speedup
+    """
+    content = generate_response(sections)
+
+    start = time.perf_counter()
+    clean_html(content)
+    clean_html_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    markdown_to_blocks(content)
+    converter_seconds = time.perf_counter() - start
+
+    return {"characters": len(content), "clean_html": clean_html_seconds,
+            "converter": converter_seconds, "speedup": clean_html_seconds / converter_seconds}
+
+
+def main(argv=None):
+    """
+    Program entry
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare clean_html() with the single pass markdown converter")
+    parser.add_argument("--sections", type=int, default=200)
+    arguments = parser.parse_args(argv)
+
+    result = benchmark(arguments.sections)
+    print(f"{result['characters']} characters: clean_html {result['clean_html']:.3f}s, "
+          f"converter {result['converter']:.3f}s ({result['speedup']:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+A module that lays out resumes and cover letters before they are drawn.
+
+generate_pdf() used to strip the markdown down to plain text and draw it
+line by line, measuring with reportlab as it went.  The layout is now done in
+two separate steps:
+
+    1. Layout: The document is turned into Blocks (headings, paragraphs and
+       bullets, by markdown_blocks), and LayoutEngine places every
+       line of every block on a page.  This step is pure Python: text is
+       measured with the precomputed FontMetrics width tables of line_breaker
+       and the result is a list of pages of PositionedLines.
+    2. Drawing: draw_page() hands each page to the canvas as a single text
+       object, switching fonts only where the style changes.
+
+LayoutEngine lays blocks out one at a time and returns each page as soon as
+it is full, so a streamed response can be drawn page by page.
+
+The contact header of a profile (name, email, phone number, LinkedIn and
+GitHub) is the same in every document generated for it, so it is laid out
+once per profile by layout_header(), which caches the HeaderFragment, and is
+not part of the body.  A PDF defines the fragment once as a form XObject,
+with define_header(), and every page draws that form, so the header is
+stored once per document however many pages it has.  With a
+FontMetrics built from any width table the whole layout runs, and can be
+tested and timed, without reportlab.
+
+To time the layout of a long generated document, run (from the project root,
+with PYTHONPATH set to the project root):
+
+    python src/job_search_gui/pdf_layout.py --paragraphs 200
+"""
+import argparse
+import functools
+import hashlib
+import time
+from collections import namedtuple
+
+from src.job_search_gui.line_breaker import LineBreaker, generate_document, get_line_breaker
+from src.job_search_gui.markdown_blocks import Block, markdown_to_blocks
+
+# Constants for layout.
+# This is an extension of the AI assisted code from pdf_formatting()
+MARGIN_LEFT = 40
+MARGIN_TOP = 750
+LINE_HEIGHT = 12  # Spacing between lines
+PARAGRAPH_SPACING = 10
+BOTTOM_MARGIN = 50  # Margin before starting a new page
+MAX_WIDTH = 520  # Max text width before wrapping
+BULLET_INDENT = 15  # Indent of each level of bullets
+HEADER_SPACING = 18  # Space between the contact header and the body
+HEADER_CACHE_SIZE = 64  # Profiles whose header fragments are kept
+CONTACT_SEPARATOR = "  |  "
+
+
+# How the lines of a kind of block are drawn and spaced, in points.  The
+# leading is the distance from one line to the next
+BlockStyle = namedtuple("BlockStyle",
+                        ["font_name", "font_size", "leading", "space_before", "space_after"])
+
+
+STYLES = {
+    "heading1": BlockStyle("Helvetica-Bold", 16, 20, 6, 6),
+    "heading2": BlockStyle("Helvetica-Bold", 13, 16, 6, 4),
+    "heading3": BlockStyle("Helvetica-Bold", 11, 14, 4, 2),
+    "paragraph": BlockStyle("Helvetica", 10, LINE_HEIGHT, 0, PARAGRAPH_SPACING),
+    "bullet": BlockStyle("Helvetica", 10, LINE_HEIGHT, 0, 2),
+    "header_name": BlockStyle("Helvetica-Bold", 18, 22, 0, 0),
+    "header_contact": BlockStyle("Helvetica", 9, 11, 0, 0),
+}
+
+# The contact details of a profile shown in the header of its documents
+ContactDetails = namedtuple("ContactDetails",
+                            ["name", "email", "phone_number", "linkedin", "github"])
+
+
+# A line of text at its final position on a page
+PositionedLine = namedtuple("PositionedLine", ["x", "y", "font_name", "font_size", "text"])
+
+
+# The laid out contact header of a profile: its PositionedLines, where the
+# body of each page starts below it, and the name of its form XObject in a PDF
+HeaderFragment = namedtuple("HeaderFragment", ["lines", "body_top", "form_name"])
+
+
+class LayoutEngine:
+    """
+    Places the lines of Blocks on pages, top to bottom, in pure Python.
+
+    Key Methods:
+        - add_block(block): Lays out a block, returns the pages it filled
+        - finish(): Returns the last page
+    """
+
+    def __init__(self, font_metrics=None, styles: dict = None, top: float = MARGIN_TOP):
+        """
+        :param font_metrics: A function returning the FontMetrics of a font
+            name.  By default the shared LineBreakers, which read their width
+            tables from reportlab, are used
+        :param styles: The BlockStyles by style name, STYLES by default
+        :param top: Where the text of each page starts, below the header if
+            there is one
+        """
+        self.font_metrics = font_metrics
+        self.styles = styles or STYLES
+        self.top = top
+        self.line_breakers = {}
+        self.page = []
+        self.y_position = top  # Track vertical position for text placement
+        self.lines_laid_out = 0
+
+    def get_line_breaker(self, style: BlockStyle):
+        """
+        :param style:
+        :return: The LineBreaker of the style's font
+        """
+        key = (style.font_name, style.font_size)
+        if key not in self.line_breakers:
+            if self.font_metrics is None:
+                self.line_breakers[key] = get_line_breaker(*key)
+            else:
+                self.line_breakers[key] = LineBreaker(
+                    *key, string_width=self.font_metrics(style.font_name).string_width)
+        return self.line_breakers[key]
+
+    def add_block(self, block: Block):
+        """
+        Lays out a block below the previous one
+
+        :param block:
+        :return: The pages that were filled by this block, usually none
+        """
+        style = self.styles[block.style_name()]
+        line_breaker = self.get_line_breaker(style)
+        indent = BULLET_INDENT * block.level if block.kind == "bullet" else 0
+        finished_pages = []
+        first_line = True
+
+        if self.page:
+            self.y_position -= style.space_before
+        for text in block.text.split("\n"):
+            if not text.strip():
+                continue
+            for wrapped_line in line_breaker.wrap(text.strip(), MAX_WIDTH - indent):
+                if self.y_position < BOTTOM_MARGIN:  # If at bottom, start a new page
+                    finished_pages.append(self.page)
+                    self.page = []
+                    self.y_position = self.top  # Reset y_position for the new page
+
+                if block.kind == "bullet" and first_line:
+                    self.page.append(PositionedLine(
+                        MARGIN_LEFT + indent - BULLET_INDENT + 4, self.y_position,
+                        style.font_name, style.font_size, block.marker))
+                self.page.append(PositionedLine(MARGIN_LEFT + indent, self.y_position,
+                                                style.font_name, style.font_size, wrapped_line))
+                self.y_position -= style.leading  # Move down for the next line
+                self.lines_laid_out += 1
+                first_line = False
+
+        self.y_position -= style.space_after
+        return finished_pages
+
+    def finish(self):
+        """
+        :return: The last page, as a list of pages, empty if nothing was laid out
+        """
+        finished_pages = [self.page] if self.page else []
+        self.page = []
+        return finished_pages
+
+
+def layout_blocks(blocks, font_metrics=None, top: float = MARGIN_TOP):
+    """
+    A method to lay out a whole document
+
+    :param blocks: The Blocks of the document
+    :param font_metrics: See LayoutEngine
+    :param top: Where the text of each page starts
+    :return: A list of pages, each a list of PositionedLines
+    """
+    engine = LayoutEngine(font_metrics, top=top)
+    pages = []
+    for block in blocks:
+        pages.extend(engine.add_block(block))
+    pages.extend(engine.finish())
+    return pages
+
+
+@functools.lru_cache(maxsize=HEADER_CACHE_SIZE)
+def layout_header(contact_details: ContactDetails, font_metrics=None):
+    """
+    A method to lay out the contact header of a profile: the name, then its
+    email, phone number, LinkedIn and GitHub on one line.  Headers are cached,
+    so each profile is laid out once.
+
+    :param contact_details: A ContactDetails, empty fields are left out
+    :param font_metrics: See LayoutEngine
+    :return: A HeaderFragment, or None if every field is empty
+    """
+    engine = LayoutEngine(font_metrics)
+    lines = []
+    y_position = MARGIN_TOP
+    name_style, contact_style = STYLES["header_name"], STYLES["header_contact"]
+
+    if contact_details.name:
+        lines.append(PositionedLine(MARGIN_LEFT, y_position, name_style.font_name,
+                                    name_style.font_size, contact_details.name))
+        y_position -= name_style.leading
+    contact = CONTACT_SEPARATOR.join(field for field in contact_details[1:] if field)
+    if contact:
+        for wrapped_line in engine.get_line_breaker(contact_style).wrap(contact, MAX_WIDTH):
+            lines.append(PositionedLine(MARGIN_LEFT, y_position, contact_style.font_name,
+                                        contact_style.font_size, wrapped_line))
+            y_position -= contact_style.leading
+    if not lines:
+        return None
+
+    digest = hashlib.sha1(repr(tuple(contact_details)).encode("utf-8")).hexdigest()
+    return HeaderFragment(tuple(lines), y_position - HEADER_SPACING, f"Header{digest[:12]}")
+
+
+def draw_lines(lines, pdf_canvas):
+    """
+    A method to draw laid out lines on a canvas as one text object
+
+    :param lines: A list of PositionedLines
+    :param pdf_canvas: A reportlab canvas, or any object with its text methods
+    """
+    text_object = pdf_canvas.beginText()
+    font = None
+    for line in lines:
+        if (line.font_name, line.font_size) != font:
+            font = (line.font_name, line.font_size)
+            text_object.setFont(*font)
+        text_object.setTextOrigin(line.x, line.y)
+        text_object.textOut(line.text)
+    pdf_canvas.drawText(text_object)
+
+
+def define_header(header: HeaderFragment, pdf_canvas):
+    """
+    A method to define a header as a form XObject of a PDF, before its
+    first page is drawn
+
+    :param header:
+    :param pdf_canvas: A reportlab canvas
+    """
+    pdf_canvas.beginForm(header.form_name)
+    draw_lines(header.lines, pdf_canvas)
+    pdf_canvas.endForm()
+
+
+def draw_page(page, pdf_canvas, header: HeaderFragment = None):
+    """
+    A method to draw a laid out page on a canvas, then finish the page
+
+    :param page: A list of PositionedLines
+    :param pdf_canvas: A reportlab canvas, or any object with its text methods
+    :param header: A header already defined with define_header(), drawn at
+        the top of the page
+    """
+    if header is not None:
+        pdf_canvas.doForm(header.form_name)
+    draw_lines(page, pdf_canvas)
+    pdf_canvas.showPage()
+
+
+def benchmark(paragraphs: int = 200, words_per_paragraph: int = 120):
+    """
+    Times the layout of a generated document with headings and bullets
+
+    :param paragraphs:
+    :param words_per_paragraph:
+    :return: A dictionary of the seconds taken and the number of pages
+    """
+    document = []
+    for index, paragraph in enumerate(generate_document(paragraphs, words_per_paragraph)):
+        if index % 10 == 0:
+            document.append(f"## Section {index // 10 + 1}")
+        document.append(f"- {paragraph}" if index % 3 == 0 else paragraph)
+    content = "\n\n".join(document)
+
+    start = time.perf_counter()
+    blocks = markdown_to_blocks(content)
+    parsed = time.perf_counter()
+    pages = layout_blocks(blocks)
+    laid_out = time.perf_counter()
+    return {"markdown": parsed - start, "layout": laid_out - parsed, "pages": len(pages)}
+
+
+def main(argv=None):
+    """
+    Program entry
+    """
+    parser = argparse.ArgumentParser(description="Time the layout of a long document")
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--words", type=int, default=120, help="words per paragraph")
+    arguments = parser.parse_args(argv)
+
+    result = benchmark(arguments.paragraphs, arguments.words)
+    print(f"{arguments.paragraphs} paragraphs of {arguments.words} words, "
+          f"{result['pages']} pages: markdown {result['markdown']:.3f}s, "
+          f"layout {result['layout']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
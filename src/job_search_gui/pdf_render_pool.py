@@ -0,0 +1,97 @@
+"""
+A module for rendering many resume and cover letter PDFs at the same time.
+
+Laying out and drawing a PDF is CPU bound, so threads rendering PDFs take
+turns on a single core.  PdfRenderPool renders them on a pool of worker
+processes instead, one PDF per process at a time, so exporting hundreds of
+documents uses every core.
+
+Each task is a (content, company, job_title, kind) tuple, kind being
+"resume" or "cover_letter", optionally followed by the ContactDetails of the
+profile to draw in the header.  A worker renders it with generate_pdf(), which
+writes the PDF to a temporary file and renames it into place only once it is
+complete, so a PDF in resumes_and_cover_letters is never half written.  The
+caller gets a Future for each task, whose result is the path of the PDF.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from src.job_search_gui.generate_resume_and_cover_letter import (
+    generate_pdf, resume_and_cover_letter_directory)
+
+RENDER_WORKERS = os.cpu_count() or 1  # Worker processes, one per core
+
+# A PDF to render.  Like a DocumentRequest it has the job_title, company and
+# contact_details attributes generate_pdf() reads.
+RenderTask = namedtuple("RenderTask",
+                        ["content", "company", "job_title", "kind", "contact_details"],
+                        defaults=(None,))
+
+
+def render_task(task: RenderTask, output_directory: str = None):
+    """
+    Worker function that renders one task, run in a worker process
+
+    :param task: A RenderTask
+    :param output_directory: Defaults to resumes_and_cover_letters
+    :return: The path of the PDF
+    """
+    return generate_pdf(task.content, task, task.kind, output_directory)
+
+
+class PdfRenderPool:
+    """
+    Renders PDFs on a pool of worker processes.
+
+    Key Methods:
+        - submit(task, output_directory): Queues a task, returns its Future
+        - render_all(tasks, output_directory): Queues many tasks
+        - shutdown(): Waits for the queued tasks, then stops the workers
+
+    The pool can also be used as a context manager, which shuts it down.
+    """
+
+    def __init__(self, max_workers: int = RENDER_WORKERS,
+                 output_directory: str = resume_and_cover_letter_directory):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.output_directory = output_directory
+
+    def submit(self, task, output_directory: str = None):
+        """
+        Queues a PDF to render
+
+        :param task: A (content, company, job_title, kind[, contact_details])
+            tuple or RenderTask
+        :param output_directory: The directory to save the PDF to, the
+            pool's output_directory by default
+        :return: A Future whose result is the path of the PDF
+        """
+        output_directory = output_directory or self.output_directory
+        os.makedirs(output_directory, exist_ok=True)
+        return self.executor.submit(render_task, RenderTask(*task), output_directory)
+
+    def render_all(self, tasks, output_directory: str = None):
+        """
+        Queues many PDFs to render
+
+        :param tasks: An iterable of (content, company, job_title, kind) tuples
+        :param output_directory: See submit()
+        :return: A list of Futures, in the order of the tasks
+        """
+        return [self.submit(task, output_directory) for task in tasks]
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False):
+        """
+        Stops the worker processes
+
+        :param wait: Set to False to return without waiting for the workers
+        :param cancel_futures: Set to True to drop the tasks that have not started
+        """
+        self.executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.shutdown(cancel_futures=exception_type is not None)
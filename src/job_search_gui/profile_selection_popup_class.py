@@ -3,10 +3,22 @@ This module defines the ProfileSelectioPopup class to display a list of
 previously submitted user profiles.  After selection of a profile, the user
 can choose to generate a resume and cover letter based on the previously
 selected job listing, and the selected profile.
+
+Documents are generated in the background by DOCUMENT_JOBS, so the GUI stays
+responsive while the AI writes them.  Each request is listed in the popup's
+DocumentJobsPanel with its progress, more can be requested while earlier ones
+are still running, and the selected request can be cancelled.  A cancelled
+request stops at its next step or streamed chunk of the AI's response.
 """
 
+import queue
 import tkinter as tk
-from src.job_search_gui.generate_resume_and_cover_letter import generate_documents
+from src.job_search_gui.database_handler import PROFILE_BY_NAME_QUERY, PROFILE_NAMES_QUERY
+from src.job_search_gui.document_jobs import (DOCUMENT_JOBS, FINISHED_STATUSES, DocumentJob,
+                                              DocumentRequest)
+from src.job_search_gui.pdf_layout import ContactDetails
+
+JOB_POLL_MS = 100  # Milliseconds between checks for document job progress
 
 
 class ProfileSelectionPopup(tk.Toplevel):
@@ -17,10 +29,12 @@ class ProfileSelectionPopup(tk.Toplevel):
         - parent: The parent window is the job_listing_popup window
         - db_conn: The database connection
         - listbox: A Tkinter Listbox widget to display profiles
+        - jobs_panel: A DocumentJobsPanel showing the progress of the
+            documents requested from this popup
 
     Methods:
         - fetch_profiles: Retrieves profiles from the database
-        - on_select: Handles profile selection and closes the popup
+        - on_select: Handles profile selection and starts document generation
     """
 
     def __init__(self, parent):
@@ -31,8 +45,6 @@ class ProfileSelectionPopup(tk.Toplevel):
         self.relevant_job_info = parent.relevant_job_info
         self.company = parent.job_info['company']
         self.job_title = parent.job_info['job_title']
-        self.user_profile = None
-        self.profile_name = None
 
         # Popup window label
         label = tk.Label(self, text="Select a Profile:")
@@ -47,6 +59,10 @@ class ProfileSelectionPopup(tk.Toplevel):
                                   command=self.on_select)
         select_button.pack(pady=5)  # Button padding
 
+        # The progress of each requested document job
+        self.jobs_panel = DocumentJobsPanel(self)
+        self.jobs_panel.pack(fill=tk.X)
+
         # Fetch and display profiles
         self.fetch_profiles()
 
@@ -56,7 +72,7 @@ class ProfileSelectionPopup(tk.Toplevel):
         """
 
         cursor = self.db_conn.cursor()
-        cursor.execute("SELECT profile_name FROM user_profiles")
+        cursor.execute(PROFILE_NAMES_QUERY)
         profiles = cursor.fetchall()
 
         # Insert profile names (identifier) into the listbox
@@ -66,27 +82,135 @@ class ProfileSelectionPopup(tk.Toplevel):
     def on_select(self):
         """
         Retrieves the data associated with the selected profile, formats that
-        information into a structured string, assigns it to the class attribute
-        user_profile, then calls generate_documents to have Google Gemini AI
-        use the job listing and the user profile to create targeted resume
-        and cover letter
+        information into a structured string, then submits a DocumentJob to
+        have Google Gemini AI use the job listing and the user profile to
+        create targeted resume and cover letter in the background
         """
         selected_profile = self.listbox.get(tk.ACTIVE)  # Retrieve the selected item (job listing)
         cursor = self.db_conn.cursor()
-        cursor.execute("SELECT * FROM user_profiles WHERE profile_name = ?", (selected_profile,))
+        cursor.execute(PROFILE_BY_NAME_QUERY, (selected_profile,))
 
         profile = cursor.fetchall()
         profile = profile[0]
 
-        self.user_profile = (f"Name: {profile[1]}\n"
-                               f"Email: {profile[3]}\n"
-                               f"Phone Number: {profile[4]}\n"
-                               f"LinkedIn: {profile[5]}\n"
-                               f"GitHub: {profile[6]}\n"
-                               f"Classes Taken: {profile[7]}\n"
-                               f"Projects Worked On: {profile[8]}\n"
-                               f"Additional Info: {profile[9]}")
+        self.jobs_panel.submit(DocumentJob(DocumentRequest(
+            self.job_title, self.company, self.relevant_job_info, profile[2],
+            format_user_profile(profile), get_contact_details(profile))))
+
+
+class DocumentJobsPanel(tk.Frame):
+    """
+    A panel listing the document jobs requested from a popup, with their
+    progress, and a button to cancel the selected one.
+
+    Key Attributes:
+        - jobs_listbox: A Tkinter Listbox widget showing the progress of each job
+        - jobs: The document jobs, in jobs_listbox order
+        - job_messages: The queue the document jobs report their progress to
+
+    Methods:
+        - submit: Submits a document job to DOCUMENT_JOBS and lists it
+        - cancel_job: Cancels the selected document request
+        - poll_jobs: Shows the progress reported by the document jobs
+    """
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.jobs = []
+        self.job_messages = queue.Queue()
+        self.poll_id = None
+
+        self.jobs_listbox = tk.Listbox(self, height=4)
+        self.jobs_listbox.pack(padx=20, pady=(5, 0), fill=tk.X)
+
+        cancel_button = tk.Button(self, text="Cancel Selected Request", command=self.cancel_job)
+        cancel_button.pack(pady=5)
+
+    def submit(self, job):
+        """
+        Submits a document job to DOCUMENT_JOBS, lists it and starts polling
+        for its progress
+
+        :param job: A DocumentJob
+        """
+        self.jobs.append(job)
+        self.jobs_listbox.insert(tk.END, job.describe())
+        DOCUMENT_JOBS.submit(job, self.job_messages)
+
+        if self.poll_id is None:
+            self.poll_id = self.after(JOB_POLL_MS, self.poll_jobs)
+
+    def cancel_job(self):
+        """
+        Cancels the document job selected in the jobs listbox, or the most
+        recent unfinished one if none is selected
+        """
+        selection = self.jobs_listbox.curselection()
+        if selection:
+            self.jobs[selection[0]].cancel()
+            return
 
-        self.profile_name = profile[2]
+        for job in reversed(self.jobs):
+            if job.status not in FINISHED_STATUSES:
+                job.cancel()
+                return
+
+    def poll_jobs(self):
+        """
+        Shows the progress the document jobs reported since the last poll,
+        and keeps polling while any of them is unfinished
+        """
+        while True:
+            try:
+                job, _, description = self.job_messages.get_nowait()
+            except queue.Empty:
+                break
+            index = self.jobs.index(job)
+            self.jobs_listbox.delete(index)
+            self.jobs_listbox.insert(index, f"{job.describe()}: {description}")
+
+        if any(job.status not in FINISHED_STATUSES for job in self.jobs) \
+                or not self.job_messages.empty():
+            self.poll_id = self.after(JOB_POLL_MS, self.poll_jobs)
+        else:
+            self.poll_id = None
+
+    def destroy(self):
+        """
+        Stops polling and closes the panel, requested documents are still
+        generated in the background
+        """
+        if self.poll_id is not None:
+            self.after_cancel(self.poll_id)
+            self.poll_id = None
+        super().destroy()
 
-        generate_documents(self)
+
+def format_user_profile(profile):
+    """
+    Formats a row of the user_profiles table into the structured string used
+    to formulate our query to Google Gemini AI
+
+    :param profile: A row returned by PROFILE_BY_NAME_QUERY
+    :return String:
+    """
+    return (f"Name: {profile[1]}\n"
+            f"Email: {profile[3]}\n"
+            f"Phone Number: {profile[4]}\n"
+            f"LinkedIn: {profile[5]}\n"
+            f"GitHub: {profile[6]}\n"
+            f"Classes Taken: {profile[7]}\n"
+            f"Projects Worked On: {profile[8]}\n"
+            f"Additional Info: {profile[9]}")
+
+
+def get_contact_details(profile):
+    """
+    Picks the fields of a row of the user_profiles table that are drawn in
+    the header of its documents
+
+    :param profile: A row returned by PROFILE_BY_NAME_QUERY
+    :return ContactDetails:
+    """
+    return ContactDetails(*((field or "").strip() for field in
+                            (profile[1], profile[3], profile[4], profile[5], profile[6])))
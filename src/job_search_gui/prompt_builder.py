@@ -0,0 +1,236 @@
+"""
+A module that builds the AI queries for the resume and cover letter of a job
+listing and profile, keeping them within a token budget.
+
+get_resume_query() and get_cover_letter_query() put the whole job listing,
+scraped description and all, and the whole profile into each query, so the
+same context is sent twice, boilerplate included.  Input tokens are most of
+the latency and cost of a query, so build_prompts() compacts the context
+before either query is built:
+
+    - The description is stripped of HTML tags and entities, markdown
+      escapes and emphasis, and runs of whitespace
+    - Boilerplate (equal opportunity statements, accommodation and privacy
+      notices, "apply now" links, hashtags) is dropped sentence by sentence,
+      and so is every sentence that repeats an earlier one
+    - Fields of the job listing and profile that are empty or "None" are
+      left out
+    - If the context is still over the token budget, the description is cut
+      at a line or sentence boundary, and then the profile if it has to be
+
+The context is compacted once and shared by both queries, which are
+identical up to the closing instruction.  Descriptions are cached, so a job
+listing paired with many profiles in a batch is compacted once.
+
+Tokens are estimated at CHARS_PER_TOKEN characters each, which is close
+enough for English text to budget with, without a request to count them.
+Every PromptSet keeps the tokens its queries would have taken before they
+were compacted, so the tokens saved can be reported.
+"""
+import functools
+import html
+import re
+from dataclasses import dataclass, field
+
+PROMPT_TOKEN_BUDGET = 1500  # Estimated tokens per query, instruction included
+CHARS_PER_TOKEN = 4  # Characters per token, on average, in English text
+DESCRIPTION_CACHE_SIZE = 256  # Compacted descriptions kept
+DESCRIPTION_LABEL = "Description:"
+
+BREAK_TAG_PATTERN = re.compile(r"<\s*(?:br|/?p|/?div|/?li|/?ul|/?ol|/?h\d|/?tr)\b[^>]*>",
+                               re.IGNORECASE)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+# Markdown escapes, i.e. "\-", and bold or italic markers
+MARKDOWN_PATTERN = re.compile(r"\\([\\`*_{}\[\]()#+\-.!&>])|\*{1,3}|(?<!\w)_{2,3}|_{2,3}(?!\w)")
+WHITESPACE_PATTERN = re.compile(r"[ \t\r\f\v\u00a0]+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[\"'(]?[A-Z])")
+WORD_PATTERN = re.compile(r"\W+")
+EMPTY_FIELD_PATTERN = re.compile(r"[\w ()/-]+:\s*(?:none|null|nan|n/a)?\s*$", re.IGNORECASE)
+BOILERPLATE_PATTERN = re.compile(
+    r"equal (?:employment )?opportunit|affirmative action|without regard to"
+    r"|regardless of (?:race|color|religion|sex|gender|age|national origin)"
+    r"|all qualified applicants|reasonable accommodation|protected veteran|e-verify"
+    r"|pay transparency|(?:privacy|cookie) (?:policy|notice|statement)"
+    r"|apply (?:now|today|here|online)|click (?:here|apply)|follow us on"
+    r"|#LI-\w+|^(?:#[\w-]+\s*)+$",
+    re.IGNORECASE)
+
+
+@dataclass
+class PromptSet:
+    """
+    The queries for the documents of one job listing and profile.
+
+    Key Attributes:
+        - queries: The query of each document, i.e. {"resume": ..., "cover_letter": ...}
+        - original_tokens: The estimated tokens of each query before compaction
+        - truncated: True if the context was cut to fit the token budget
+        - prompt_tokens: The estimated tokens of each compacted query
+
+    Key Methods:
+        - summary(): The token counts of the queries, and the tokens saved
+    """
+    queries: dict
+    original_tokens: dict
+    truncated: bool = False
+    prompt_tokens: dict = field(init=False)
+
+    def __post_init__(self):
+        self.prompt_tokens = {kind: estimate_tokens(query)
+                              for kind, query in self.queries.items()}
+
+    def summary(self):
+        """
+        :return: i.e. {"original": 3200, "prompt": 1400, "saved": 1800, "truncated": False}
+        """
+        original = sum(self.original_tokens.values())
+        prompt = sum(self.prompt_tokens.values())
+        return {"original": original, "prompt": prompt, "saved": original - prompt,
+                "truncated": self.truncated}
+
+
+def estimate_tokens(text: str):
+    """
+    :param text:
+    :return: The estimated number of tokens in text, rounded up
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def format_prompt_tokens(summary: dict):
+    """
+    A method to format the token summary of a PromptSet
+
+    :param summary: i.e. {"original": 3200, "prompt": 1400, "saved": 1800, "truncated": False}
+    :return: i.e. "1400 prompt tokens, 1800 saved (56%)"
+    """
+    saved_share = summary["saved"] / summary["original"] if summary["original"] else 0.0
+    truncated = ", truncated to the budget" if summary["truncated"] else ""
+    return (f"{summary['prompt']} prompt tokens, {summary['saved']} saved "
+            f"({saved_share:.0%}){truncated}")
+
+
+def format_query(job_listing: str, user_profile: str, instruction: str):
+    """
+    A method to put a job listing, a profile and an instruction together into
+    a query.  The job listing and profile come first, so the queries of a
+    pair only differ at the end.
+
+    :param job_listing:
+    :param user_profile:
+    :param instruction: i.e. "... please write me a sample resume ..."
+    :return: The query
+    """
+    return (f"Job Description: {job_listing}\n\n"
+            f"Personal Information: {user_profile}\n\n"
+            f"{instruction}")
+
+
+def compact_fields(text: str):
+    """
+    A method to collapse the whitespace of "Label: value" lines and drop the
+    lines whose value is empty or "None"
+
+    :param text: i.e. "Name: Jane\n\nPhone Number: None\nGitHub: "
+    :return: i.e. "Name: Jane"
+    """
+    lines = []
+    for line in text.split("\n"):
+        line = WHITESPACE_PATTERN.sub(" ", line).strip()
+        if line and not EMPTY_FIELD_PATTERN.fullmatch(line):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+@functools.lru_cache(maxsize=DESCRIPTION_CACHE_SIZE)
+def compact_description(description: str):
+    """
+    A method to strip a scraped job description down to its content: markup
+    and boilerplate are removed, and every sentence is kept only once
+
+    :param description: Plain text, markdown or HTML
+    :return: The compacted description, one paragraph per line
+    """
+    text = BREAK_TAG_PATTERN.sub("\n", description)
+    text = html.unescape(TAG_PATTERN.sub("", text))
+    text = MARKDOWN_PATTERN.sub(lambda match: match.group(1) or "", text)
+
+    seen = set()
+    lines = []
+    for line in text.split("\n"):
+        sentences = []
+        for sentence in SENTENCE_PATTERN.split(WHITESPACE_PATTERN.sub(" ", line).strip()):
+            key = WORD_PATTERN.sub(" ", sentence.lower()).strip()
+            if not key or key in seen or BOILERPLATE_PATTERN.search(sentence):
+                continue
+            seen.add(key)
+            sentences.append(sentence)
+        if sentences:
+            lines.append(" ".join(sentences))
+    return "\n".join(lines)
+
+
+def truncate_to_tokens(text: str, max_tokens: int):
+    """
+    A method to cut text down to a number of tokens, at the last line or
+    sentence boundary that fits, or else the last space
+
+    :param text:
+    :param max_tokens:
+    :return: The text, whole if it already fits
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max(0, max_tokens) * CHARS_PER_TOKEN]
+    boundary = max(cut.rfind("\n"), cut.rfind(". ") + 1)
+    if boundary < len(cut) // 2:  # Too much would be lost, cut between words instead
+        boundary = cut.rfind(" ")
+    return (cut[:boundary] if boundary > 0 else cut).rstrip()
+
+
+def build_prompts(user_profile: str, job_listing: str, instructions: dict,
+                  token_budget: int = PROMPT_TOKEN_BUDGET, closing_note: str = None):
+    """
+    A method to build the query of each document from one compacted context
+
+    :param user_profile: i.e. format_user_profile(profile)
+    :param job_listing: i.e. get_relevant_info(job_info)
+    :param instructions: The instruction of each document, by kind
+    :param token_budget: The most tokens any query may take, None for no limit
+    :param closing_note: A sentence added after every instruction, if any
+    :return: A PromptSet
+    """
+    if closing_note:
+        instructions = {kind: f"{instruction}  {closing_note}"
+                        for kind, instruction in instructions.items()}
+    original_tokens = {kind: estimate_tokens(format_query(job_listing, user_profile, instruction))
+                       for kind, instruction in instructions.items()}
+
+    job_header, label, description = job_listing.partition(DESCRIPTION_LABEL)
+    if not label:  # Not a formatted job listing, all of it is the description
+        job_header, description = "", job_listing
+    job_header = compact_fields(job_header)
+    description = compact_description(description)
+    user_profile = compact_fields(user_profile)
+    longest_instruction = max(instructions.values(), key=len)
+
+    def compacted_job_listing():
+        description_line = f"{DESCRIPTION_LABEL} {description}" if description else ""
+        return "\n".join(part for part in (job_header, description_line) if part)
+
+    def excess_tokens():
+        query = format_query(compacted_job_listing(), user_profile, longest_instruction)
+        return estimate_tokens(query) - token_budget
+
+    truncated = False
+    if token_budget is not None and excess_tokens() > 0:
+        truncated = True
+        description = truncate_to_tokens(
+            description, estimate_tokens(description) - excess_tokens())
+        if excess_tokens() > 0:
+            user_profile = truncate_to_tokens(
+                user_profile, estimate_tokens(user_profile) - excess_tokens())
+
+    queries = {kind: format_query(compacted_job_listing(), user_profile, instruction)
+               for kind, instruction in instructions.items()}
+    return PromptSet(queries, original_tokens, truncated)
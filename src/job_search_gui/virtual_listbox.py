@@ -0,0 +1,314 @@
+"""
+A module that defines a virtual list widget for displaying very long lists
+of rows, i.e. every job listing in the database.
+
+A tk.Listbox holds one Tcl string per row, so filling it with 50,000 job
+listings means 50,000 insert() calls before the window can be drawn, and the
+same again every time the list is re-sorted.  VirtualListbox only ever holds
+the rows that are on screen, plus OVERSCAN_ROWS rows above and below them.
+Rows are asked for, by index, from a row source function as the user
+scrolls, and a separate scrollbar represents the full length of the list.
+Showing a list, or showing it in a new order, costs the same no matter how
+many rows it has.
+
+RowWindow keeps track of which rows are materialized and is plain Python so
+it can be tested without a display.  VirtualListbox wraps it in a tk.Frame
+and mimics the parts of the tk.Listbox interface the main window uses
+(curselection, select_set, select_clear, activate, see, bind, size), always
+with indices into the full list rather than into the rows on screen.
+
+The widget handles the mouse itself: clicks select a row and the wheel
+scrolls.  It has no key bindings of its own, not even the Listbox class
+bindings, so keyboard navigation belongs to the owner of the widget, which
+binds keys with bind() and moves the selection with select_set() and see(),
+i.e. AppMainWindow.navigate() for the Up and Down keys.
+"""
+import tkinter as tk
+from tkinter import font as tkfont
+
+OVERSCAN_ROWS = 10  # Rows materialized above and below the visible rows
+SCROLL_UNITS = 3  # Rows scrolled per mouse wheel step
+
+
+class RowWindow:
+    """
+    The rows of a virtual list that are currently materialized.
+
+    Key Attributes:
+        - row_count: The number of rows in the full list
+        - first_visible: The index of the top row on screen
+        - visible_count: The number of rows that fit on screen
+        - start: The index of the first materialized row
+        - rows: The text of the materialized rows, starting with row start
+
+    Key Methods:
+        - set_source(row_count, get_row): Points the window at a new list
+        - scroll_to(index): Makes index the top row on screen
+        - materialize(): Fetches the rows that came into view, and drops the
+            rows that went out of view
+    """
+
+    def __init__(self, get_row=None, row_count: int = 0, overscan: int = OVERSCAN_ROWS):
+        self.get_row = get_row
+        self.row_count = row_count
+        self.overscan = overscan
+        self.first_visible = 0
+        self.visible_count = 1
+        self.start = 0
+        self.rows = []
+
+    def set_source(self, row_count: int, get_row):
+        """
+        Replaces the list the window shows.  Every materialized row is dropped,
+        the view is kept at the same position.
+
+        :param row_count: The number of rows in the new list
+        :param get_row: A function that returns the text of a row given its index
+        """
+        self.get_row = get_row
+        self.row_count = row_count
+        self.start = 0
+        self.rows = []
+        self.scroll_to(self.first_visible)
+
+    def set_row_count(self, row_count: int):
+        """
+        Grows or shrinks the list without dropping the materialized rows, i.e.
+        as more rows are loaded
+
+        :param row_count: The number of rows in the list
+        """
+        self.row_count = row_count
+        self.rows = self.rows[:max(0, row_count - self.start)]
+        self.scroll_to(self.first_visible)
+
+    def scroll_to(self, index: int):
+        """
+        Makes a row the top row on screen, as far as the end of the list allows
+
+        :param index: Index of a row in the full list
+        """
+        last_first_visible = max(0, self.row_count - self.visible_count)
+        self.first_visible = min(max(0, index), last_first_visible)
+
+    def materialize(self):
+        """
+        Fetches the rows within OVERSCAN_ROWS of the visible rows that are not
+        materialized yet.  Rows that are already materialized are kept.
+
+        :return: True if the materialized rows changed
+        """
+        start = max(0, self.first_visible - self.overscan)
+        end = min(self.row_count, self.first_visible + self.visible_count + self.overscan)
+        current_end = self.start + len(self.rows)
+
+        if start == self.start and end == current_end:
+            return False
+
+        rows = []
+        for index in range(start, end):
+            if self.start <= index < current_end:
+                rows.append(self.rows[index - self.start])
+            else:
+                rows.append(self.get_row(index))
+
+        self.start, self.rows = start, rows
+        return True
+
+    def fractions(self):
+        """
+        :return: The (first, last) fractions of the full list that are on
+            screen, in the form expected by Scrollbar.set()
+        """
+        if not self.row_count:
+            return 0.0, 1.0
+        last_visible = min(self.row_count, self.first_visible + self.visible_count)
+        return self.first_visible / self.row_count, last_visible / self.row_count
+
+
+class VirtualListbox(tk.Frame):
+    """
+    A listbox that only materializes the rows on screen plus an overscan.
+
+    Key Attributes:
+        - listbox: The tk.Listbox that displays the materialized rows
+        - scrollbar: A scrollbar over the full list
+        - window: The RowWindow tracking the materialized rows
+        - selected: Index of the selected row in the full list, or None
+
+    Key Methods:
+        - set_source(row_count, get_row): Shows a new list, i.e. after a sort
+        - set_row_count(row_count): Grows the list as more rows are loaded
+        - yview(*args): Scrolls the list, also the scrollbar command
+    """
+
+    def __init__(self, parent, **listbox_options):
+        super().__init__(parent)
+        self.window = RowWindow()
+        self.selected = None
+        self.listbox = tk.Listbox(self, selectmode=tk.SINGLE, activestyle='none',
+                                  exportselection=False, **listbox_options)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.line_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1
+
+        # The Listbox class bindings select and scroll by the rows the listbox
+        # holds, the handlers below do it by rows of the full list instead.
+        # Only the mouse is handled here, keys are left to bind(), see the
+        # module docstring
+        self.listbox.bindtags([tag for tag in self.listbox.bindtags() if tag != "Listbox"])
+        self.listbox.bind("<Configure>", self.on_resize)
+        self.listbox.bind("<Button-1>", self.on_click)
+        self.listbox.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.listbox.bind("<Button-4>", lambda _: self.yview("scroll", -SCROLL_UNITS, "units"))
+        self.listbox.bind("<Button-5>", lambda _: self.yview("scroll", SCROLL_UNITS, "units"))
+
+    def set_source(self, row_count: int, get_row):
+        """
+        Shows a new list, clearing the selection and scrolling to the top
+
+        :param row_count: The number of rows in the list
+        :param get_row: A function that returns the text of a row given its index
+        """
+        self.selected = None
+        self.window.first_visible = 0
+        self.window.set_source(row_count, get_row)
+        self.refresh(force=True)
+
+    def set_row_count(self, row_count: int, keep_rows: bool = True):
+        """
+        Grows or shrinks the list, keeping the view and the selection
+
+        :param row_count: The number of rows in the list
+        :param keep_rows: Keep the materialized rows.  Pass False when rows
+            were inserted before the end of the list, so every row on screen
+            is fetched again and the selection is cleared
+        """
+        if keep_rows:
+            self.window.set_row_count(row_count)
+        else:
+            self.selected = None
+            self.window.set_source(row_count, self.window.get_row)
+        if self.selected is not None and self.selected >= row_count:
+            self.selected = None
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False):
+        """
+        Materializes the rows that came into view, then redraws the listbox
+        and the scrollbar
+
+        :param force: Redraw even if no rows were materialized or dropped
+        """
+        if self.window.materialize() or force:
+            self.listbox.delete(0, tk.END)
+            self.listbox.insert(tk.END, *self.window.rows)
+
+        # Keep the first visible row at the top of the listbox
+        self.listbox.yview(self.window.first_visible - self.window.start)
+        self.listbox.select_clear(0, tk.END)
+        if self.selected is not None:
+            local_index = self.selected - self.window.start
+            if 0 <= local_index < len(self.window.rows):
+                self.listbox.select_set(local_index)
+        self.scrollbar.set(*self.window.fractions())
+
+    def yview(self, *args):
+        """
+        Scrolls the list.  Accepts the arguments a scrollbar passes to its
+        command: ("moveto", fraction) or ("scroll", number, "units"/"pages")
+
+        :param args:
+        """
+        if args and args[0] == "moveto":
+            self.window.scroll_to(round(float(args[1]) * self.window.row_count))
+        elif args and args[0] == "scroll":
+            step = self.window.visible_count if args[2] == "pages" else 1
+            self.window.scroll_to(self.window.first_visible + int(args[1]) * step)
+        self.refresh()
+
+    def on_resize(self, event):
+        """
+        Recomputes how many rows fit on screen when the listbox is resized
+
+        :param event:
+        """
+        self.window.visible_count = max(1, event.height // self.line_height)
+        self.window.scroll_to(self.window.first_visible)
+        self.refresh()
+
+    def on_click(self, event):
+        """
+        Selects the clicked row
+
+        :param event:
+        """
+        self.listbox.focus_set()
+        if self.window.rows:
+            self.select_set(self.window.start + self.listbox.nearest(event.y))
+
+    def on_mouse_wheel(self, event):
+        """
+        Scrolls the list on a mouse wheel step
+
+        :param event:
+        """
+        self.yview("scroll", -SCROLL_UNITS if event.delta > 0 else SCROLL_UNITS, "units")
+
+    def curselection(self):
+        """
+        :return: A tuple holding the index of the selected row, if any
+        """
+        return () if self.selected is None else (self.selected,)
+
+    def select_clear(self, _first=0, _last=None):
+        """
+        Clears the selection.  Accepts, and ignores, the arguments of
+        Listbox.select_clear(), there is only ever one selected row
+        """
+        self.selected = None
+        self.refresh()
+
+    def select_set(self, index: int, _last=None):
+        """
+        Selects a row, scrolling it into view.  The last argument of
+        Listbox.select_set() is accepted and ignored
+
+        :param index: Index of the row in the full list
+        """
+        if 0 <= index < self.window.row_count:
+            self.selected = index
+            self.see(index)
+
+    def activate(self, index: int):
+        """
+        Scrolls a row into view, there is no separate active row
+
+        :param index: Index of the row in the full list
+        """
+        self.see(index)
+
+    def see(self, index: int):
+        """
+        Scrolls the list just far enough for a row to be on screen
+
+        :param index: Index of the row in the full list
+        """
+        if index < self.window.first_visible:
+            self.window.scroll_to(index)
+        elif index >= self.window.first_visible + self.window.visible_count:
+            self.window.scroll_to(index - self.window.visible_count + 1)
+        self.refresh()
+
+    def size(self):
+        """
+        :return: The number of rows in the full list
+        """
+        return self.window.row_count
+
+    def bind(self, sequence=None, func=None, add=None):
+        """
+        Binds an event of the listbox, i.e. "<Double-Button-1>"
+        """
+        return self.listbox.bind(sequence, func, add)
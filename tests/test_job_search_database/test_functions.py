@@ -1,13 +1,20 @@
 """
 Test functions for job_seach_database
 """
+import hashlib
 import os
 import json
 import sqlite3
 from contextlib import redirect_stdout
 from pathlib import Path
+from unittest.mock import patch
 from src.job_search_database.file_management import build_path_object, normalize_file
 from src.job_search_database.database_management import create_database, populate_database
+from src.job_search_database.incremental_ingest import incremental_ingest, update_digest
+from src.job_search_database.json_stream import iter_json_objects
+from src.job_search_database.location_normalization import (
+    LOCATION_CACHE, LOCATION_CACHE_SIZE, LOCATION_NORMALIZER, LocationCache, LocationNormalizer)
+from src.job_search_database.parallel_normalization import normalize_file_parallel
 
 # Get directory of the script with os.path.dirname(__file__)
 # Converts path to an absolute path with os.path.abspath()
@@ -194,3 +201,391 @@ def test_5_file_and_database_deletion():
     if test_database.exists():
         test_database.unlink()
         assert not test_database.exists()
+
+
+def test_6_streaming_normalize_file():
+    """
+    Tests to ensure that the streaming parser:
+        * Yields the same objects as json.loads(), even when the buffer has
+          to be refilled in the middle of an object
+        * Produces a normalized file identical to the line by line parser,
+          both for the single line fixture and a pretty-printed copy of it
+    """
+    source_file = Path(os.path.join(test_directory, "json_list_test_file.json"))
+    pretty_file = Path(os.path.join(test_directory, "json_pretty_test_file.json"))
+
+    with open(source_file, "r", encoding="utf-8") as file:
+        expected_objects = json.loads(file.read())
+        file.seek(0)
+        # A tiny chunk size forces many partial reads
+        assert list(iter_json_objects(file, chunk_size=16)) == expected_objects
+
+    with open(pretty_file, "w", encoding="utf-8") as file:
+        json.dump(expected_objects, file, indent=4)
+
+    with open(os.devnull, 'w', encoding='utf-8') as trash_file, redirect_stdout(trash_file):
+        line_output = normalize_file(source_file.name, True)
+        expected_content = line_output.read_text(encoding="utf-8")
+
+        streamed_output = normalize_file(source_file.name, True, streaming=True)
+        assert streamed_output.read_text(encoding="utf-8") == expected_content
+
+        pretty_output = normalize_file(pretty_file.name, True, streaming=True)
+        assert pretty_output.read_text(encoding="utf-8") == expected_content
+
+    for test_file in (pretty_file, line_output, pretty_output):
+        test_file.unlink()
+        assert not test_file.exists()
+
+
+def test_7_parallel_normalize_file():
+    """
+    Tests to ensure that normalize_file_parallel() produces a normalized
+    file that is byte for byte identical to the serial normalize_file(),
+    both when splitting on line boundaries and on arbitrary byte offsets,
+    including files whose strings and nested arrays hold braces, brackets
+    and escaped quotes.  Shard files are removed even when a worker fails.
+    """
+    source_file = Path(os.path.join(test_directory, "json_list_test_file.json"))
+    lines_file = Path(os.path.join(test_directory, "json_lines_test_file.json"))
+    nested_file = Path(os.path.join(test_directory, "json_nested_test_file.json"))
+    invalid_file = Path(os.path.join(test_directory, "json_invalid_test_file.json"))
+
+    # Write a copy of the fixture with one json object per line
+    with open(source_file, "r", encoding="utf-8") as file:
+        json_objects = json.loads(file.read())
+    with open(lines_file, "w", encoding="utf-8") as file:
+        for json_object in json_objects:
+            file.write(json.dumps(json_object) + "\n")
+
+    # A single line array whose objects hold text that looks like json
+    tricky_objects = [{"title": f'Engineer {{"{index}": [{{}}]}}',
+                       "location": "Boston, MA",
+                       "description": 'Uses "{", "[" and \\"quotes\\" {} [] } ] \u00e9',
+                       "jobProviders": [{"jobProvider": "{[\"x\"]}", "url": "a, b"},
+                                        [{"nested": {"deeper": ["{", "}"]}}]]}
+                      for index in range(40)]
+    with open(nested_file, "w", encoding="utf-8") as file:
+        file.write(json.dumps(tricky_objects, ensure_ascii=False))
+
+    with open(os.devnull, 'w', encoding='utf-8') as trash_file, redirect_stdout(trash_file):
+        for test_file in (source_file, lines_file, nested_file):
+            serial_output = normalize_file(test_file.name, True)
+            expected_content = serial_output.read_bytes()
+
+            for workers in (2, 3):
+                if test_file is not nested_file:
+                    parallel_output = normalize_file_parallel(test_file.name, True, workers)
+                    assert parallel_output.read_bytes() == expected_content
+
+                parallel_output = normalize_file_parallel(test_file.name, True, workers,
+                                                          streaming=True)
+                assert parallel_output.read_bytes() == expected_content
+
+            parallel_output.unlink()
+            assert not parallel_output.exists()
+
+    # The locations the workers normalize are merged back into this process
+    saved_size, saved_entries = LOCATION_CACHE.max_size, list(LOCATION_CACHE.entries.items())
+    expected_locations = {json_object["location"] for json_object in json_objects}
+    with open(os.devnull, 'w', encoding='utf-8') as trash_file, redirect_stdout(trash_file):
+        for cache_size in (LOCATION_CACHE_SIZE, 0):
+            LOCATION_CACHE.entries.clear()
+            LOCATION_CACHE.resize(cache_size)
+            normalize_file_parallel(lines_file.name, True, 2).unlink()
+            assert set(LOCATION_CACHE.entries) == (expected_locations if cache_size else set())
+    LOCATION_CACHE.entries.clear()
+    LOCATION_CACHE.resize(saved_size)
+    LOCATION_CACHE.update(saved_entries)
+
+    # A worker that fails still has its shard files removed
+    with open(invalid_file, "wb") as file:
+        file.write(lines_file.read_bytes() + b'{"title": "\xff"}\n')
+    try:
+        normalize_file_parallel(invalid_file.name, True, 2)
+        assert False, "An invalid file should fail to normalize"
+    except UnicodeDecodeError:
+        pass
+
+    # No shard files are left behind
+    assert not list(Path(test_directory).glob("*.shard"))
+
+    for test_file in (lines_file, nested_file, invalid_file):
+        test_file.unlink()
+        assert not test_file.exists()
+
+
+def test_8_location_normalizer():
+    """
+    Tests to ensure that the precompiled LocationNormalizer normalizes the
+    fixture's job listings and a set of known outliers as the original step
+    by step location rules did.
+    """
+    with open(os.path.join(test_directory, "json_list_test_file.json"), "r",
+              encoding="utf-8") as file:
+        locations = [json_object["location"] for json_object in json.loads(file.read())]
+
+    for location in locations:
+        expected = location if location == "United States" else f"{location}, United States"
+        assert LOCATION_NORMALIZER.normalize(location) == expected
+
+    # Quirks of the original rules are kept: " USA" is stripped as a set of
+    # characters, and "Virginia" is abbreviated before "West Virginia"
+    outliers = {
+        "Boston, MA 02110": "Boston, MA, United States",
+        "New York, New York": "New York, NY, United States",
+        "Charleston, West Virginia": "Charleston, West VA, United States",
+        "Tokyo": "Tokyo, Japan",
+        "Minato City, Tokyo, Japan": "Tokyo, Japan",
+        "WA DC": "Washington, DC, United States",
+        "Dublin, Dublin": "Dublin, Ireland",
+        "Austin, TX USA": "ustin, TX, United States",
+        "Seattle, Washington, États-Unis": "Seattle, WA, United States",
+        "Remote": "Remote",
+        "": ""
+    }
+    for location, expected in outliers.items():
+        assert LOCATION_NORMALIZER.normalize(location) == expected
+
+
+def test_9_location_cache():
+    """
+    Tests to ensure that the LocationCache:
+        * Evicts the least recently used location once it is full
+        * Counts hits and misses
+        * Returns the same locations as an uncached normalizer
+        * Survives a round trip through a sidecar file
+    """
+    cache = LocationCache(max_size=2)
+    normalizer = LocationNormalizer(cache)
+
+    assert normalizer.normalize("Boston, MA 02110") == "Boston, MA, United States"
+    assert normalizer.normalize("New York, New York") == "New York, NY, United States"
+    assert normalizer.normalize("Boston, MA 02110") == "Boston, MA, United States"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # "New York, New York" is now the least recently used entry and is evicted
+    assert normalizer.normalize("Tokyo") == "Tokyo, Japan"
+    assert list(cache.entries) == ["Boston, MA 02110", "Tokyo"]
+
+    sidecar_file = Path(os.path.join(test_directory, "location_cache_test_file.json"))
+    cache.save(sidecar_file)
+    warm_cache = LocationCache(max_size=2)
+    warm_cache.load(sidecar_file)
+
+    assert warm_cache.entries == cache.entries
+    assert LocationNormalizer(warm_cache).normalize("Tokyo") == "Tokyo, Japan"
+    assert (warm_cache.hits, warm_cache.misses) == (1, 0)
+
+    sidecar_file.unlink()
+    assert not sidecar_file.exists()
+
+
+def test_10_batched_populate_database():
+    """
+    Tests to ensure that populate_database():
+        * Inserts every row, in order, when the rows are split over several
+          batches and several commits
+        * Reports the number of rows actually inserted, not the number of
+          rows passed to INSERT OR IGNORE
+        * Restores the journal mode it changed for the bulk load, even when
+          the load fails
+    """
+    test_database = Path(os.path.join(test_directory, "test_batched_database.db"))
+
+    with open(os.devnull, 'w', encoding='utf-8') as trash_file, redirect_stdout(trash_file):
+        normalized_file = normalize_file("json_list_test_file.json", True)
+        create_database(str(test_database))
+        stats = populate_database(str(test_database), [normalized_file],
+                                  batch_size=3, commit_interval=4)
+        repeated_stats = populate_database(str(test_database), [normalized_file])
+
+    assert (stats["rows"], stats["inserted"]) == (10, 10)
+    assert (repeated_stats["rows"], repeated_stats["inserted"]) == (10, 0)
+
+    connection = sqlite3.connect(test_database)
+    cursor = connection.cursor()
+
+    cursor.execute("SELECT title FROM job_listings")
+    job_titles = [row[0] for row in cursor.fetchall()]
+    with open(normalized_file, "r", encoding="utf-8") as file:
+        assert job_titles == [json.loads(line)["title"] for line in file]
+
+    cursor.execute("PRAGMA journal_mode")
+    assert cursor.fetchone()[0] == "delete"
+
+    connection.close()
+
+    # A database without the job_listings table fails after the pragmas are applied
+    failing_database = Path(os.path.join(test_directory, "test_failing_database.db"))
+    sqlite3.connect(failing_database).close()
+    with open(os.devnull, 'w', encoding='utf-8') as trash_file, redirect_stdout(trash_file):
+        assert populate_database(str(failing_database), [normalized_file]) is None
+
+    connection = sqlite3.connect(failing_database)
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    connection.close()
+
+    for test_file in (normalized_file, test_database, failing_database):
+        test_file.unlink()
+        assert not test_file.exists()
+
+
+def test_11_incremental_ingest():
+    """
+    Tests to ensure that incremental_ingest():
+        * Ingests every line of a new source file and records a checkpoint
+        * Skips a source file that has not changed since the last run
+        * Only normalizes and inserts the lines appended since the last run,
+          hashing every byte of the file once
+        * Ingests the whole file again when a line in the middle was edited
+    """
+    test_database = Path(os.path.join(test_directory, "test_incremental_database.db"))
+    source_file = Path(os.path.join(test_directory, "json_incremental_test_file.json"))
+
+    with open(os.path.join(test_directory, "json_list_test_file.json"), "r",
+              encoding="utf-8") as file:
+        json_objects = json.loads(file.read())
+
+    # The first eight job listings, one per line
+    with open(source_file, "w", encoding="utf-8") as file:
+        for json_object in json_objects[:8]:
+            file.write(json.dumps(json_object) + "\n")
+
+    def count_rows():
+        connection = sqlite3.connect(test_database)
+        row_count = connection.execute("SELECT COUNT(*) FROM job_listings").fetchone()[0]
+        connection.close()
+        return row_count
+
+    with open(os.devnull, 'w', encoding='utf-8') as trash_file, redirect_stdout(trash_file):
+        create_database(str(test_database))
+        normalized_file = incremental_ingest(str(test_database), [source_file.name], True)[0]
+        assert count_rows() == 8
+
+        # Nothing has changed, so nothing is normalized again
+        normalized_file.unlink()
+        incremental_ingest(str(test_database), [source_file.name], True)
+        assert not normalized_file.exists()
+
+        # Append the last two job listings
+        with open(source_file, "a", encoding="utf-8") as file:
+            for json_object in json_objects[8:]:
+                file.write(json.dumps(json_object) + "\n")
+
+        # Every byte is hashed once, and the checkpoint hashes the whole file
+        with patch("src.job_search_database.incremental_ingest.update_digest",
+                   wraps=update_digest) as hashing:
+            incremental_ingest(str(test_database), [source_file.name], True)
+        assert sum(call.args[3] - call.args[2] for call in hashing.call_args_list) == \
+               os.path.getsize(source_file)
+        connection = sqlite3.connect(test_database)
+        assert connection.execute("SELECT content_hash FROM ingest_checkpoints").fetchone()[0] \
+               == hashlib.sha256(source_file.read_bytes()).hexdigest()
+        connection.close()
+        assert count_rows() == 10
+        # Only the appended lines were normalized
+        with open(normalized_file, "r", encoding="utf-8") as file:
+            assert [json.loads(line)["id"] for line in file] == \
+                   [json_object["id"] for json_object in json_objects[8:]]
+
+        # Edit the title of the fifth job listing in place, then append a line
+        lines = source_file.read_text(encoding="utf-8").splitlines(keepends=True)
+        edited_title = json_objects[4]["title"]
+        edited_title = edited_title[:-1] + ("X" if edited_title[-1] != "X" else "Y")
+        lines[4] = json.dumps(dict(json_objects[4], title=edited_title)) + "\n"
+        lines.append(lines[0])
+        source_file.write_text("".join(lines), encoding="utf-8")
+
+        incremental_ingest(str(test_database), [source_file.name], True)
+        with open(normalized_file, "r", encoding="utf-8") as file:
+            assert len(file.readlines()) == 11
+        connection = sqlite3.connect(test_database)
+        assert connection.execute("SELECT title FROM job_listings WHERE id = ?",
+                                  (json_objects[4]["id"],)).fetchone()[0] == edited_title
+        connection.close()
+
+    connection = sqlite3.connect(test_database)
+    byte_offset = connection.execute("SELECT byte_offset FROM ingest_checkpoints").fetchone()[0]
+    connection.close()
+    assert byte_offset == os.path.getsize(source_file)
+
+    for test_file in (source_file, normalized_file, test_database):
+        test_file.unlink()
+        assert not test_file.exists()
+
+
+def test_12_upsert_populate_database():
+    """
+    Tests to ensure that populate_database() with upsert:
+        * Inserts new job listings
+        * Leaves job listings with unchanged content untouched
+        * Updates job listings whose content has changed
+    """
+    test_database = Path(os.path.join(test_directory, "test_upsert_database.db"))
+
+    with open(os.devnull, 'w', encoding='utf-8') as trash_file, redirect_stdout(trash_file):
+        normalized_file = normalize_file("json_list_test_file.json", True)
+        create_database(str(test_database))
+
+        stats = populate_database(str(test_database), [normalized_file], upsert=True)
+        assert (stats["inserted"], stats["updated"], stats["unchanged"]) == (10, 0, 0)
+
+        stats = populate_database(str(test_database), [normalized_file], upsert=True)
+        assert (stats["inserted"], stats["updated"], stats["unchanged"]) == (0, 0, 10)
+
+        # Change the compensation of the first job listing
+        with open(normalized_file, "r", encoding="utf-8") as file:
+            json_objects = [json.loads(line) for line in file]
+        json_objects[0]["compensation"] = "$1,000,000"
+        with open(normalized_file, "w", encoding="utf-8") as file:
+            for json_object in json_objects:
+                file.write(json.dumps(json_object) + "\n")
+
+        stats = populate_database(str(test_database), [normalized_file], upsert=True)
+        assert (stats["inserted"], stats["updated"], stats["unchanged"]) == (0, 1, 9)
+
+    connection = sqlite3.connect(test_database)
+    compensation = connection.execute("SELECT compensation FROM job_listings WHERE id = ?",
+                                      (json_objects[0]["id"],)).fetchone()[0]
+    connection.close()
+    assert compensation == "$1,000,000"
+
+    for test_file in (normalized_file, test_database):
+        test_file.unlink()
+        assert not test_file.exists()
+
+
+def test_13_parallel_malformed_record():
+    """
+    Tests to ensure that normalize_file_parallel() handles a malformed job
+    listing exactly like normalize_file(), wherever it falls among the
+    workers' ranges: the line by line format skips the malformed line, the
+    streaming format stops at it.
+    """
+    source_file = Path(os.path.join(test_directory, "json_list_test_file.json"))
+    malformed_file = Path(os.path.join(test_directory, "json_malformed_test_file.json"))
+
+    with open(source_file, "r", encoding="utf-8") as file:
+        records = [json.dumps(json_object) for json_object in json.loads(file.read())]
+
+    with open(os.devnull, 'w', encoding='utf-8') as trash_file, redirect_stdout(trash_file):
+        for index in range(len(records)):
+            lines = records[:index] + ['{"title": "Malformed", "location": '] + records[index + 1:]
+            for text, formats in (("\n".join(lines) + "\n", (False, True)),
+                                  ("[" + ", ".join(lines) + "]", (True,))):
+                malformed_file.write_text(text, encoding="utf-8")
+                for streaming in formats:
+                    serial_output = normalize_file(malformed_file.name, True, streaming)
+                    expected_content = serial_output.read_bytes()
+                    for workers in (2, 3):
+                        parallel_output = normalize_file_parallel(malformed_file.name, True,
+                                                                  workers, streaming)
+                        assert parallel_output.read_bytes() == expected_content
+
+    # No shard files are left behind
+    assert not list(Path(test_directory).glob("*.shard"))
+
+    for test_file in (malformed_file, serial_output):
+        test_file.unlink()
+        assert not test_file.exists()
@@ -0,0 +1,601 @@
+"""
+A module for testing the job_search_gui document functions: document jobs,
+batch generation, the AI client and response cache, streaming, and the PDF
+layout
+"""
+import os.path
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from src.job_search_database.database_management import create_database
+from src.job_search_gui.batch_generation import (
+    BACKOFF_MAX, BatchOptions, QueryPolicy, RateLimiter, backoff_delay, build_query_function,
+    run_batch)
+from src.job_search_gui.document_jobs import (DocumentJob, DocumentJobManager, DocumentRequest,
+                                              FINISHED_STATUSES)
+from src.job_search_gui.generate_resume_and_cover_letter import (
+    CONTACT_HEADER_NOTE, DOCUMENT_PROMPTS, DOCUMENT_THREAD_PREFIX, DocumentOptions,
+    generate_documents, generate_pdf, get_cover_letter_query, get_resume_query,
+    iter_markdown_lines, query_ai, query_ai_stream, sanitize_filename, stop_when_cancelled,
+    write_pdf_atomically)
+from src.job_search_gui.line_breaker import (
+    FontMetrics, LineBreaker, generate_document, wrap_text_by_measuring)
+from src.job_search_gui.markdown_blocks import (
+    Block, MarkdownConverter, clean_html, generate_response, markdown_to_blocks)
+from src.job_search_gui.pdf_layout import (
+    BOTTOM_MARGIN, MARGIN_LEFT, MARGIN_TOP, draw_page, layout_blocks, layout_header)
+from src.job_search_gui.pdf_render_pool import PdfRenderPool
+from src.job_search_gui.profile_selection_popup_class import (
+    format_user_profile, get_contact_details)
+from src.job_search_gui.prompt_builder import (
+    build_prompts, compact_description, estimate_tokens, format_prompt_tokens)
+from src.ai_resume_builder.ai_client import AI_CLIENT, AIClientManager, GeminiBackend, StubBackend
+from src.ai_resume_builder.response_cache import ResponseCache
+
+
+def test_document_job_manager(tmp_path):
+    """
+    Tests that DocumentJobManager runs document jobs off the calling thread,
+    reports their progress, and cancels queued and running jobs.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    release = threading.Event()
+
+    def generate(request, cancel_event, report_progress, _options):
+        report_progress("Generating resume")
+        if request.company == "Broken":
+            raise ValueError("AI unavailable")
+        release.wait(timeout=5)
+        return {"completed": not cancel_event.is_set(), "timings": {"total": 1.0}}
+
+    def new_job(company):
+        return DocumentJob(DocumentRequest("Engineer", company, "job listing", "profile",
+                                           "user profile"))
+
+    def final_message(messages, job):
+        while True:
+            message = messages.get(timeout=5)
+            if message[0] is job and message[1] in FINISHED_STATUSES:
+                return message
+
+    manager = DocumentJobManager(max_workers=1, generate=generate)
+    messages = queue.Queue()
+    running_job = manager.submit(new_job("Acme"), messages)
+    queued_job = manager.submit(new_job("Initech"), messages)
+    assert running_job.options.stream  # The GUI renders each response as it streams in
+
+    assert messages.get(timeout=5)[1:] == ("queued", "Waiting to start")
+    while messages.get(timeout=5)[1] != "running":
+        pass
+
+    # The queued job never starts, the running job stops at its next step
+    queued_job.cancel()
+    assert final_message(messages, queued_job)[1:] == ("cancelled", "Cancelled")
+    manager.cancel_all()
+    release.set()
+    assert final_message(messages, running_job)[1] == "cancelled"
+
+    done_job = manager.submit(new_job("Globex"), messages)
+    assert final_message(messages, done_job)[1:] == (
+        "done", "Resume and cover letter saved in 1.0s total ()")
+
+    failed_job = manager.submit(new_job("Broken"), messages)
+    assert final_message(messages, failed_job)[1:] == ("failed", "Failed: AI unavailable")
+    manager.executor.shutdown()
+
+    # generate_documents() stops before querying the AI once cancelled
+    cancel_event = threading.Event()
+    cancel_event.set()
+    module = "src.job_search_gui.generate_resume_and_cover_letter"
+    with patch(f"{module}.get_api_key"), patch(f"{module}.query_ai") as mock_query_ai, \
+            patch(f"{module}.resume_and_cover_letter_directory", str(tmp_path)):
+        assert not generate_documents(new_job("Acme").request, cancel_event)["completed"]
+        mock_query_ai.assert_not_called()
+
+
+def test_generate_documents_concurrently(tmp_path):
+    """
+    Tests that generate_documents() runs the resume and the cover letter
+    concurrently, returns a timing breakdown, and times out a document that
+    takes too long without saving it once it has timed out.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    # Each query waits for the other, so both are sent before either returns
+    overlap = threading.Barrier(2, timeout=5)
+
+    def concurrent_query(_api_key, query, **_options):
+        overlap.wait()
+        return MagicMock(text=query)
+
+    saved = []
+
+    def record_pdf(_content, _parent, letter_or_resume, _output_directory=None):
+        saved.append(letter_or_resume)
+
+    request = DocumentRequest("Engineer", "Acme", "job listing", "profile", "user profile")
+    progress = []
+    module = "src.job_search_gui.generate_resume_and_cover_letter"
+    with patch(f"{module}.get_api_key"), patch(f"{module}.query_ai", concurrent_query), \
+            patch(f"{module}.generate_pdf", record_pdf), \
+            patch(f"{module}.resume_and_cover_letter_directory", str(tmp_path)):
+        result = generate_documents(request, report_progress=progress.append)
+
+        assert result["completed"]
+        assert set(result["timings"]) == {"resume_query", "resume_pdf", "cover_letter_query",
+                                          "cover_letter_pdf", "total"}
+        assert sorted(saved) == ["cover_letter", "resume"]
+        assert progress[0] == "Generating resume and cover letter"
+        assert sorted(progress[1:]) == ["Cover letter saved", "Resume saved"]
+
+    # The documents time out while their queries are held, and save nothing once released
+    release = threading.Event()
+
+    def held_query(_api_key, query, **_options):
+        release.wait(timeout=5)
+        return MagicMock(text=query)
+
+    saved.clear()
+    with patch(f"{module}.get_api_key"), patch(f"{module}.query_ai", held_query), \
+            patch(f"{module}.generate_pdf", record_pdf), \
+            patch(f"{module}.resume_and_cover_letter_directory", str(tmp_path)), \
+            patch(f"{module}.DOCUMENT_TIMEOUT", 0.1):
+        with pytest.raises(TimeoutError):
+            generate_documents(request)
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name.startswith(DOCUMENT_THREAD_PREFIX):
+                thread.join(timeout=5)
+    assert not saved
+
+
+def test_run_batch(tmp_path):
+    """
+    Tests that run_batch() generates every job listing and profile pair,
+    retries transient AI errors, records failures, and skips the pairs that
+    were finished by an earlier run.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    database_path = str(tmp_path / "test_database.db")
+    create_database(database_path)
+    database_connection = sqlite3.connect(database_path)
+    database_connection.executemany("""
+        INSERT INTO job_listings (id, title, company, location, description)
+        VALUES (?, ?, ?, 'Boston, MA', 'A job')
+    """, [("1", "Python Developer", "Acme"), ("2", "Python Tester", "Initech"),
+          ("3", "Java Engineer", "Globex")])
+    database_connection.executemany(
+        "INSERT INTO user_profiles (name, profile_name) VALUES (?, ?)",
+        [("Lenny", "lenny"), ("Squiggy", "squiggy")])
+    database_connection.commit()
+
+    queries = []
+    flaky_errors = [api_exceptions.ServiceUnavailable("try again")]
+
+    def fake_query(_api_key, query, **_options):
+        queries.append(query)
+        if flaky_errors:
+            raise flaky_errors.pop()
+        if "Initech" in query and "Squiggy" in query:
+            raise ValueError("Not a transient error")
+        return MagicMock(text=f"# Document\n\n{query}")
+
+    def batch():
+        with open(os.devnull, 'w', encoding='utf-8') as trash_file, \
+                redirect_stdout(trash_file), patch(f"{module}.get_api_key"), \
+                patch("src.job_search_gui.generate_resume_and_cover_letter.get_api_key"):
+            return run_batch(database_path, "title LIKE 'Python%'", ["lenny", "squiggy", "nobody"],
+                             BatchOptions(workers=2, query_policy=QueryPolicy(0, backoff_base=0.01),
+                                          output_directory=str(tmp_path),
+                                          query_function=fake_query))
+
+    module = "src.job_search_gui.batch_generation"
+    assert batch() == {"done": 3, "skipped": 0, "failed": 1}
+    # 4 pairs of 2 documents, plus one retried query
+    assert len(queries) == 9
+    assert (tmp_path / "lenny" / "Python_Developer_Acme_resume.pdf").exists()
+    assert (tmp_path / "squiggy" / "Python_Developer_Acme_cover_letter.pdf").exists()
+
+    # Only the failed pair is generated again
+    queries.clear()
+    assert batch() == {"done": 0, "skipped": 3, "failed": 1}
+    assert all("Initech" in query for query in queries)
+
+    statuses = database_connection.execute(
+        "SELECT job_id, profile_name, status FROM batch_generations ORDER BY job_id, profile_name")
+    assert statuses.fetchall() == [("1", "lenny", "done"), ("1", "squiggy", "done"),
+                                   ("2", "lenny", "done"), ("2", "squiggy", "failed")]
+    database_connection.close()
+
+    # Profile names are used as directory names without leaving the output directory
+    assert sanitize_filename("../Jane Doe") == ".._Jane_Doe"
+    assert sanitize_filename("..") == "__"
+
+
+def test_rate_limiter_and_backoff():
+    """
+    Tests that RateLimiter spaces calls evenly, backoff_delay() grows
+    exponentially up to BACKOFF_MAX, and a query that keeps failing raises
+    its last error.
+    """
+    now = [100.0]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    # One call every 0.1 seconds, the first right away
+    rate_limiter = RateLimiter(requests_per_minute=600, clock=lambda: now[0], sleep=fake_sleep)
+    for _ in range(4):
+        rate_limiter.acquire()
+    assert sleeps == pytest.approx([0.1, 0.1, 0.1])
+    now[0] += 1.0  # An idle limiter lets the next call start right away
+    rate_limiter.acquire()
+    assert len(sleeps) == 3
+
+    assert 0.5 <= backoff_delay(1, 1.0) <= 1.0
+    assert 4.0 <= backoff_delay(4, 1.0) <= 8.0
+    assert backoff_delay(20, 1.0) <= BACKOFF_MAX
+
+    errors = [api_exceptions.ServiceUnavailable("first"), api_exceptions.ServiceUnavailable("last")]
+
+    def failing_query(api_key, query, timeout=None):
+        raise errors.pop(0)
+    query = build_query_function(RateLimiter(0), max_attempts=2, backoff_base=0.0,
+                                 query_function=failing_query)
+    with open(os.devnull, 'w', encoding='utf-8') as trash_file, redirect_stdout(trash_file), \
+            pytest.raises(api_exceptions.ServiceUnavailable, match="last"):
+        query("key", "Write a resume")
+
+
+def test_ai_response_cache(tmp_path):
+    """
+    Tests that query_ai() answers a repeated query from the response cache,
+    that the cache can be bypassed, and that entries expire and are evicted
+    least recently used first.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    cache = ResponseCache(str(tmp_path / "ai_response_cache.db"), max_entries=2)
+    module = "src.job_search_gui.generate_resume_and_cover_letter"
+
+    backend = StubBackend("A resume")
+
+    with patch(f"{module}.AI_RESPONSE_CACHE", cache), patch.object(AI_CLIENT, "backend", backend):
+        assert query_ai("key", "Write a resume").text == "A resume"
+        assert query_ai("key", "Write a resume").text == "A resume"
+        assert len(backend.prompts) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        query_ai("key", "Write a resume", use_cache=False)
+        assert len(backend.prompts) == 2
+
+        # The batch only waits for the rate limiter on a cache miss
+        rate_limiter = MagicMock()
+        batch_query = build_query_function(rate_limiter)
+        assert batch_query("key", "Write a resume").text == "A resume"
+        rate_limiter.acquire.assert_not_called()
+        batch_query("key", "Write a cover letter")
+        rate_limiter.acquire.assert_called_once()
+        assert len(backend.prompts) == 3
+
+    key = ResponseCache.make_key("gemini-1.5-flash", "Write a resume", {})
+    assert key != ResponseCache.make_key("gemini-1.5-flash", "Write a resume", {"temperature": 1})
+
+    # Expired responses are not returned
+    connection = sqlite3.connect(cache.path)
+    connection.execute("UPDATE ai_responses SET created_at = created_at - ?", (cache.ttl + 1,))
+    connection.commit()
+    assert cache.get(key) is None
+
+    # The least recently used response is evicted beyond max_entries
+    for prompt in ("first", "second", "third"):
+        cache.put(prompt, "model", prompt)
+        time.sleep(0.01)
+    assert cache.get("first") is None
+    assert cache.get("third") == "third"
+    assert connection.execute("SELECT COUNT(*) FROM ai_responses").fetchone()[0] == 2
+    connection.close()
+
+
+def test_ai_client_reuses_model():
+    """
+    Tests that the Gemini backend configures the client and builds each model
+    once, even when queried from several threads, and that the manager can
+    switch to the stub backend.
+    """
+    backend = GeminiBackend()
+    with patch("src.ai_resume_builder.ai_client.genai") as mock_genai:
+        mock_genai.GenerativeModel.return_value.generate_content.return_value = \
+            MagicMock(text="A resume")
+        client = AIClientManager(backend)
+
+        threads = [threading.Thread(target=client.generate, args=("key", "Write a resume"))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.generate("key", "Write a resume", generation_parameters={"temperature": 1},
+                        timeout=5)
+
+        mock_genai.configure.assert_called_once_with(api_key="key")
+        assert mock_genai.GenerativeModel.call_count == 2
+        mock_genai.GenerativeModel.return_value.generate_content.assert_called_with(
+            "Write a resume", request_options={"timeout": 5})
+
+        # A new api key configures the client again
+        client.generate("other key", "Write a resume")
+        assert mock_genai.configure.call_count == 2
+
+    assert client.set_backend(StubBackend(lambda prompt: prompt.upper())) is backend
+    assert client.generate("key", "write a resume").text == "WRITE A RESUME"
+
+
+def test_streaming_documents(tmp_path):
+    """
+    Tests that a streamed response is split into lines across chunk
+    boundaries, laid out like a complete response, and rendered to PDFs by
+    generate_documents() before the stream ends.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    response = ("# Jane Doe\n\n## Skills\n\n- **Python** and SQL\n- Testing\n\n"
+                + "A long paragraph about experience " * 10 + "\n")
+
+    assert list(iter_markdown_lines(["# Ja", "ne\n\n- a", "\n- b"])) == \
+        ["# Jane", "", "- a", "- b"]
+
+    # Converting the streamed lines gives the blocks of the complete response
+    chunks = [response[i:i + 7] for i in range(0, len(response), 7)]
+    converter = MarkdownConverter()
+    assert [block for line in iter_markdown_lines(chunks) for block in converter.feed(line)] \
+        + converter.finish() == markdown_to_blocks(response)
+
+    # Once cancelled, a stream is closed without reading its next chunk
+    read = []
+    cancel_event = threading.Event()
+
+    def stream():
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+    for _ in stop_when_cancelled(stream(), cancel_event.is_set):
+        cancel_event.set()
+    assert read == chunks[:1]
+
+    backend = StubBackend(response, delay=0.05, chunk_size=16, chunk_delay=0.01)
+    cache = ResponseCache(str(tmp_path / "ai_response_cache.db"))
+    request = DocumentRequest("Engineer", "Acme", "job listing", "profile", "user profile")
+    module = "src.job_search_gui.generate_resume_and_cover_letter"
+    with patch(f"{module}.get_api_key"), patch(f"{module}.AI_RESPONSE_CACHE", cache), \
+            patch.object(AI_CLIENT, "backend", backend):
+        result = generate_documents(request, options=DocumentOptions(
+            output_directory=str(tmp_path), stream=True))
+
+        assert result["completed"]
+        timings = result["timings"]
+        assert timings["resume_first_line"] < timings["resume_stream"]
+        assert sorted(os.listdir(tmp_path)) == [
+            "Engineer_Acme_cover_letter.pdf", "Engineer_Acme_resume.pdf", "ai_response_cache.db"]
+
+        # Streamed responses are not kept to be cached, cached responses are served
+        cache_key = cache.make_key("gemini-1.5-flash", backend.prompts[0], {})
+        assert cache.get(cache_key) is None
+        cache.put(cache_key, "gemini-1.5-flash", response)
+        assert list(query_ai_stream("key", backend.prompts[0])) == [response]
+        assert len(backend.prompts) == 2
+
+        # A cancelled stream saves nothing
+        cancel_event = threading.Event()
+        cancel_event.set()
+        assert not generate_documents(request, cancel_event, options=DocumentOptions(
+            output_directory=str(tmp_path / "x"), stream=True))["completed"]
+        assert os.listdir(tmp_path / "x") == []
+
+
+def test_line_breaker():
+    """
+    Tests that LineBreaker breaks lines exactly where measuring the whole line
+    does, and splits words wider than a line.
+    """
+    line_breaker = LineBreaker("Helvetica", 10)
+    paragraphs = generate_document(20, 150) + [
+        "", " leading space", "double  space ", "Ünïcödé — dashes and “quotes”"]
+    for max_width in (60, 200, 520):
+        for paragraph in paragraphs:
+            assert line_breaker.wrap(paragraph, max_width) == \
+                wrap_text_by_measuring(paragraph, max_width)
+
+    lines = line_breaker.wrap("see https://example.com/" + "a" * 200 + " for more", 520)
+    assert "".join(lines[1:-1]) + lines[-1].split(" ")[0] == "https://example.com/" + "a" * 200
+    assert lines[0] == "see"
+    assert all(line_breaker.width(line) <= 520 for line in lines)
+
+
+def test_pdf_layout():
+    """
+    Tests that markdown headings, bullets and paragraphs are laid out on
+    pages from a width table alone, without reportlab, and drawn one text
+    object per page.
+    """
+    content = ("# Jane Doe\nEmail: jane@example.com\n\n## Skills\n\n"
+               "- **Python** &amp; [SQL](https://example.com)\n    - Nested\n\n"
+               "Steps:\n\n1. First\n2. Second\n")
+    assert markdown_to_blocks(content) == [
+        Block("heading", "Jane Doe", 1), Block("paragraph", "Email: jane@example.com"),
+        Block("heading", "Skills", 2), Block("bullet", "Python & SQL", 1),
+        Block("bullet", "Nested", 2), Block("paragraph", "Steps:"),
+        Block("bullet", "First", 1, "1."), Block("bullet", "Second", 1, "2.")]
+
+    # Every character is 500 font units wide, 5 points at size 10
+    metrics = FontMetrics("Test", {}, default_units=500)
+    pages = layout_blocks(markdown_to_blocks(content), lambda font_name: metrics)
+    assert len(pages) == 1
+    lines = [(line.x, line.font_name, line.font_size, line.text) for line in pages[0]]
+    assert lines[:3] == [(MARGIN_LEFT, "Helvetica-Bold", 16, "Jane Doe"),
+                         (MARGIN_LEFT, "Helvetica", 10, "Email: jane@example.com"),
+                         (MARGIN_LEFT, "Helvetica-Bold", 13, "Skills")]
+    assert lines[3][3] == "•" and lines[4] == (MARGIN_LEFT + 15, "Helvetica", 10, "Python & SQL")
+    assert lines[6][0] == MARGIN_LEFT + 30 and lines[-2][3] == "2."
+    assert [line.y for line in pages[0]] == sorted((line.y for line in pages[0]), reverse=True)
+
+    # A long paragraph wraps at 104 characters, 21 words, and fills two pages
+    pages = layout_blocks([Block("paragraph", "word " * 2000)], lambda font_name: metrics)
+    assert len(pages) == 2 and len(pages[0][0].text.split()) == 21
+    assert all(len(line.text) <= 104 for page in pages for line in page)
+    assert all(line.y >= BOTTOM_MARGIN - 12 for page in pages for line in page)
+
+    pdf_canvas = MagicMock()
+    draw_page(pages[0], pdf_canvas)
+    text_object = pdf_canvas.beginText.return_value
+    text_object.setFont.assert_called_once_with("Helvetica", 10)
+    assert text_object.textOut.call_count == len(pages[0])
+    pdf_canvas.drawText.assert_called_once_with(text_object)
+    pdf_canvas.showPage.assert_called_once()
+
+
+def test_markdown_converter():
+    """
+    Tests that the single pass converter keeps the text clean_html() kept,
+    and the structure and entities that clean_html() lost.
+    """
+    response = generate_response(3)
+    assert [line for block in markdown_to_blocks(response) for line in block.text.split("\n")] \
+        == [line.strip() for line in clean_html(response).split("\n") if line.strip()]
+
+    content = ("Jane Doe\n========\n**Experience**\n\n* Led a team &amp; shipped\n"
+               "  a `v2` release\n    1. Planned\n    2. Built\n* [Site](https://x.io)\n\n"
+               "---\n```\nkeep **this**\n```\n3. Third\n")
+    assert markdown_to_blocks(content) == [
+        Block("heading", "Jane Doe", 1), Block("heading", "Experience", 3),
+        Block("bullet", "Led a team & shipped a v2 release", 1),
+        Block("bullet", "Planned", 2, "1."), Block("bullet", "Built", 2, "2."),
+        Block("bullet", "Site", 1), Block("paragraph", "keep **this**"),
+        Block("bullet", "Third", 1, "3.")]
+
+
+def test_pdf_render_pool(tmp_path):
+    """
+    Tests that PdfRenderPool renders tasks in worker processes and returns
+    their paths, and that a PDF that is abandoned or fails leaves no file.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    tasks = [(f"# Document {number}\n\n- A bullet", "Acme Corp", f"Engineer {number}", kind)
+             for number in range(3) for kind in ("resume", "cover_letter")]
+    with PdfRenderPool(2, str(tmp_path)) as pool:
+        paths = [future.result(timeout=60) for future in pool.render_all(tasks)]
+
+    assert paths[1] == str(tmp_path / "Engineer_0_Acme_Corp_cover_letter.pdf")
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths)
+    assert all(Path(path).read_bytes().startswith(b"%PDF") for path in paths)
+
+    def fail(pdf_canvas):
+        raise RuntimeError("Drawing failed")
+
+    file_path = str(tmp_path / "abandoned" / "document.pdf")
+    os.makedirs(os.path.dirname(file_path))
+    assert not write_pdf_atomically(file_path, lambda pdf_canvas: False)
+    with pytest.raises(RuntimeError):
+        write_pdf_atomically(file_path, fail)
+    assert os.listdir(tmp_path / "abandoned") == []
+
+
+def test_profile_header(tmp_path):
+    """
+    Tests that a profile's contact header is laid out once and cached, that
+    the body starts below it, and that a PDF stores it as a single form
+    drawn on every page.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    profile = (1, "Jane Doe", "jane", "jane@example.com", None, "linkedin.com/in/jane",
+               "github.com/jane", "Classes", "Projects", "Info")
+    contact_details = get_contact_details(profile)
+    assert contact_details.phone_number == ""
+
+    header = layout_header(contact_details)
+    assert layout_header(get_contact_details(profile)) is header
+    assert [line.text for line in header.lines] == [
+        "Jane Doe", "jane@example.com  |  linkedin.com/in/jane  |  github.com/jane"]
+    assert header.body_top < header.lines[-1].y < MARGIN_TOP
+    assert layout_header(get_contact_details((1, "", "x", "", "", "", "", "", "", ""))) is None
+
+    request = DocumentRequest("Engineer", "Acme", "job listing", "jane", "profile",
+                              contact_details)
+    path = generate_pdf("# Resume\n\n" + "A paragraph of experience.\n\n" * 150,
+                        request, "resume", str(tmp_path))
+    pdf = Path(path).read_bytes()
+    pages = pdf.count(b"/Type /Page\n") + pdf.count(b"/Type /Page ")
+    assert pdf.count(b"/Subtype /Form") == 1
+    # Every page's resources refer to the one form
+    assert pdf.count(f"FormXob.{header.form_name}".encode()) >= pages >= 2
+
+    # The AI is told to leave out the contact details only when they are drawn in the header
+    queries = []
+
+    def record_query(_api_key, query, **_options):
+        queries.append(query)
+        return MagicMock(text="# Document")
+    module = "src.job_search_gui.generate_resume_and_cover_letter"
+    with patch(f"{module}.get_api_key"), patch(f"{module}.generate_pdf"):
+        options = DocumentOptions(query_function=record_query, output_directory=str(tmp_path))
+        generate_documents(request, options=options)
+        generate_documents(request._replace(contact_details=None), options=options)
+    assert [CONTACT_HEADER_NOTE in query for query in queries] == [True, True, False, False]
+
+
+def test_prompt_builder():
+    """
+    Tests that the prompt builder strips markup, boilerplate and repeated
+    sentences from a description, drops empty profile fields, keeps the
+    queries within the token budget, and reports the tokens saved.
+    """
+    description = ("<p>We are hiring a <b>Python Developer</b>.</p><ul>"
+                   "<li>Build APIs &amp; services.</li><li>Build APIs &amp; services.</li></ul>\n"
+                   "**Requirements**\n\n\\- 3 years of Python. Apply now!  We are an Equal "
+                   "Opportunity Employer. All qualified applicants will be considered.\n"
+                   "#LI-Remote #hiring")
+    assert compact_description(description) == (
+        "We are hiring a Python Developer.\nBuild APIs & services.\nRequirements\n"
+        "- 3 years of Python.")
+
+    job_listing = f"Company: Acme\n\nLocation: None\n\nDescription: {description}\n\n"
+    user_profile = format_user_profile((1, "Jane Doe", "jane", "jane@example.com", None, "",
+                                        "github.com/jane", "CS 490", None, None))
+    prompts = build_prompts(user_profile, job_listing, DOCUMENT_PROMPTS)
+    assert prompts.queries["resume"] == (
+        "Job Description: Company: Acme\nDescription: We are hiring a Python Developer.\n"
+        "Build APIs & services.\nRequirements\n- 3 years of Python.\n\n"
+        "Personal Information: Name: Jane Doe\nEmail: jane@example.com\n"
+        "GitHub: github.com/jane\nClasses Taken: CS 490\n\n" + DOCUMENT_PROMPTS["resume"])
+    # Both queries share the same context and differ only in the instruction
+    context = prompts.queries["resume"][:-len(DOCUMENT_PROMPTS["resume"])]
+    assert prompts.queries["cover_letter"] == context + DOCUMENT_PROMPTS["cover_letter"]
+    summary = prompts.summary()
+    assert summary["original"] == estimate_tokens(get_resume_query(user_profile, job_listing)) \
+        + estimate_tokens(get_cover_letter_query(user_profile, job_listing))
+    assert summary["saved"] == summary["original"] - summary["prompt"] > 0
+    assert not summary["truncated"]
+
+    # A long description is cut to the budget at a sentence boundary
+    long_listing = job_listing + " ".join(f"Duty number {number}." for number in range(2000))
+    prompts = build_prompts(user_profile, long_listing, DOCUMENT_PROMPTS, token_budget=300)
+    assert all(tokens <= 300 for tokens in prompts.prompt_tokens.values())
+    assert prompts.summary()["truncated"]
+    assert "Duty number 1." in prompts.queries["resume"]
+    assert prompts.queries["resume"].split("\n\nPersonal")[0].endswith(".")
+    assert format_prompt_tokens({"original": 400, "prompt": 100, "saved": 300,
+                                 "truncated": True}) == \
+        "100 prompt tokens, 300 saved (75%), truncated to the budget"
@@ -1,6 +1,7 @@
 """
 A module for testing essential job_search_gui functions
 """
+import json
 import os.path
 from unittest.mock import MagicMock, patch
 import pytest
@@ -9,8 +10,15 @@ import tkinter as tk
 from pathlib import Path
 import google.generativeai as genai
 
+from src.job_search_database.database_management import create_database, populate_database
+from src.job_search_gui.background_loader import JobLoader
+from src.job_search_gui.database_handler import (
+    JOB_PAGE_ORDERS, JOB_PAGE_QUERIES, explain_query_plans, get_job_by_id, get_job_page,
+    search_jobs)
 from src.job_search_gui.job_app_main_window_class import AppMainWindow
+from src.job_search_gui.job_index import PAGE_CACHE_SIZE, JobIndex
 from src.job_search_gui.user_attribute_popup import UserAttributePopup
+from src.job_search_gui.virtual_listbox import RowWindow
 from src.ai_resume_builder.resume_generator import get_api_key
 
 SCRIPT_DIRECTORY = Path(__file__).resolve().parent
@@ -283,3 +291,317 @@ def delete_api_key(absolute_api_key_path):
 
 
 
+
+
+def test_explain_query_plans(tmp_path):
+    """
+    Tests the query plan diagnostic in database_handler.py against a database
+    created with its secondary indexes.  Filtering on an indexed column and
+    looking up a profile by name must search an index, while listing every
+    job is reported as a table scan, and so is a paged query that walks a
+    whole index.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    database_path = str(tmp_path / "test_database.db")
+    create_database(database_path, with_indexes=True)
+    database_connection = sqlite3.connect(database_path)
+
+    query_plans = explain_query_plans(database_connection)
+    assert not query_plans["ProfileSelectionPopup.on_select"][1]
+    assert query_plans["get_jobs_from_database"][1]
+
+    filter_queries = {
+        column: (f"SELECT id FROM job_listings WHERE {column} = ?", ("",))
+        for column in ["location", "company", "employment_type", "date_posted"]
+    }
+    for details, flagged in explain_query_plans(database_connection, filter_queries).values():
+        assert not flagged, details
+
+    # A paged query that walks a whole index, instead of searching it, is flagged
+    walking_page_query = {"page": ("""
+        SELECT id FROM job_listings
+        WHERE (COALESCE(title, ''), id) > (?, ?)
+        ORDER BY COALESCE(title, ''), id
+        LIMIT ?""", ("", "", 1))}
+    details, flagged = explain_query_plans(database_connection, walking_page_query)["page"]
+    assert details[0].startswith("SCAN job_listings USING INDEX")
+    assert flagged
+
+    database_connection.close()
+
+
+def test_search_jobs(tmp_path):
+    """
+    Tests that search_jobs() ranks full text matches, returns snippets, and
+    sees the changes made when a job listing is re-ingested with upsert.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    database_path = str(tmp_path / "test_database.db")
+    normalized_file = tmp_path / "test_normalized.json"
+    job_listings = [
+        {"id": "1", "title": "Python Developer", "company": "Acme",
+         "description": "Build data pipelines in Python."},
+        {"id": "2", "title": "Office Manager", "company": "Initech",
+         "description": "Keep the office running, some Python scripting a plus."},
+        {"id": "3", "title": "Java Engineer", "company": "Globex",
+         "description": "Maintain backend services."}
+    ]
+
+    def write_and_populate():
+        with open(normalized_file, "w", encoding="utf-8") as file:
+            for job_listing in job_listings:
+                file.write(json.dumps({
+                    "location": "Boston, MA, United States", "date_posted": "2025-02-01",
+                    "employment_type": "Full-time", "interval": "yearly",
+                    "compensation": "", "job_url": "", **job_listing}) + "\n")
+        populate_database(database_path, [normalized_file], upsert=True)
+
+    create_database(database_path)
+    write_and_populate()
+    database_connection = sqlite3.connect(database_path)
+
+    # A title match outranks a description match
+    results = search_jobs(database_connection, "python")
+    assert [result["id"] for result in results] == ["1", "2"]
+    assert "[Python]" in results[0]["snippet"]
+
+    # The last word is matched as a prefix, FTS5 syntax is searched literally
+    assert [result["id"] for result in search_jobs(database_connection, "back")] == ["3"]
+    assert search_jobs(database_connection, 'java" (')[0]["id"] == "3"
+    assert not search_jobs(database_connection, "  ")
+
+    job_listings[2]["description"] = "Maintain Python backend services."
+    write_and_populate()
+    assert [result["id"] for result in search_jobs(database_connection, "backend python")] == ["3"]
+    assert search_jobs(database_connection, "java")[0]["snippet"] == \
+        "Maintain Python backend services."
+
+    database_connection.close()
+
+
+def test_get_job_page(tmp_path):
+    """
+    Tests that get_job_page() visits every job listing exactly once, in
+    order, for each ordering, including job listings without a title or
+    location, and that get_job_by_id() returns full records.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    database_path = str(tmp_path / "test_database.db")
+    database_connection = sqlite3.connect(database_path)
+    create_database(database_path, with_indexes=True)
+    # Repeated titles and locations make sure ties are broken by id
+    job_rows = [(str(index), f"Title {index % 3}", f"City {index % 4}") for index in range(11)]
+    # Missing titles and locations sort as empty strings, before every other one
+    job_rows += [(str(index), None, None) for index in range(11, 14)]
+    database_connection.executemany(
+        "INSERT INTO job_listings (id, title, location, company) VALUES (?, ?, ?, 'Acme')",
+        job_rows)
+    database_connection.commit()
+
+    for order_by, column in (("title", 1), ("location", 2)):
+        for descending in (False, True):
+            rows, page_key, page_count = [], None, 0
+            while True:
+                page, page_key = get_job_page(database_connection, order_by, page_key,
+                                              page_size=4, descending=descending)
+                rows.extend(page)
+                page_count += 1
+                if page_key is None:
+                    break
+            assert rows == sorted(job_rows,
+                                  key=lambda row, column=column: (row[column] or "", row[0]),
+                                  reverse=descending)
+            assert page_count == 4
+
+    assert get_job_page(database_connection, page_size=3)[1] == ("", "13")
+    assert get_job_page(database_connection, page_size=14)[1] == ("Title 2", "8")
+    with pytest.raises(ValueError):
+        get_job_page(database_connection, "company")
+
+    assert get_job_by_id(database_connection, "5")["job_title"] == "Title 2"
+    assert get_job_by_id(database_connection, "5")["company"] == "Acme"
+    assert get_job_by_id(database_connection, "missing") is None
+
+    # A page deep into the table searches the index for its first row
+    # instead of walking the index from the start
+    for order_by in JOB_PAGE_ORDERS:
+        for descending in (False, True):
+            query = JOB_PAGE_QUERIES[order_by, descending, False]
+            details = [row[3] for row in database_connection.execute(
+                f"EXPLAIN QUERY PLAN {query}", ("Title 2", "8", 4))]
+            assert details[0].startswith(
+                f"SEARCH job_listings USING INDEX idx_job_listings_{order_by}_key"), details
+
+    # Every page query searches an index, none of them sorts its rows
+    for name, (details, flagged) in explain_query_plans(database_connection).items():
+        if name.startswith("get_job_page") or name == "get_job_by_id":
+            assert not flagged, details
+            assert not any("TEMP B-TREE" in detail for detail in details), details
+
+    database_connection.close()
+
+
+def test_row_window():
+    """
+    Tests that the RowWindow behind VirtualListbox only materializes the rows
+    on screen plus the overscan, fetches each row once while scrolling, and
+    costs the same to point at a list of any length.
+    """
+    fetched = []
+
+    def get_row(index):
+        fetched.append(index)
+        return f"Row {index}"
+
+    window = RowWindow(overscan=2)
+    window.visible_count = 5
+    window.set_source(50000, get_row)
+    window.materialize()
+    assert window.rows == [f"Row {index}" for index in range(7)]
+
+    # Scrolling three rows fetches only the three rows that came into view
+    fetched.clear()
+    window.scroll_to(3)
+    window.materialize()
+    assert (window.start, len(window.rows), fetched) == (1, 9, [7, 8, 9])
+    assert not window.materialize()
+
+    # Jumping to the end stops at the last full screen of rows
+    window.scroll_to(60000)
+    window.materialize()
+    assert window.first_visible == 49995
+    assert window.rows[-1] == "Row 49999"
+    assert window.fractions() == (49995 / 50000, 1.0)
+
+    # Growing the list keeps the materialized rows
+    fetched.clear()
+    window.set_row_count(50010)
+    window.materialize()
+    assert fetched == [50000, 50001]
+
+
+def drain_job_loader(loader):
+    """
+    Runs a JobLoader on its own thread and collects its messages until it is
+    done
+
+    :param loader: A JobLoader that has not been started
+    :return: The list of (kind, value) messages
+    """
+    loader.start()
+    messages = []
+    while not messages or messages[-1][0] not in ("done", "error"):
+        messages.append(loader.messages.get(timeout=5))
+    loader.join(timeout=5)
+    assert not loader.is_alive()
+    return messages
+
+
+def test_job_index(tmp_path):
+    """
+    Tests that JobIndex, fed the page keys found by a JobLoader, orders job
+    ids like sorting every job listing would, reads only the pages that are
+    looked at, keeps the page keys of each sort order, and carries on from
+    where a stopped loader left off.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    database_path = str(tmp_path / "test_database.db")
+    create_database(database_path, with_indexes=True)
+    database_connection = sqlite3.connect(database_path)
+    job_rows = [(str(index), f"Title {index % 7}", f"City {index % 5}") for index in range(95)]
+    job_rows += [("95", None, None)]
+    database_connection.executemany(
+        "INSERT INTO job_listings (id, title, location) VALUES (?, ?, ?)", job_rows)
+    database_connection.commit()
+
+    job_index = JobIndex(database_connection, page_size=10)
+    assert len(job_index) == 0
+    for kind, value in drain_job_loader(JobLoader(database_path, "name", page_size=10)):
+        if kind == "pages":
+            job_index.add_pages(*value)
+    assert len(job_index) == 96
+    assert job_index.is_complete("name")
+    assert [job_index.row(position) for position in range(96)] == \
+        sorted(job_rows, key=lambda row: (row[1] or "", row[0]))
+
+    # Only the most recently read pages are kept
+    assert len(job_index.pages) <= PAGE_CACHE_SIZE
+    with patch("src.job_search_gui.job_index.get_job_page", wraps=get_job_page) as read_page:
+        job_index.job_id(95)
+        job_index.job_id(90)
+        assert read_page.call_count <= 1
+
+    # A loader stopped after its first message is resumed where it stopped
+    job_index.sort("location")
+    with patch("src.job_search_gui.background_loader.PAGES_PER_MESSAGE", 4):
+        messages = drain_job_loader(JobLoader(database_path, "location", page_size=10))
+    job_index.add_pages(*messages[1][1])
+    assert len(job_index) == 40 and not job_index.is_complete("location")
+    resumed = drain_job_loader(JobLoader(database_path, "location",
+                                         job_index.resume_points["location"], page_size=10))
+    for kind, value in resumed:
+        if kind == "pages":
+            job_index.add_pages(*value)
+    assert len(job_index) == 96 and job_index.is_complete("location")
+    assert len(job_index.page_keys["location"]) == 10
+    assert [job_index.row(position) for position in range(96)] == \
+        sorted(job_rows, key=lambda row: (row[2] or "", row[0]), reverse=True)
+
+    # Toggling back reuses the page keys of the sort order
+    job_index.sort("name")
+    assert len(job_index) == 96
+    assert job_index.job_id(0) == "95"
+
+    with pytest.raises(ValueError):
+        job_index.sort("salary")
+
+    database_connection.close()
+
+
+def test_job_loader(tmp_path):
+    """
+    Tests that JobLoader finds every page on its own thread, a few pages per
+    message, resumes from a page key, stops when asked to even if nothing
+    drains its queue, and reports database errors instead of raising them.
+
+    :param tmp_path: A temporary directory provided by pytest
+    """
+    database_path = str(tmp_path / "test_database.db")
+    create_database(database_path, with_indexes=True)
+    database_connection = sqlite3.connect(database_path)
+    database_connection.executemany(
+        "INSERT INTO job_listings (id, title, location) VALUES (?, ?, 'Boston, MA')",
+        [(f"{index:03d}", f"Title {index:03d}") for index in range(250)])
+    database_connection.commit()
+    database_connection.close()
+
+    messages = drain_job_loader(JobLoader(database_path, page_size=10))
+    assert messages[0] == ("total", 250)
+    pages = [value for kind, value in messages if kind == "pages"]
+    assert [len(page_keys) for _, page_keys, _, _ in pages] == [10, 10, 5]
+    assert [row_count for _, _, row_count, _ in pages] == [100, 200, 250]
+    assert pages[0][1][:2] == [None, ("Title 009", "009")]
+    assert pages[0][3] == ("Title 099", "099") and pages[-1][3] is None
+
+    messages = drain_job_loader(JobLoader(database_path, start=(pages[1][3], 200),
+                                          page_size=10))
+    assert messages[1] == ("pages", ("name", [("Title 199", "199"), ("Title 209", "209"),
+                                              ("Title 219", "219"), ("Title 229", "229"),
+                                              ("Title 239", "239")], 250, None))
+
+    # A loader whose queue is never drained still stops
+    loader = JobLoader(database_path, page_size=1)
+    loader.start()
+    while not loader.messages.full():
+        loader.join(timeout=0.01)
+    loader.stop()
+    loader.join(timeout=5)
+    assert not loader.is_alive()
+
+    loader = JobLoader(str(tmp_path / "missing" / "test_database.db"))
+    loader.run()
+    assert loader.messages.get_nowait()[0] == "error"